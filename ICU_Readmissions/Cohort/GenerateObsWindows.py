@@ -2,63 +2,69 @@
 """
 Created on Tue Dec  8 14:27:03 2020
 
-This code requires the output of FinalDataset121020.py. 
+This code requires the output of one of the FinalDataset*.py scripts, saved
+as ICU_readmissions_dataset.csv.
 
 Then generates observation windows based on the length of observation window
 defined in this script. Observation windows will go from the end of the ICU
-back the length of the window, one will cover the entire ICU stay, and finally 
-a window will be generated for each hour of the ICU stay.
+stay back the length of the window, and one will cover the entire ICU stay.
+
+Saves ICU_observation_windows.csv, one row per stay and window, with start and
+end offsets (from the start of the stay), and obs_hours (blank for the whole
+stay). It can be passed to obs_windows.filter_to_window() as the windows.
+LastLabFeatures.py takes the same obs_hours, as its windows.
+
+LOS is the length of the stay plus the stays it was deferred from, the
+cohort's chain_LOS. Cohorts built without deferral don't have chain_LOS, so
+LOS is just the stay's own.
 
 @author: Kirby
 """
 #%% Package setup.
-import pandas as pd
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
+import pandas as pd
 from time import time
+from pathlib import Path
 
-#%% Inputs
-dataset = pd.read_csv("ICU_readmissions_dataset.csv")
+file_path = Path(__file__)
+sys.path.append(str(file_path.parent.parent))
+from eicu_tables import load_table
 
-eicu_path = r"C:\Users\Kirby\OneDrive\JHU\Precision Care Medicine\eicu"
-    
-pat = pd.read_csv(eicu_path + "\\patient.csv", 
-                  usecols=['patientunitstayid', 'unitdischargeoffset'])
+#Define observation window lengths to try.
+obs_hours = [1,3,6,12,24]
 
-#%% Attach LOS as the end of each window. 
-los_dict = pat.set_index('patientunitstayid').to_dict(
-    ).get('unitdischargeoffset')
+#%% Inputs
+start = time()
+dataset = pd.read_csv(file_path.parent.joinpath(
+    "ICU_readmissions_dataset.csv"))
+pat = load_table("patient",
+                 columns=['patientunitstayid', 'unitdischargeoffset'],
+                 stay_ids=dataset['patientunitstayid'])
+los = pat.set_index('patientunitstayid')['unitdischargeoffset']
 
-#Calculate LOS for deferred stays. 
-def get_los(stay_id,orig,orig2,orig3,orig4):
-    los = 0
-    for stay in [stay_id,orig,orig2,orig3,orig4]:
-        los += los_dict.get(stay,0)
-    return los
+#%% Attach LOS as the end of each window.
+dataset['end'] = dataset['patientunitstayid'].map(los)
 
-dataset['LOS'] = dataset.apply(lambda row: get_los(
-    row['patientunitstayid'],row['original_unitstayid'],
-    row['2nd_orig_unitstayid'],row['3rd_orig_unitstayid'],
-    row['4th_orig_unitstayid']),axis=1)
+#LOS for deferred stays was added up by cohort_builder.py.
+dataset['LOS'] = dataset.get('chain_LOS', dataset['end'])
 
+#%% One set of windows per length, then the whole stay.
+windows = []
+for hours in obs_hours:
+    window = dataset[['patientunitstayid','LOS','end']].copy()
+    window['obs_hours'] = hours
+    #Windows can't start before the stay does.
+    window['start'] = (window['end'] - hours*60).clip(lower=0)
+    windows.append(window)
+whole = dataset[['patientunitstayid','LOS','end']].copy()
+whole['obs_hours'] = np.nan
+whole['start'] = 0
+windows.append(whole)
 
+windows = pd.concat(windows, ignore_index=True)
+windows = windows[['patientunitstayid','obs_hours','start','end','LOS']]
+windows.to_csv(file_path.parent.joinpath("ICU_observation_windows.csv"),
+               index=False)
 
-#Define observation window lengths to try.
-for obs_hours in [1,3,6,12,24]:
-    start = time()
-    
-    obs_minutes = obs_hours*60
-    
-    
-    
-    
-    
-    
-    # #look at dist of LOS
-    # plt.figure()
-    # plt.title('LOS < 12 hours Histogram')
-    # plt.xlabel('Hours')
-    # plt.ylabel('Stay Counts')
-    # (dataset[dataset['unitdischargeoffset']<720]['unitdischargeoffset']/60).hist()
-    
-    calc_time = time() - start
\ No newline at end of file
+calc_time = time() - start
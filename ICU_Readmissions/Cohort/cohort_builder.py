@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:00:00 2026
+
+Shared cohort building for the FinalDataset*.py scripts. Each of those was a
+copy of the same script with a few changes, now they pass their changes to
+build_cohort() as settings.
+
+Steps, in order:
+1. Drop hospital stays whose unit visit numbers aren't 1, 2, 3... in order.
+2. Find surgical stays (operative admission dx path, or S- APACHE admit dx),
+   and the first surgical ICU stay of each hospital stay (unit visits 1-4).
+3. Drop those shorter than min_los minutes.
+4. Label every ICU stay in those hospital stays against the next ICU stay in
+   the same hospital stay: readmission within readmit_window minutes, death
+   within death_window minutes, or either (bad_disch_plan).
+5. Keep the stays discharged to the floor/telemetry/SDU or home/SNF/rehab.
+   With defer, stays discharged to another ICU are followed to the ICU stay
+   that got discharged somewhere else, which is kept instead, with the IDs of
+   the stays before it in original_unitstayid, 2nd_orig_unitstayid... for
+   however many transfers there were.
+   It's dropped if any of those transfers took over max_transfer_time.
+6. Run the exclusions, in order (see exclusion_steps).
+
+The eICU tables are loaded once by load_tables(), so more than one variant
+can be built from them, in seconds each.
+
+@author: Kirby
+"""
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+file_path = Path(__file__)
+pts_path = file_path.parent.parent.joinpath('Features','PTS')
+sys.path.append(str(file_path.parent.parent))
+from eicu_tables import load_table
+
+#Defining discharge locations for each group.
+readmission_locs = ['Floor','Telemetry','Acute Care/Floor',
+                    'Step-Down Unit (SDU)']
+non_readmission_locs = ['Home','Skilled Nursing Facility','Rehabilitation',
+                        'Nursing Home']
+defer_locs = ['Other ICU','ICU','Other ICU (CABG)']
+
+#Readmissions from these admit sources get their stay dropped.
+drop_admit_sources = ['Other ICU','Direct Admit','ED']
+
+#Label columns, and the columns of IDs of stays deferred from.
+all_labels = ['readmission?','death_after_disch','bad_disch_plan']
+orig_cols = ['original_unitstayid','2nd_orig_unitstayid',
+             '3rd_orig_unitstayid','4th_orig_unitstayid']
+
+pat_columns = ['patientunitstayid','patienthealthsystemstayid',
+               'hospitaladmitoffset','hospitaladmitsource',
+               'hospitaldischargestatus','hospitaldischargeoffset',
+               'unitadmitsource','unitvisitnumber','unitstaytype',
+               'unitdischargeoffset','unitdischargelocation','unittype',
+               'uniquepid','wardid','hospitalid']
+
+
+#%% Loading tables.
+def load_tables():
+    #Everything build_cohort needs from eICU, loaded once.
+    return {'adm_dx':load_table("admissionDx",
+                                columns=['patientunitstayid','admitdxpath']),
+            'apache':load_table("apachepredvar",
+                                columns=['patientunitstayid',
+                                         'admitdiagnosis']),
+            'pat':load_table("patient", columns=pat_columns),
+            'cpg':load_table('careplangeneral',
+                             columns=['patientunitstayid','cplitemvalue'])}
+
+def pts_table(tables, name):
+    #PTS files are only read if an exclusion needs them, then kept in tables.
+    if name not in tables:
+        tables[name] = pd.read_csv(pts_path.joinpath(name))
+    return tables[name]
+
+
+#%% Stays.
+def bad_visit_numbers(pat):
+    """
+    Returns the hospital stays whose unit visit numbers, sorted, aren't
+    1, 2, 3... (missing or repeated visits).
+    """
+    visits = pat.groupby('patienthealthsystemstayid')['unitvisitnumber'].agg(
+        ['min','max','count','nunique'])
+    bad = ((visits['min'] != 1) | (visits['max'] != visits['count']) |
+           (visits['nunique'] != visits['count']))
+    return visits.index[bad]
+
+def first_surgical_stays(tables, max_visit=4):
+    """
+    Returns the patient rows of the first surgical ICU stay of each hospital
+    stay (with good visit numbers), if it's one of the first max_visit visits.
+    """
+    adm_dx = tables['adm_dx']
+    apache = tables['apache']
+    pat = tables['pat']
+
+    #Patients with operative admission diagnoses.
+    operative = adm_dx['admitdxpath'].str.contains("\\|Operative", na=False)
+    op_dx_pats = adm_dx.loc[operative, ['patientunitstayid']].drop_duplicates()
+    #Patients with S- prefixes in admit diagnosis.
+    s_pats = apache.loc[apache['admitdiagnosis'].str.contains('S-', na=False),
+                        ['patientunitstayid']]
+    surg = op_dx_pats.merge(s_pats, on='patientunitstayid', how='outer')
+    surg = surg.merge(pat, on='patientunitstayid', how='inner')
+
+    #Remove the stays that have bad unit visit number data in the hospital stay.
+    surg = surg[~surg['patienthealthsystemstayid'].isin(
+        bad_visit_numbers(pat))]
+
+    #The first surgical stay is the lowest visit number of the hospital stay.
+    first = surg.groupby('patienthealthsystemstayid')[
+        'unitvisitnumber'].transform('min')
+    return surg[(surg['unitvisitnumber'] == first) &
+                (surg['unitvisitnumber'] <= max_visit)]
+
+def label_stays(pat, hosp_stays, readmit_window=4320, death_window=4320):
+    """
+    Returns every ICU stay (not step down) of hosp_stays, in order, labeled
+    using the next stay, shifted up onto each row.
+    """
+    stays = pat[pat['patienthealthsystemstayid'].isin(hosp_stays)]
+    stays = stays.sort_values(['patienthealthsystemstayid','unitvisitnumber'],
+                              ignore_index=True)
+    #Remove unit stays that were actually SDU, not ICU.
+    stays = stays[stays['unitstaytype'] != 'stepdown/other'].copy()
+    next_stay = stays.shift(periods=-1)
+
+    #Check if there's another ICU stay in that same health system stay.
+    stays['next_healthsystemstayid_same?'] = (
+        stays['patienthealthsystemstayid'] ==
+        next_stay['patienthealthsystemstayid'])
+    #Time after hospital admit that this ICU admit and discharge occurred.
+    stays['unit_admit_offset_from_hosp_admit'] = 0 - stays['hospitaladmitoffset']
+    stays['unit_disch_offset_from_hosp_admit'] = (stays['unitdischargeoffset'] -
+                                                  stays['hospitaladmitoffset'])
+    stays['next_admit_offset_from_hosp_admit'] = \
+        stays['unit_admit_offset_from_hosp_admit'].shift(periods=-1)
+    stays['time_from_this_disch_to_next_admit'] = (
+        stays['next_admit_offset_from_hosp_admit'] -
+        stays['unit_disch_offset_from_hosp_admit'])
+    #Readmission if the next ICU admit is within the window.
+    stays['readmission?'] = (
+        stays['next_healthsystemstayid_same?'] &
+        (stays['time_from_this_disch_to_next_admit'] <= readmit_window))
+
+    #For removing some weird unit types/admit sources later on.
+    stays['next_unittype'] = next_stay['unittype']
+    stays['next_admitsource'] = next_stay['unitadmitsource']
+    stays['next_staytype'] = next_stay['unitstaytype']
+
+    #Death within the window after ICU discharge.
+    stays['hosp_disch_from_unit_disch'] = (stays['hospitaldischargeoffset'] -
+                                           stays['unitdischargeoffset'])
+    stays['death_after_disch'] = (
+        (stays['hosp_disch_from_unit_disch'] <= death_window) &
+        (stays['hospitaldischargestatus'] == 'Expired'))
+    #Label (badly planned discharge, indicated by death or readmission.)
+    stays['bad_disch_plan'] = (stays['death_after_disch'] |
+                               stays['readmission?'])
+    return stays
+
+def is_chain_col(col):
+    #Whether col is one of chain_cols(), for any length of chain.
+    return (col == orig_cols[0]) | col.endswith('_orig_unitstayid')
+
+def chain_cols(n):
+    #Names of the columns of IDs of the first n stays deferred from.
+    suffixes = {1:'st',2:'nd',3:'rd'}
+    cols = orig_cols[:n]
+    for i in range(len(orig_cols) + 1, n + 1):
+        suffix = 'th' if 10 <= i % 100 <= 20 else suffixes.get(i % 10, 'th')
+        cols.append(str(i) + suffix + '_orig_unitstayid')
+    return cols
+
+def follow_deferrals(stays, defer_ids, check_hosp_stay=True, max_hops=None):
+    """
+    Follows each stay in defer_ids to the next ICU stay, again and again while
+    those were discharged to another ICU too, however many times that takes
+    (or up to max_hops stays). Returns the rows of stays where that ended,
+    with the IDs of the stays before them in orig_cols (more of them if any
+    chain is longer, see chain_cols), and the LOS of the whole chain in
+    chain_LOS.
+    """
+    ids = stays['patientunitstayid'].to_numpy()
+    n = len(ids)
+    #Each stay's row holds the next stay's info.
+    next_stay = stays.shift(periods=-1)
+    #Deferral stays that don't have any further ICU stays in the data base.
+    #The FinalDataset scripts check the next stay's own next stay's
+    #hospital stay here, kept that way so cohorts come out the same.
+    has_next = (next_stay['patientunitstayid'].notna() &
+                (next_stay['unitvisitnumber'] != 1))
+    if check_hosp_stay:
+        has_next &= next_stay['next_healthsystemstayid_same?'] == True
+
+    #Position of each stay's next stay. Position n is a dead end, for stays
+    #without one.
+    step = np.append(np.where(has_next.to_numpy(), np.arange(1, n + 1), n), n)
+    deferred = np.append(stays['unitdischargelocation'].isin(defer_locs), False)
+    los = np.append(stays['unitdischargeoffset'].to_numpy(dtype=float), 0)
+
+    #Pointer jumping. ptr starts at the next stay, and jumps ahead to where
+    #that stay's ptr is, until it's at a stay that wasn't deferred (or a dead
+    #end). hops counts the stays from each stay up to its ptr, and chain_los
+    #adds up their LOS. Chains of any length take log2(length) rounds.
+    ptr = step.copy()
+    done = ~deferred[ptr] | (ptr == n)
+    hops = np.ones(n + 1, dtype=int)
+    chain_los = los.copy()
+    while not done.all():
+        hops = np.where(done, hops, hops + hops[ptr])
+        chain_los = np.where(done, chain_los, chain_los + chain_los[ptr])
+        done, ptr = done | done[ptr], np.where(done, ptr, ptr[ptr])
+
+    #Deferral stays, and where their chains end.
+    at = pd.Index(ids).get_indexer(defer_ids)
+    at = at[at >= 0]
+    keep = ptr[at] != n
+    if max_hops is not None:
+        keep &= hops[at] <= max_hops
+    starts = at[keep]
+    finals = stays.iloc[ptr[starts]].reset_index(drop=True)
+
+    #IDs of the stays along each chain.
+    depth = hops[starts]
+    cols = chain_cols(max(depth.max(initial=0), len(orig_cols)))
+    chain_ids = np.append(ids.astype(float), np.nan)
+    at = starts
+    for i, col in enumerate(cols):
+        finals[col] = np.where(i < depth, chain_ids[at], np.nan)
+        at = step[at]
+    finals[cols[0]] = finals[cols[0]].astype('int64')
+    finals['chain_LOS'] = chain_los[starts] + los[ptr[starts]]
+    return finals
+
+
+#%% Exclusions. Each takes the cohort, the labeled stays and the tables, and
+#returns the cohort without the excluded stays.
+def exclude_cmo(cohort, stays, tables):
+    #Remove CMO or augmentation of care folks, we expect them to die.
+    cpg = tables['cpg']
+    cmo = cpg.loc[cpg['cplitemvalue'].isin(['Comfort measures only',
+                                            'No augmentation of care']),
+                  'patientunitstayid']
+    return cohort[~cohort['patientunitstayid'].isin(cmo)]
+
+def exclude_dnr_deaths(cohort, stays, tables):
+    #Remove DNR/no CPR folks who died after ICU discharge within the window.
+    cpg = tables['cpg']
+    dnr = cpg.loc[cpg['cplitemvalue'].isin(['Do not resuscitate','No CPR']),
+                  'patientunitstayid']
+    dead = cohort['patientunitstayid'].map(
+        stays.set_index('patientunitstayid')['death_after_disch']) == True
+    return cohort[~(cohort['patientunitstayid'].isin(dnr) & dead)]
+
+def readmitted(cohort, stays):
+    #Labeled stays of the cohort that had readmissions.
+    readmits = stays[stays['patientunitstayid'].isin(
+        cohort['patientunitstayid'])]
+    return readmits[readmits['readmission?'] == True]
+
+def exclude_zero_readmit_time(cohort, stays, tables):
+    #Remove those with 0 time from discharge to readmission.
+    readmits = readmitted(cohort, stays)
+    zero_times = readmits.loc[
+        readmits['time_from_this_disch_to_next_admit'] == 0,
+        'patientunitstayid']
+    return cohort[~cohort['patientunitstayid'].isin(zero_times)]
+
+def exclude_readmit_admit_source(cohort, stays, tables):
+    #Drop where readmissions had admit source of ED, other ICU, or Direct Admit.
+    readmits = readmitted(cohort, stays)
+    dropped = readmits.loc[readmits['next_admitsource'].isin(
+        drop_admit_sources), 'patientunitstayid']
+    return cohort[~cohort['patientunitstayid'].isin(dropped)]
+
+def exclude_missing_pts(cohort, stays, tables):
+    #Remove stays that were missing any PTS signals.
+    for col in ['systolic','diastolic','mean']:
+        #Invasive or non invasive BP data counts.
+        has_data = []
+        for source in ['systemic','noninvasive']:
+            data = pts_table(tables, 'all_pre-processed_' + source + col +
+                             '.csv')
+            has_data.append(data.loc[data.notna().all(axis=1),
+                                     'patientunitstayid'])
+        cohort = cohort[cohort['patientunitstayid'].isin(
+            pd.concat(has_data))]
+    for col in ['sao2','heartrate','respiration']:
+        data = pts_table(tables, 'all_pre-processed_' + col + '.csv')
+        cohort = cohort[cohort['patientunitstayid'].isin(
+            data.loc[data.notna().all(axis=1), 'patientunitstayid'])]
+    return cohort
+
+def exclude_low_pts_coverage(cohort, stays, tables):
+    #Remove patients with less than 50% coverage of their LOS or last 24h for
+    #each PTS signal.
+    for name in ['PTS_proportion_covered_whole_stay.csv',
+                 'PTS_proportion_covered_24h.csv']:
+        props = pts_table(tables, name)
+        covered = props.loc[(props.iloc[:,1:7] > 0.5).all(axis=1),
+                            'patientunitstayid']
+        cohort = cohort[cohort['patientunitstayid'].isin(covered)]
+    return cohort
+
+exclusion_steps = {'cmo':exclude_cmo,
+                   'dnr_deaths':exclude_dnr_deaths,
+                   'zero_readmit_time':exclude_zero_readmit_time,
+                   'readmit_admit_source':exclude_readmit_admit_source,
+                   'missing_pts':exclude_missing_pts,
+                   'low_pts_coverage':exclude_low_pts_coverage}
+
+def register_exclusion(name, step):
+    #Add another exclusion. step takes the cohort, the labeled stays and the
+    #tables, and returns the cohort without the excluded stays.
+    exclusion_steps[name] = step
+
+
+#%% Building cohorts.
+def build_cohort(tables, min_los=120, readmit_window=4320, death_window=4320,
+                 labels=('readmission?',), defer=False, check_hosp_stay=True,
+                 max_transfer_time=180,
+                 exclusions=('zero_readmit_time','readmit_admit_source'),
+                 int_labels=True):
+    """
+    Returns the cohort, sorted by stay, and every labeled ICU stay of its
+    hospital stays. The cohort has patientunitstayid and labels, and
+    with defer, the chain of stays deferred from and chain_LOS, the LOS of
+    the stay plus those (see follow_deferrals).
+    min_los, readmit_window, death_window and max_transfer_time are minutes.
+    check_hosp_stay - also drop deferred stays without a next stay in the
+        same hospital stay, like FinalDataset121020.py.
+    exclusions - names in exclusion_steps, run in order.
+    int_labels - labels as 1/0 instead of True/False. FinalDataset112520.py
+        never made them ints.
+    """
+    labels = list(labels)
+    first_stays = first_surgical_stays(tables)
+    #Remove stays that were too short.
+    first_stays = first_stays[first_stays['unitdischargeoffset'] >= min_los]
+    stays = label_stays(tables['pat'],
+                        first_stays['patienthealthsystemstayid'],
+                        readmit_window, death_window)
+
+    #Stays discharged to places readmissions are looked for.
+    locs = first_stays['unitdischargelocation']
+    cohort = first_stays.loc[locs.isin(readmission_locs + non_readmission_locs),
+                             ['patientunitstayid']]
+    cohort = cohort.merge(stays[['patientunitstayid'] + labels],
+                          on='patientunitstayid', how='inner')
+
+    if defer:
+        finals = follow_deferrals(
+            stays, first_stays.loc[locs.isin(defer_locs),'patientunitstayid'],
+            check_hosp_stay)
+        #Only keep the stays where lateral transfer times were short enough.
+        gaps = stays.set_index('patientunitstayid')[
+            'time_from_this_disch_to_next_admit']
+        chain = [col for col in finals.columns if is_chain_col(col)]
+        for col in chain:
+            finals = finals[~(finals[col].map(gaps) > max_transfer_time)]
+        finals = finals[finals['unitdischargelocation'].isin(
+            readmission_locs + non_readmission_locs)]
+        cohort = pd.concat([cohort, finals[['patientunitstayid'] + labels +
+                                           chain + ['chain_LOS']]],
+                           ignore_index=True)
+        #Stays that weren't deferred are their own chain.
+        cohort['chain_LOS'] = cohort['chain_LOS'].fillna(
+            cohort['patientunitstayid'].map(
+                stays.set_index('patientunitstayid')['unitdischargeoffset']))
+
+    for name in exclusions:
+        cohort = exclusion_steps[name](cohort, stays, tables)
+
+    cohort = cohort.sort_values('patientunitstayid', ignore_index=True)
+    #Make label columns ints.
+    if int_labels:
+        for col in labels:
+            cohort[col] = cohort[col].astype(int)
+    return cohort, stays
+
+def readmission_summary(cohort, stays):
+    """
+    Returns counts (and proportions) of the discharge location, next admit
+    source, and next stay type of the cohort's readmissions.
+    """
+    readmits = readmitted(cohort, stays)
+    summaries = []
+    for col in ['unitdischargelocation','next_admitsource','next_staytype']:
+        summary = readmits[['patientunitstayid',col]].groupby(col).count()
+        summary['prop'] = np.round(summary['patientunitstayid']/
+                                   summary['patientunitstayid'].sum(),3)
+        summaries.append(summary.sort_values('patientunitstayid',
+                                             ascending=False))
+    return summaries
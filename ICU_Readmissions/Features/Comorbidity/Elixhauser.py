@@ -17,6 +17,7 @@ Runtime: 45 seconds.
 """
 def full_script():
     #%% Import packages.
+    import sys
     import numpy as np
     import pandas as pd
     #import multiprocessing as mp
@@ -30,14 +31,17 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
     
     #%% Load in and prepare relevant data.
     
     ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=ids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     ids = ids.merge(pat,on='patientunitstayid',how='left')
@@ -45,10 +49,11 @@ def full_script():
     ids['start'] = 0
     
     #Get diagnosis data. 
-    diag = pd.read_csv(eicu_path.joinpath("diagnosis.csv"),
-                       usecols=['diagnosisid','patientunitstayid', 
-                                'diagnosisoffset', 'icd9code',
-                                'activeupondischarge'])
+    diag = load_table("diagnosis",
+                      columns=['diagnosisid','patientunitstayid', 
+                               'diagnosisoffset', 'icd9code',
+                               'activeupondischarge'],
+                      stay_ids=ids['patientunitstayid'])
     
     #%%Filter diagnosis data.
     
@@ -13,6 +13,7 @@ Runtime: 30 seconds
 def full_script():
 
     #%% Import packages.
+    import sys
     import numpy as np
     import pandas as pd
     import os
@@ -23,6 +24,10 @@ def full_script():
     start = time()
     filepath = Path(__file__)
     eicu_path = filepath.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(filepath.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(filepath.parent.parent))
+    from obs_windows import filter_to_window
     cohort_path = filepath.parent.parent.parent.joinpath('Cohort')
     
     #%% Load in data. 
@@ -30,24 +35,28 @@ def full_script():
     ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=ids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     ids = ids.merge(pat,on='patientunitstayid',how='left')
     ids.rename(columns={'unitdischargeoffset':'end'},inplace=True)
     ids['start'] = 0
     
-    cpl = pd.read_csv(eicu_path.joinpath('CarePlanGeneral.csv'),
-                      usecols=['patientunitstayid','cplitemoffset',
-                               'cplitemvalue'])
+    cpl = load_table('CarePlanGeneral',
+                     columns=['patientunitstayid','cplitemoffset',
+                              'cplitemvalue'],
+                     stay_ids=ids['patientunitstayid'])
     
-    apache = pd.read_csv(eicu_path.joinpath('ApacheApsVar.csv'),
-                         usecols=['patientunitstayid','dialysis'])
+    apache = load_table('ApacheApsVar',
+                        columns=['patientunitstayid','dialysis'],
+                        stay_ids=ids['patientunitstayid'])
     
-    treat = pd.read_csv(eicu_path.joinpath('Treatment.csv'),
-                        usecols=['patientunitstayid', 'treatmentoffset',
-                                 'treatmentstring'])
+    treat = load_table('Treatment',
+                       columns=['patientunitstayid', 'treatmentoffset',
+                                'treatmentstring'],
+                       stay_ids=ids['patientunitstayid'])
     
     #%% Filter out irrelevant rows.
     
@@ -58,21 +67,8 @@ def full_script():
         data.drop(drop_index, inplace=True)
     
     #Drop data after the observation window for each patient. 
-    lookup = ids.set_index('patientunitstayid')
-    def keep_row(current_ID,offset):
-        #Get window time stamps.
-        window_start = lookup.loc[current_ID,'start']
-        window_end = lookup.loc[current_ID,'end']
-        #If the dialysis took place before/in window, keep it. 
-        if (offset <= window_end):
-            return 1
-        else:
-            return 0
-    
     #Drop cpl data outside desired time frame. 
-    cpl['keep'] = cpl.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['cplitemoffset']),axis=1)
-    cpl = cpl[cpl['keep']==1]
+    cpl = filter_to_window(cpl,ids,'cplitemoffset')
     cpl = cpl[cpl['cplitemvalue']=='Dialysis']
     dialysis = cpl['patientunitstayid']
     
@@ -81,9 +77,7 @@ def full_script():
                                ignore_index=True)
     
     #Drop treat data outside desired time frame. 
-    treat['keep'] = treat.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['treatmentoffset']),axis=1)
-    treat = treat[treat['keep']==1]
+    treat = filter_to_window(treat,ids,'treatmentoffset')
     treat = treat[treat['treatmentstring'].str.contains('dialysis')]
     dialysis = dialysis.append(treat['patientunitstayid'],
                                ignore_index=True)
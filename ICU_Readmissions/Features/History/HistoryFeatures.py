@@ -12,6 +12,7 @@ runtime: 2 seconds.
 
 def full_script():
     #%%
+    import sys
     import numpy as np
     import pandas as pd
     from pathlib import Path
@@ -22,6 +23,8 @@ def full_script():
     filepath = Path(__file__)
     dataset_path = filepath.parent.parent.parent.joinpath('Cohort')
     eicu_path = filepath.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(filepath.parent.parent.parent))
+    from eicu_tables import load_table
     
     #%% read in lists of history paths, and names of lists
     paths = pd.read_csv("HistoryFeatureLists.csv")
@@ -31,12 +34,13 @@ def full_script():
     nameslist = names.values.astype(str).tolist()
     nameslist = [item for sublist in nameslist for item in sublist]
     
-    # import in all history data
-    hist = pd.read_csv(eicu_path.joinpath("pastHistory.csv"),
-                       usecols=['patientunitstayid','pasthistorypath'])
+    # import in history data for our stays
+    comp = pd.read_csv(dataset_path.joinpath('ICU_readmissions_dataset.csv'))
+    hist = load_table("pastHistory",
+                      columns=['patientunitstayid','pasthistorypath'],
+                      stay_ids=comp['patientunitstayid'])
     
     # only keep data with relevant patient unit stay ids
-    comp = pd.read_csv(dataset_path.joinpath('ICU_readmissions_dataset.csv'))
     compHist = hist[hist['patientunitstayid'].isin(comp['patientunitstayid'])]
     
     # for each path list, check if there are rows for it. If there are, mark it as such. 
@@ -13,6 +13,7 @@ Runtime: 1 minute.
 def full_script():
 
     #%% Import packages.
+    import sys
     import numpy as np
     import pandas as pd
     import os
@@ -23,6 +24,10 @@ def full_script():
     start = time()
     filepath = Path(__file__)
     eicu_path = filepath.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(filepath.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(filepath.parent.parent))
+    from obs_windows import filter_to_window
     cohort_path = filepath.parent.parent.parent.joinpath('Cohort')
     
     #%% Load data 
@@ -30,22 +35,25 @@ def full_script():
     ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=ids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     ids = ids.merge(pat,on='patientunitstayid',how='left')
     ids.rename(columns={'unitdischargeoffset':'end'},inplace=True)
     ids['start'] = 0
     
-    io = pd.read_csv(eicu_path.joinpath('IntakeOutput.csv'),
-                     usecols=['patientunitstayid', 'intakeoutputoffset',
-                              'intaketotal','outputtotal','nettotal',
-                              'cellpath', 'cellvaluenumeric'])
+    io = load_table('IntakeOutput',
+                    columns=['patientunitstayid', 'intakeoutputoffset',
+                             'intaketotal','outputtotal','nettotal',
+                             'cellpath', 'cellvaluenumeric'],
+                    stay_ids=ids['patientunitstayid'])
     
-    treat = pd.read_csv(eicu_path.joinpath('treatment.csv'),
-                     usecols=['patientunitstayid', 'treatmentoffset',
-                              'treatmentstring'])
+    treat = load_table('treatment',
+                    columns=['patientunitstayid', 'treatmentoffset',
+                             'treatmentstring'],
+                    stay_ids=ids['patientunitstayid'])
     
     #%% Filter data.
     for data in [io,treat]:
@@ -55,24 +63,8 @@ def full_script():
                   inplace=True)
         
     #Drop data after the observation window for each patient. 
-    lookup = ids.set_index('patientunitstayid')
-    def keep_row(current_ID,offset):
-        #Get window time stamps.
-        window_start = lookup.loc[current_ID,'start']
-        window_end = lookup.loc[current_ID,'end']
-        #If the surgery took place before/in window, keep it. 
-        if (offset <= window_end):
-            return 1
-        else:
-            return 0
-    
-    io['keep'] = io.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['intakeoutputoffset']),axis=1)
-    io = io[io['keep']==1]
-    
-    treat['keep'] = treat.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['treatmentoffset']),axis=1)
-    treat = treat[treat['keep']==1]
+    io = filter_to_window(io,ids,'intakeoutputoffset')
+    treat = filter_to_window(treat,ids,'treatmentoffset')
     
     #%% Total intake, output, and net. 
     #Commented out, because the data's clearly wrong per Dr. Stevens. 
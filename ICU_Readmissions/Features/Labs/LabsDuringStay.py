@@ -5,65 +5,142 @@ Created on Wed Mar  4 10:25:04 2020
 Pulls the labs that occurred during the stay only. Sorts them by patientstayid
 and offset. Called by AllLabsDuringStay.py
 
-Runtime: 30 seconds a loop.
+partition_labs() goes through the lab table once for every lab at the same
+time, and saves them as a parquet dataset in AllLabsDuringStay/labs,
+partitioned by a hash of the labname (lab names like "alkaline phos." don't
+make safe folder names on Windows). Feature code gets them back out with
+load_labs().
+
+Runtime: one pass over the cohort's rows of the lab table, a few minutes.
 
 @author: Kirby
 """
+import sys
+import shutil
+import hashlib
+import pandas as pd
+from pathlib import Path
 
-def labs_before_delirium(lab_name):
-    #%% Package setup. 
-    import numpy as np
-    import pandas as pd
-    from time import time
-    from pathlib import Path
-    
-    start = time()
-    
-    file_path = Path(__file__)
-    cohort_path = file_path.parent.parent.parent.joinpath("Cohort")
-    eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
-    
-    #%%Pulls list of Stay IDs.
+file_path = Path(__file__)
+cohort_path = file_path.parent.parent.parent.joinpath("Cohort")
+labs_path = file_path.parent.joinpath("AllLabsDuringStay","labs")
+sys.path.append(str(file_path.parent.parent.parent))
+from eicu_tables import load_table, iter_table, clean_stay_ids
+
+#Columns kept for each lab.
+lab_columns = ['patientunitstayid','labresultoffset','labname','labresult']
+
+
+#%% Pulling labs during stays.
+def lab_key(lab_name):
+    #Folder safe partition key for a lab name.
+    return hashlib.md5(str(lab_name).encode()).hexdigest()[:8]
+
+def cohort_stays():
+    #Stay IDs of the cohort, and the earlier stays they're readmissions of.
     comp = pd.read_csv(cohort_path.joinpath("ICU_readmissions_dataset.csv"))
-    all_ids = comp['patientunitstayid'
-                   ].append(comp['original_unitstayid']
-                        ).append(comp['2nd_orig_unitstayid']
-                                 ).append(comp['3rd_orig_unitstayid']
-                                          ).append(comp['4th_orig_unitstayid'])
-    all_ids = all_ids.dropna().drop_duplicates()                                      
-    
-    #Get dict of LOS for each stay.
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"), 
-                  usecols=['patientunitstayid', 'unitdischargeoffset'])
-    # Pull stay LOS for each stay. 
-    los_dict = pat.set_index('patientunitstayid').to_dict(
-        ).get('unitdischargeoffset')
-
-    #Pulls all lab info and drop columns we don't need.
-    lab = pd.read_csv(eicu_path.joinpath("lab.csv"),
-                      usecols=['patientunitstayid','labresultoffset',
-                               'labname','labresult'])
-    
-    #Only keeps the lab we want.
-    lab = lab[lab['labname']==lab_name]
-    #Only keeps the patient stays we want.
-    lab = lab[lab['patientunitstayid'].isin(all_ids)]
-    #Adds delirium start time info to each row.
-    lab['LOS'] = lab['patientunitstayid'].apply(los_dict.get)
-    #If they occurred before the ICU stay remove them.
-    lab = lab[lab['labresultoffset'] >= 0]
-    #Only keep labs that happened during the ICU stay. 
-    lab = lab[lab['labresultoffset'] < lab['LOS']]
-    lab.sort_values(by=['patientunitstayid','labresultoffset'],inplace=True)
-    
-    calc_time = time() - start
+    #However many original_unitstayid, 2nd_orig_unitstayid... columns.
+    cols = ['patientunitstayid'] + [
+        col for col in comp.columns if (col == 'original_unitstayid') |
+        col.endswith('_orig_unitstayid')]
+    return clean_stay_ids(pd.concat([comp[col] for col in cols]))
+
+def stay_los(all_ids):
+    #LOS of each stay, indexed by stay ID.
+    pat = load_table("patient",
+                     columns=['patientunitstayid','unitdischargeoffset'],
+                     stay_ids=all_ids)
+    return pat.set_index('patientunitstayid')['unitdischargeoffset']
+
+def during_stay(lab, los):
+    #Only keeps labs that happened during the ICU stay, not before it.
+    lab_los = lab['patientunitstayid'].map(los)
+    return lab[(lab['labresultoffset'] >= 0) &
+               (lab['labresultoffset'] < lab_los)]
+
+def labs_before_delirium(lab_name):
+    """
+    Returns the labs named lab_name during the cohort's stays.
+    """
+    all_ids = cohort_stays()
+    lab = load_table("lab", columns=lab_columns, stay_ids=all_ids,
+                     filters=[('labname','==',lab_name)])
+    lab = during_stay(lab, stay_los(all_ids))
+    return lab.sort_values(by=['patientunitstayid','labresultoffset'])
+
+def partition_labs(lab_names, combined=None, out_path=labs_path):
+    """
+    Reads the lab table once, keeps the labs in lab_names during the cohort's
+    stays, and saves them to out_path partitioned by labname.
+    combined - dict of new lab name to the labs in lab_names that get saved
+        under it too (like bicarbonate, HCO3 and Total CO2).
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    all_ids = cohort_stays()
+    los = stay_los(all_ids)
+    keep = []
+    for chunk in iter_table("lab", columns=lab_columns, stay_ids=all_ids):
+        chunk = chunk[chunk['labname'].isin(lab_names)]
+        keep.append(during_stay(chunk, los))
+    lab = pd.concat(keep, ignore_index=True)
+
+    if combined is not None:
+        extra = []
+        for new_name, names in combined.items():
+            extra.append(lab[lab['labname'].isin(names)].assign(
+                labname=new_name))
+        lab = pd.concat([lab] + extra, ignore_index=True)
+    lab = lab.sort_values(by=['labname','patientunitstayid','labresultoffset'],
+                          kind='stable', ignore_index=True)
+    lab['lab_key'] = lab['labname'].map(
+        {name:lab_key(name) for name in lab['labname'].unique()})
+
+    #Start clean, so labs from an earlier run don't linger.
+    if out_path.exists():
+        shutil.rmtree(out_path)
+    table = pa.Table.from_pandas(lab[lab_columns + ['lab_key']],
+                                 preserve_index=False)
+    table = table.cast(pa.schema([('patientunitstayid', pa.int64()),
+                                  ('labresultoffset', pa.int64()),
+                                  ('labname', pa.string()),
+                                  ('labresult', pa.float64()),
+                                  ('lab_key', pa.string())]))
+    ds.write_dataset(table, out_path, format='parquet',
+                     partitioning=ds.partitioning(
+                         pa.schema([('lab_key', pa.string())]),
+                         flavor='hive'),
+                     max_partitions=lab['lab_key'].nunique() + 1)
+    return out_path
+
+def load_labs(lab_name, columns=None, stay_ids=None, out_path=labs_path):
+    """
+    Loads a lab (or a list of them) saved by partition_labs, sorted by stay
+    and offset.
+    """
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(out_path, format='parquet', partitioning='hive')
+    names = [lab_name] if isinstance(lab_name, str) else list(lab_name)
+    #The key picks the partitions, the name rules out hash collisions.
+    expr = (ds.field('lab_key').isin([lab_key(name) for name in names]) &
+            ds.field('labname').isin(names))
+    if columns is None:
+        columns = lab_columns
+    if stay_ids is not None:
+        expr = expr & ds.field('patientunitstayid').isin(
+            clean_stay_ids(stay_ids))
+    lab = dataset.to_table(columns=columns, filter=expr).to_pandas()
+    if 'labname' in lab.columns:
+        lab['labname'] = lab['labname'].astype(str)
+    if {'patientunitstayid','labresultoffset'}.issubset(lab.columns):
+        lab = lab.sort_values(['patientunitstayid','labresultoffset'],
+                              kind='stable', ignore_index=True)
     return lab
 
 if __name__ == '__main__':
-    #Change out this name for different labs. 
+    #Change out this name for different labs.
     #String for lab_name must exactly match the labname used in the Lab table of eICU.
-    from pathlib import Path
     lab_name = 'BUN'
-    file_path = Path(__file__)
     test = labs_before_delirium(lab_name)
     test.to_csv(file_path.parent.joinpath("AllLabsDuringStay",lab_name + ".csv"),index=False)
@@ -4,21 +4,137 @@ Created on Wed Mar 11 19:57:28 2020
 
 #This pulls the value the last lab for each patient stay.
 #Must be run after AllLabsDuringStay.py
+
+Features (last, mean, min, max, count, diff, dist, dist2, reversion) can be
+made for the whole stay, and/or for windows of the last N hours before
+discharge (like the ones in Cohort/GenerateObsWindows.py). Window features get
+_<N>h added to their names. All the windows come out of one sorted pass over
+the labs: each window is the end of its lab's rows for the stay, found with
+searchsorted, and its stats are read off running sums and counts from the end
+of the stay, instead of filtering the labs again for every window.
  
-Run time: 10 min
+Run time: under a minute.
 
 @author: Kirby
 """
-def full_script():
+stat_names = ['last','mean','min','max','count','diff','dist','dist2',
+              'reversion']
+
+def lab_stats(labs, lab_list, norms, los=None, windows=(None,)):
+    """
+    Returns one row per stay (indexed by patientunitstayid), with a column
+    for each stat of each lab in lab_list, for each window.
+    labs - patientunitstayid, labresultoffset, labname, labresult.
+    norms - dict of lab name to its normal value.
+    los - Series of unit discharge offset, indexed by stay. Needed for windows.
+    windows - hours before discharge, None is the whole stay.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    #In order by lab, patientstayid and offset, so each lab of each stay is
+    #one run of rows (a group), in time order.
+    labs = labs.sort_values(['labname','patientunitstayid','labresultoffset'],
+                            kind='stable',ignore_index=True)
+    keys = labs[['labname','patientunitstayid']]
+    new_group = (keys != keys.shift()).any(axis=1).to_numpy()
+    group = np.cumsum(new_group) - 1
+    starts = np.flatnonzero(new_group)
+    ends = np.append(starts[1:], len(labs))
+    groups = keys.iloc[starts].reset_index(drop=True)
+    
+    value = labs['labresult'].to_numpy(dtype=float)
+    offset = labs['labresultoffset'].to_numpy(dtype=float)
+    valid = ~np.isnan(value)
+    rows = np.arange(len(labs))
+    
+    #Running sums and counts, stats of rows i to j are the difference.
+    sums = np.concatenate([[0], np.cumsum(np.where(valid, value, 0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    #Min and max from each row to the end of its group.
+    rev_group = group[::-1]
+    suffix_min = pd.Series(np.where(valid, value, np.inf)[::-1]).groupby(
+        rev_group).cummin().to_numpy()[::-1]
+    suffix_max = pd.Series(np.where(valid, value, -np.inf)[::-1]).groupby(
+        rev_group).cummax().to_numpy()[::-1]
+    #Last non-missing lab of each group.
+    last_row = np.maximum.accumulate(np.where(valid, rows, -1))[ends - 1]
+    #Difference of each lab and the one before it, and the last one that
+    #isn't missing in each group.
+    diff = np.diff(value, prepend=np.nan)
+    diff_valid = ~np.isnan(diff) & ~new_group
+    diff_row = np.maximum.accumulate(np.where(diff_valid, rows, -1))[ends - 1]
+    
+    #Sort key that's increasing across groups, to searchsorted all of them
+    #at once.
+    if len(labs) > 0:
+        low = np.nanmin(offset)
+        span = np.nanmax(offset) - low + 2
+    else:
+        low, span = 0, 1
+    key = group*span + (offset - low)
+    
+    all_stats = []
+    for hours in windows:
+        #First row in each group's window.
+        if hours is None:
+            first = starts
+            suffix = ''
+        else:
+            window_start = (groups['patientunitstayid'].map(los).to_numpy(
+                dtype=float) - hours*60 - low)
+            window_start = np.clip(window_start, 0, span - 1)
+            first = np.searchsorted(key, np.arange(len(starts))*span +
+                                    window_start, side='left')
+            #Stays without a discharge offset get empty windows.
+            first = np.where(np.isnan(window_start), ends, first)
+            suffix = '_' + str(hours) + 'h'
+        has_rows = first < ends
+        safe_first = np.minimum(first, max(len(labs) - 1, 0))
+        count = counts[ends] - counts[first]
+        
+        stats = groups.copy()
+        stats['last'] = np.where(last_row >= first,
+                                 value[np.maximum(last_row, 0)], np.nan)
+        stats['mean'] = np.where(count > 0,
+                                 (sums[ends] - sums[first])/np.maximum(count,1),
+                                 np.nan)
+        stats['min'] = np.where(count > 0, suffix_min[safe_first], np.nan)
+        stats['max'] = np.where(count > 0, suffix_max[safe_first], np.nan)
+        stats['count'] = np.where(has_rows, count, np.nan)
+        stats['diff'] = np.where(diff_row > first,
+                                 diff[np.maximum(diff_row, 0)], np.nan)
+        #Get last distance from normal, using the normal value of each lab.
+        norm = stats['labname'].map(norms).to_numpy(dtype=float)
+        stats['dist'] = stats['last'] - norm
+        #Also square it.
+        stats['dist2'] = stats['dist']**2
+        #Get reversion factor (diff)(normal - last lab) 
+        stats['reversion'] = stats['diff'] * -1 * stats['dist']
+        
+        #Groups with no rows in the window are left out, like stays without
+        #a lab.
+        stats = stats[has_rows].set_index(['labname','patientunitstayid'])
+        wide = stats.unstack('labname')
+        wide = wide.reindex(columns=pd.MultiIndex.from_tuples(
+            [(stat, lab_name) for lab_name in lab_list
+             for stat in stat_names]))
+        wide.columns = [stat + '_' + lab_name + suffix
+                        for stat, lab_name in wide.columns]
+        all_stats.append(wide)
+    return pd.concat(all_stats, axis=1)
+
+def full_script(windows=(None,), out_file='lab_feature_data.csv'):
+    #windows - hours before discharge, None is the whole stay.
 
     #%% Package setup
     import numpy as np
     import pandas as pd
-    import os
     #import multiprocessing as mp
     from time import time
     import statistics as stat
     from pathlib import Path
+    from LabsDuringStay import load_labs, stay_los
     
     start = time()
     
@@ -43,76 +159,23 @@ def full_script():
     norms = norms.to_dict().get('Normal Value')
     
     
-    #%% Receive a lab name to look for.
-    for lab_name in lab_list:
-        
-        #%% Pulls list of Stay IDs and offsets we care about.
-        ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
-        
-        #Load the list of the relevant labs
-        script_dir = os.path.dirname(__file__)
-        folder = "AllLabsDuringStay"
-        full_file_path = os.path.join(script_dir,folder,lab_name+".csv")
-        labs = pd.read_csv(full_file_path,usecols=['patientunitstayid',
-                                                   'labresultoffset','labresult'])
-        #Filter out labs from patients I don't care about.
-        labs = labs[labs['patientunitstayid'].isin(ids['patientunitstayid'])]
-        
-        #Make sure all the data's in order by patientstayid and offset.
-        labs.sort_values(['patientunitstayid','labresultoffset'],inplace=True)
-        
-        #%% Get features.
-        #Get the last lab for each patientstayid. 
-        last_labs = labs.groupby('patientunitstayid').last().reset_index(drop=False)
-        last_labs.rename(columns={'labresult':'last_'+lab_name},inplace=True)
-        ids = ids.merge(last_labs,how='left',on='patientunitstayid')
-        
-        #Get mean, min, max, count.
-        mean_labs = labs.groupby('patientunitstayid').mean().reset_index(drop=False)
-        mean_labs.rename(columns={'labresult':'mean_'+lab_name},inplace=True)
-        ids = ids.merge(mean_labs,how='left',on='patientunitstayid')
-        
-        min_labs = labs.groupby('patientunitstayid').min().reset_index(drop=False)
-        min_labs.rename(columns={'labresult':'min_'+lab_name},inplace=True)
-        ids = ids.merge(min_labs,how='left',on='patientunitstayid')
-        
-        max_labs = labs.groupby('patientunitstayid').max().reset_index(drop=False)
-        max_labs.rename(columns={'labresult':'max_'+lab_name},inplace=True)
-        ids = ids.merge(max_labs,how='left',on='patientunitstayid')
-        
-        count_labs = labs.groupby('patientunitstayid').count().reset_index(drop=False)
-        count_labs.rename(columns={'labresult':'count_'+lab_name},inplace=True)
-        ids = ids.merge(count_labs,how='left',on='patientunitstayid')
-        
-        #Get difference of last and second to last lab. 
-        labs['diff'] = labs.groupby('patientunitstayid').diff()['labresult']
-        diff_labs = labs.groupby('patientunitstayid').last().reset_index(drop=False)
-        diff_labs.rename(columns={'diff':'diff_'+lab_name},inplace=True)
-        ids = ids.merge(diff_labs,how='left',on='patientunitstayid')
-        
-        #Get normal value for this lab.
-        norm = norms.get(lab_name)
-        
-        #Get last distance from normal.
-        ids['dist_' + lab_name] = ids['last_' + lab_name] - norm
-        
-        #Also square it.
-        ids['dist2_' + lab_name] = ids['dist_' + lab_name]**2
-        
-        #Get reversion factor (diff)(normal - last lab) 
-        ids['reversion_' + lab_name] = (ids['diff_' + lab_name] * -1 * 
-                                        ids['dist_' + lab_name])
-        
-        #Only keep the columns I care about for the model.
-        ids = ids[['patientunitstayid','last_'+lab_name,'mean_'+lab_name,
-                   'min_'+lab_name,'max_'+lab_name,'count_'+lab_name,
-                   'diff_'+lab_name,'dist_' + lab_name,'dist2_' + lab_name,
-                   'reversion_' + lab_name]]
-        
-        comp = comp.merge(ids,on='patientunitstayid',how='inner')
+    #%% Load every lab at once.
+    labs = load_labs(lab_list,columns=['patientunitstayid','labresultoffset',
+                                       'labname','labresult'],
+                     stay_ids=comp['patientunitstayid'])
+    
+    #Discharge offsets, for the windows.
+    los = None
+    if any(hours is not None for hours in windows):
+        los = stay_los(comp['patientunitstayid'])
+    
+    #%% Get features, for all labs and windows at once.
+    wide = lab_stats(labs, lab_list, norms, los, windows)
+    comp = comp.merge(wide,left_on='patientunitstayid',right_index=True,
+                      how='left')
     
     #%% Save off results.
-    comp.to_csv('lab_feature_data.csv',index=False)
+    comp.to_csv(out_file,index=False)
     calc_time = time() - start
     
 if __name__ == '__main__':
@@ -6,7 +6,7 @@ Created on Fri Feb  7 11:45:34 2020
 # Then spits out relative medication features for each one.
 Can modify hours to get different time amounts before delirium onset.
 
-Runtime: ~15 min
+Runtime: ~1 min
 
 @author: Kirby
 """
@@ -27,9 +27,12 @@ def full_script():
     
     #%% Inputs
     #define all the paths. 
-    drugPathList = glob.glob(str(parent_path.joinpath('DrugNameLists','*')))
+    #Sorted like Windows lists them, so drug and treatment lists line up.
+    drugPathList = sorted(glob.glob(str(parent_path.joinpath(
+        'DrugNameLists','*'))),key=str.lower)
     
-    treatmentPathList = glob.glob(str(parent_path.joinpath('TreatmentStrings','*')))
+    treatmentPathList = sorted(glob.glob(str(parent_path.joinpath(
+        'TreatmentStrings','*'))),key=str.lower)
     
     comp = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
@@ -46,10 +49,10 @@ def full_script():
             raise NameError(path+" is not a valid file path")
     
     #%% Generate features.
-    for i in range(1,len(drugPathList)):
-        comp = pd.concat(
-            objs=[comp,df.DrugFeature(drugPathList[i],treatmentPathList[i])]
-            ,axis = 1)
+    #All drug classes at once, skipping the first list like before.
+    comp = pd.concat(
+        objs=[comp,df.DrugFeatures(drugPathList[1:],treatmentPathList[1:])]
+        ,axis = 1)
         
     comp.to_csv('AllDrugFeatures.csv',index=False)
     
@@ -12,6 +12,7 @@ run time: 10 sec
 """
 def full_script():
         
+    import sys
     import numpy as np
     import pandas as pd
     from pathlib import Path
@@ -22,10 +23,12 @@ def full_script():
     file_path = Path(__file__)
     dataset_path = file_path.parent.parent.parent.joinpath("Dataset")
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
     
     # pull relevant HICL codes
-    hicl = pd.read_csv(eicu_path.joinpath("medication.csv"),
-                       usecols=['drugname','drughiclseqno'])
+    hicl = load_table("medication",
+                      columns=['drugname','drughiclseqno'])
     hicl = hicl.dropna()
     hicl = hicl.drop_duplicates()
     hicl.to_csv("HICLlegend.csv",index=False)
@@ -10,14 +10,28 @@ to search for, and one with a list of treatment strings to search for.
 
 Then takes in the file name it pulls windows from.
 
+DrugFeatures() does the same for a whole list of drug classes at once. It 
+loads and lowercases the eICU tables once, drops the rows that weren't going 
+at the end of the window once, and then just checks which unique drug names/
+treatment strings each class matches. Use it instead of calling DrugFeature()
+in a loop.
+
 @author: Kirby
 """
 #Used for testing.
 drugSearchListPath=r'C:\Users\Kirby\OneDrive\JHU\Precision Care Medicine\ICU Readmissions\Features\Medications\DrugNameLists\Tetracyclines.csv'
 treatmentSearchListPath=r'C:\Users\Kirby\OneDrive\JHU\Precision Care Medicine\ICU Readmissions\Features\Medications\TreatmentStrings\TetracyclinesTreatment.csv'
 
-def DrugFeature(drugSearchListPath,treatmentSearchListPath):
+def read_search_list(searchListPath):
+    import pandas as pd
+    # import list of strings to search for, and make it all lowercase
+    search = pd.read_csv(searchListPath)
+    searchList = [str(item).lower() for item in search.values.ravel()]
+    return search.columns.values[0], searchList
+
+def DrugFeatures(drugSearchListPaths,treatmentSearchListPaths):
     #%% Setup    
+    import sys
     import numpy as np
     import pandas as pd
     from pathlib import Path
@@ -25,131 +39,119 @@ def DrugFeature(drugSearchListPath,treatmentSearchListPath):
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(file_path.parent.parent))
+    from obs_windows import active_at_window_end
+    from string_matcher import compile_patterns, match_strings, tag_column
     
     #%% Inputs. 
+    # only keep rows that are relevant to our data set.
+    comp = pd.read_csv(cohort_path.joinpath("ICU_readmissions_dataset.csv"))
+    
+    # import lists of drug names and treatment strings to search for, and
+    # compile them all into one matcher each.
+    drugLists = dict()
+    treatLists = dict()
+    for drugSearchListPath, treatmentSearchListPath in zip(
+            drugSearchListPaths,treatmentSearchListPaths):
+        newColName, druglist = read_search_list(drugSearchListPath)
+        treatName, treatStringsList = read_search_list(treatmentSearchListPath)
+        drugLists[newColName] = druglist
+        treatLists[newColName] = treatStringsList
+    drugMatcher = compile_patterns(drugLists)
+    treatMatcher = compile_patterns(treatLists)
+    
     # get infusion drug info
-    infu = pd.read_csv(eicu_path.joinpath("infusiondrug.csv"), 
-                       usecols=['patientunitstayid','infusionoffset',
-                                'drugname'])
+    infu = load_table("infusiondrug", 
+                      columns=['patientunitstayid','infusionoffset',
+                               'drugname'],
+                      stay_ids=comp['patientunitstayid'])
     
     # Get medication table info
-    med = pd.read_csv(eicu_path.joinpath("medication.csv"),
-                      usecols=['patientunitstayid', 'drugstartoffset', 
-                               'drugname', 'drughiclseqno', 'drugstopoffset',
-                               'drugordercancelled'])
+    med = load_table("medication",
+                     columns=['patientunitstayid', 'drugstartoffset', 
+                              'drugname', 'drughiclseqno', 'drugstopoffset',
+                              'drugordercancelled'],
+                     stay_ids=comp['patientunitstayid'])
     # remove cancelled orders
     med = med[med['drugordercancelled']=='No']
     # drop column with drug order info.
-    med.drop(columns=['drugordercancelled'],inplace=True)
+    med = med.drop(columns=['drugordercancelled'])
  
     # Get Treatment table info
-    treat = pd.read_csv(eicu_path.joinpath("treatment.csv")
-                        ,usecols=['patientunitstayid', 'treatmentoffset', 
-                                  'treatmentstring'])
+    treat = load_table("treatment",
+                       columns=['patientunitstayid', 'treatmentoffset', 
+                                'treatmentstring'],
+                       stay_ids=comp['patientunitstayid'])
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
-    
-    # only keep rows that are relevant to our data set.
-    comp = pd.read_csv(cohort_path.joinpath("ICU_readmissions_dataset.csv"))
-    compInfu = infu[infu['patientunitstayid'].isin(comp['patientunitstayid'])]
-    compMed = med[med['patientunitstayid'].isin(comp['patientunitstayid'])]
-    compTreat = treat[treat['patientunitstayid'].isin(comp['patientunitstayid'])]
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=comp['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     comp = comp.merge(pat,on='patientunitstayid',how='left')
     comp.rename(columns={'unitdischargeoffset':'end'},inplace=True)
     comp['start'] = 0
     
-    #%% only keep rows with relevant drugs
-    
-    # import lists of drug names to search for, and make it all lowercase
-    # change this part to get different drug features
-    drug=pd.read_csv(drugSearchListPath)
-    drug = drug.applymap(lambda s:s.lower() if type(s) == str else s)
-    druglist = drug.values.astype(str).tolist()
-    druglist = [item.lower() for sublist in druglist for item in sublist]
-    
     # this csv was generated using Create HICL Drug Name Legend.py
     hicl = pd.read_csv("HICLlegend.csv")
-    # make it all lowercase
-    hicl = hicl.applymap(lambda s:s.lower() if type(s) == str else s)
-    # pull relevant HICL codes
-    hicl = hicl[hicl['drugname'].str.contains('|'.join(druglist))]
-    hicl = hicl.drop(columns=['drugname'])
-    hicl = hicl.drop_duplicates()
-    
-    # keep the rows from medication with relevant drugs. 
-    compMed = compMed.applymap(lambda s:s.lower() if type(s) == str else s)
-    drugMed = compMed[compMed['drugname'].str.contains(
-        '|'.join(druglist),na=False)]
-    hiclMed = compMed[compMed['drughiclseqno'].isin(hicl['drughiclseqno'])]
-    compMed = pd.concat([drugMed,hiclMed])
-    compMed = compMed.drop_duplicates()
-    
-    # keep the rows from infusion with relevant drugs. 
-    compInfu = compInfu.applymap(lambda s:s.lower() if type(s) == str else s)
-    compInfu = compInfu[compInfu['drugname'].str.contains(
-        '|'.join(druglist),na=False)]
-    compInfu['drugstopoffset']=np.nan
-    compInfu['drughiclseqno']=np.nan
-    compInfu = compInfu.rename(columns={'infusionoffset':'drugstartoffset'})
-    
-    # keep the rows from treatment with relevant drugs. 
-    # pull list of strings to search treatment with. 
-    treatStrings = pd.read_csv(treatmentSearchListPath)
-    treatStrings = treatStrings.applymap(
-        lambda s:s.lower() if type(s) == str else s)
-    treatStringsList = treatStrings.values.astype(str).tolist()
-    treatStringsList = [
-        item.lower() for sublist in treatStringsList for item in sublist]
-    
-    compTreat = compTreat.applymap(lambda s:s.lower() if type(s) == str else s)
-    compTreat = compTreat[
-        compTreat['treatmentstring'].str.contains(
-            '|'.join(treatStringsList),na=False)]
-    compTreat['drugstopoffset']=np.nan
-    compTreat['drughiclseqno']=np.nan
-    compTreat = compTreat.rename(columns={'treatmentoffset':'drugstartoffset',
-                                          'treatmentstring':'drugname'})
-    
-    # combine the treatment, medication, and infusion info together
-    compFeat = pd.concat([compMed,compInfu,compTreat],sort=False)
-    compFeat = compFeat.sort_values(by=['patientunitstayid','drugstartoffset',
-                                        'drugstopoffset'])
-    compFeat = compFeat[['patientunitstayid','drugstartoffset',
-                         'drugstopoffset','drugname','drughiclseqno']]
     
-    # Only keep the rows where the drug start offset was before our data window,
-    # and the stop offset was nan or after the data window. 
-    window_lookup = comp.set_index('patientunitstayid')
-    def keep_row(current_ID,drug_start,drug_stop):
-        window_start = window_lookup.loc[current_ID,'start']
-        window_end = window_lookup.loc[current_ID,'end']
-        #if drug was given before window, and didn't end, keep it.
-        if (drug_start < window_end) & (np.isnan(drug_stop)):
-            return 1 
-        #If drug was given before window, and stopped after window, keep it. 
-        if (drug_start < window_end) & (drug_stop > window_end):
-            return 1
-        else:
-            return 0
-    
-    if compFeat.shape[0] != 0:
-        compFeat['keep'] = compFeat.apply(lambda row: keep_row(
-            row['patientunitstayid'],row['drugstartoffset'],row['drugstopoffset']),
-            axis=1)
-        compFeat = compFeat[compFeat['keep'] == 1]
-    
-    # get a list of the stay IDs that have the drug administrations.
-    compFeat = compFeat[['patientunitstayid']]
-    compFeat = compFeat.drop_duplicates()
-    
-    # Convert it to a true/false for each stay ID in comp
-    newColName = drug.columns.values[0]
-    comp[newColName] = \
-        comp['patientunitstayid'].isin(compFeat['patientunitstayid']).astype(int)
+    #%% Only keep the rows where the drug start offset was before our data
+    # window, and the stop offset was nan or after the data window.
+    # Infusions and treatments don't have stop offsets.
+    infu = infu.rename(columns={'infusionoffset':'drugstartoffset'})
+    infu['drugstopoffset'] = np.nan
+    treat = treat.rename(columns={'treatmentoffset':'drugstartoffset'})
+    treat['drugstopoffset'] = np.nan
+    med = active_at_window_end(med,comp,'drugstartoffset','drugstopoffset')
+    infu = active_at_window_end(infu,comp,'drugstartoffset','drugstopoffset')
+    treat = active_at_window_end(treat,comp,'drugstartoffset',
+                                 'drugstopoffset')
+    
+    #%% Get the unique strings each stay had, so each drug class only has to
+    # search the unique strings, not every row.
+    def stay_strings(data,col):
+        pairs = data[['patientunitstayid',col]].dropna().drop_duplicates()
+        codes, uniques = pd.factorize(pairs[col])
+        return pairs['patientunitstayid'].values, codes, pd.Series(uniques)
+    
+    medStays, medCodes, medNames = stay_strings(med,'drugname')
+    infuStays, infuCodes, infuNames = stay_strings(infu,'drugname')
+    treatStays, treatCodes, treatNames = stay_strings(treat,'treatmentstring')
+    hiclPairs = med[['patientunitstayid','drughiclseqno']].dropna(
+        ).drop_duplicates()
+    
+    #%% Tag the unique strings with every drug class they match, ignoring
+    # case.
+    medMatch = match_strings(drugMatcher,medNames)
+    infuMatch = match_strings(drugMatcher,infuNames)
+    treatMatch = match_strings(treatMatcher,treatNames)
+    hiclMatch = tag_column(drugMatcher,hicl['drugname'])
+    
+    #%% Flag each stay for each drug class.
+    feats = pd.DataFrame(index=comp.index)
+    for i, newColName in enumerate(drugMatcher['labels']):
+        # pull relevant HICL codes
+        classHicl = hicl.loc[hiclMatch[newColName].values,'drughiclseqno']
+        
+        # stays with the drug in medication (by name or HICL), infusion, or 
+        # treatment.
+        stays = np.concatenate([
+            medStays[medMatch[medCodes,i]],
+            hiclPairs.loc[hiclPairs['drughiclseqno'].isin(classHicl),
+                          'patientunitstayid'].values,
+            infuStays[infuMatch[infuCodes,i]],
+            treatStays[treatMatch[treatCodes,i]]])
+        
+        # Convert it to a true/false for each stay ID in comp
+        feats[newColName] = \
+            comp['patientunitstayid'].isin(stays).astype(int)
     
     #%%
-    return comp[newColName]
\ No newline at end of file
+    return feats
+
+def DrugFeature(drugSearchListPath,treatmentSearchListPath):
+    feats = DrugFeatures([drugSearchListPath],[treatmentSearchListPath])
+    return feats[feats.columns[0]]
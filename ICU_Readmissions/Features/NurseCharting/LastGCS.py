@@ -12,6 +12,7 @@ Run time: 5 minutes
 def full_script():
     
     #%% Import packages.
+    import sys
     import numpy as np
     import pandas as pd
     import os
@@ -24,6 +25,12 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(file_path.parent.parent))
+    from obs_windows import filter_to_window
+    sys.path.append(str(file_path.parent))
+    from NurseChartingScan import load_nursecharting_subset
     
     
     #%% Load in and prepare relevant data.
@@ -31,8 +38,9 @@ def full_script():
     ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=ids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     ids = ids.merge(pat,on='patientunitstayid',how='left')
@@ -40,42 +48,12 @@ def full_script():
     ids['start'] = 0
         
     
-    #Just get GCS data.
-    GCS_data = pd.read_csv(eicu_path.joinpath("nurseCharting.csv"),
-                           nrows=0,
-                           usecols=['patientunitstayid','nursingchartoffset',
-                                    'nursingchartcelltypevallabel',
-                                    'nursingchartcelltypevalname',
-                                    'nursingchartvalue'])
-    for chunk in pd.read_csv(eicu_path.joinpath("nurseCharting.csv"), 
-                             chunksize=500000,
-                             usecols=['patientunitstayid','nursingchartoffset',
-                                      'nursingchartcelltypevallabel',
-                                      'nursingchartcelltypevalname',
-                                      'nursingchartvalue']):
-        temp_rows = chunk[
-            chunk['nursingchartcelltypevallabel']=='Glasgow coma score']
-        GCS_data = pd.concat([GCS_data,temp_rows])
-    
-    #Only keep GCS data for patients we care about. 
-    GCS_data = GCS_data[GCS_data['patientunitstayid'].isin(
-        ids['patientunitstayid'])]
+    #Just get GCS data for patients we care about.
+    GCS_data = load_nursecharting_subset('gcs',
+                                         stay_ids=ids['patientunitstayid'])
     
     #Drop data after the observation window for each patient. 
-    lookup = ids.set_index('patientunitstayid')
-    def keep_row(current_ID,offset):
-        #Get window time stamps.
-        window_start = lookup.loc[current_ID,'start']
-        window_end = lookup.loc[current_ID,'end']
-        #If the GCS score took place before/in window, keep it. 
-        if (offset <= window_end):
-            return 1
-        else:
-            return 0
-    
-    GCS_data['keep'] = GCS_data.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['nursingchartoffset']),axis=1)
-    GCS_data = GCS_data[GCS_data['keep']==1]
+    GCS_data = filter_to_window(GCS_data,ids,'nursingchartoffset')
     
     #Make the data all numeric.
     GCS_data['patientunitstayid'] = pd.to_numeric(
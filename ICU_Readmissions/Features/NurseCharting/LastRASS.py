@@ -11,6 +11,7 @@ Runtime: 2 minutes.
 """
 def full_script():
     #%% Package setup
+    import sys
     import pandas as pd
     import numpy as np
     import time
@@ -22,6 +23,12 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(file_path.parent.parent))
+    from obs_windows import filter_to_window
+    sys.path.append(str(file_path.parent))
+    from NurseChartingScan import load_nursecharting_subset
     
     #%% Load in data. 
     
@@ -29,31 +36,19 @@ def full_script():
     
     ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=ids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     ids = ids.merge(pat,on='patientunitstayid',how='left')
     ids.rename(columns={'unitdischargeoffset':'end'},inplace=True)
     ids['start'] = 0
     
-    keep_list = ['RASS','SEDATION SCORE','Sedation Scale/Score/Goal']
-    #Just get rass data.
-    rass_data = pd.read_csv(eicu_path.joinpath("nurseCharting.csv"),
-                                   nrows=0,
-                                   usecols=['patientunitstayid',
-                                            'nursingchartoffset',
-                                            'nursingchartcelltypevallabel',
-                                            'nursingchartcelltypevalname',
-                                            'nursingchartvalue'])
-    for chunk in pd.read_csv(eicu_path.joinpath("nurseCharting.csv"), 
-                             chunksize=1000000,
-                             usecols=['patientunitstayid','nursingchartoffset',
-                                      'nursingchartcelltypevallabel',
-                                      'nursingchartcelltypevalname',
-                                      'nursingchartvalue']):
-        rass_rows = chunk[chunk['nursingchartcelltypevallabel'].isin(keep_list)]
-        rass_data = pd.concat([rass_data,rass_rows])
+    #Just get rass data ('RASS','SEDATION SCORE','Sedation Scale/Score/Goal')
+    #for patients we care about.
+    rass_data = load_nursecharting_subset('rass',
+                                          stay_ids=ids['patientunitstayid'])
     
     #%% Clean up and combine the RASS data. 
     #Get the 'RASS' data.
@@ -82,26 +77,8 @@ def full_script():
            'nursingchartvalue']]
     
     #%% Process the data.
-    #Just get data on patients we care about. 
-    rass_data = rass_data[
-        rass_data['patientunitstayid'].isin(ids['patientunitstayid'])]
-    
     #Drop data after the observation window for each patient. 
-    lookup = ids.set_index('patientunitstayid')
-    def keep_row(current_ID,offset):
-        #Get window time stamps.
-        window_start = lookup.loc[current_ID,'start']
-        window_end = lookup.loc[current_ID,'end']
-        #If the rass score took place before/in window, keep it. 
-        if (offset <= window_end):
-            return 1
-        else:
-            return 0
-    
-    rass_data['keep'] = rass_data.apply(
-        lambda row: keep_row(
-            row['patientunitstayid'],row['nursingchartoffset']),axis=1)
-    rass_data = rass_data[rass_data['keep']==1]
+    rass_data = filter_to_window(rass_data,ids,'nursingchartoffset')
     
     #Make the data all numeric.
     rass_data['nursingchartoffset'] = pd.to_numeric(
@@ -11,6 +11,7 @@ Runtime: 30 seconds
 """
 def full_script():
     #%% Package setup
+    import sys
     import pandas as pd
     import numpy as np
     import time
@@ -22,6 +23,12 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(file_path.parent.parent))
+    from obs_windows import filter_to_window
+    sys.path.append(str(file_path.parent))
+    from NurseChartingScan import load_nursecharting_subset
     
     #%% Load in data. 
     
@@ -29,8 +36,9 @@ def full_script():
     
     ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=ids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     ids = ids.merge(pat,on='patientunitstayid',how='left')
@@ -38,44 +46,13 @@ def full_script():
     ids['start'] = 0
     
     #Just get temp data. Only keeping Celsius, we've verified F and C are mostly identical data.
-    temperature_data = pd.read_csv(
-        eicu_path.joinpath("nurseCharting.csv"),
-                                   nrows=0,
-                                   usecols=['patientunitstayid',
-                                            'nursingchartoffset',
-                                            'nursingchartcelltypevallabel',
-                                            'nursingchartcelltypevalname',
-                                            'nursingchartvalue'])
-    for chunk in pd.read_csv(eicu_path.joinpath("nurseCharting.csv"), 
-                             chunksize=1000000,
-                             usecols=['patientunitstayid','nursingchartoffset',
-                                      'nursingchartcelltypevallabel',
-                                      'nursingchartcelltypevalname',
-                                      'nursingchartvalue']):
-        temp_rows = chunk[chunk['nursingchartcelltypevalname']=='Temperature (C)']
-        temperature_data = pd.concat([temperature_data,temp_rows])
+    temperature_data = load_nursecharting_subset(
+        'temperature',stay_ids=ids['patientunitstayid'])
     
     #%% Process the data.
-    #Just get data on patients we care about. 
-    temperature_data = temperature_data[
-        temperature_data['patientunitstayid'].isin(ids['patientunitstayid'])]
-    
     #Drop data after the observation window for each patient. 
-    lookup = ids.set_index('patientunitstayid')
-    def keep_row(current_ID,offset):
-        #Get window time stamps.
-        window_start = lookup.loc[current_ID,'start']
-        window_end = lookup.loc[current_ID,'end']
-        #If the temp score took place before/in window, keep it. 
-        if (offset <= window_end):
-            return 1
-        else:
-            return 0
-    
-    temperature_data['keep'] = temperature_data.apply(
-        lambda row: keep_row(
-            row['patientunitstayid'],row['nursingchartoffset']),axis=1)
-    temperature_data = temperature_data[temperature_data['keep']==1]
+    temperature_data = filter_to_window(temperature_data,ids,
+                                        'nursingchartoffset')
     
     #Make the data all numeric.
     temperature_data['nursingchartoffset'] = pd.to_numeric(
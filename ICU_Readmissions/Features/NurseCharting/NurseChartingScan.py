@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:20:00 2026
+
+Reads nurseCharting once, and saves off the subsets of it each feature script
+needs (GCS, RASS, temperature, vitals, ventilation strings), instead of every
+script scanning the whole table on its own.
+
+Each extractor takes a chunk of nurseCharting and returns which rows it wants.
+Every chunk gets routed through all of the extractors, the kept rows are
+collected in lists, and concatenated once at the end. Subsets are saved as
+parquet next to the eICU parquet store, for all stays (not just our cohort),
+so they don't need to be redone when the cohort changes. Without pyarrow,
+they're pickled there instead.
+
+Feature scripts get their subset with load_nursecharting_subset(), which runs
+the scan first if it hasn't been done yet. Rerun this file if nurseCharting
+changes, or an extractor gets added/changed.
+
+Runtime: 10 minutes.
+
+@author: Kirby
+"""
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+file_path = Path(__file__)
+sys.path.append(str(file_path.parent.parent.parent))
+from eicu_tables import store_path, iter_table, clean_stay_ids
+sys.path.append(str(file_path.parent.parent))
+from string_matcher import compile_patterns, tag_column
+
+subset_path = store_path.joinpath('nursecharting_subsets')
+vent_path = file_path.parent.parent.joinpath('Ventilation')
+
+#Search strings MVDurationDynamic.py uses.
+vent_words = list(pd.read_csv(
+    vent_path.joinpath('ventilation_search_strings.csv'))['string'])
+o2_words = list(pd.read_csv(
+    vent_path.joinpath('o2therapy_search_strings.csv'))['string'])
+vent_matcher = compile_patterns({'vent':['vent'],
+                                 'vent_words':vent_words,
+                                 'o2_words':o2_words})
+
+#Columns kept in every subset.
+columns = ['patientunitstayid','nursingchartoffset',
+           'nursingchartcelltypevallabel','nursingchartcelltypevalname',
+           'nursingchartvalue']
+
+
+#%% Extractors.
+def gcs_rows(chunk):
+    #Used by LastGCS.py and SuspectedSepsis.py (GCS Total).
+    return chunk['nursingchartcelltypevallabel'] == 'Glasgow coma score'
+
+def rass_rows(chunk):
+    #Used by LastRASS.py.
+    return chunk['nursingchartcelltypevallabel'].isin(
+        ['RASS','SEDATION SCORE','Sedation Scale/Score/Goal'])
+
+def temperature_rows(chunk):
+    #Used by LastTemperature.py. Only Celsius, F and C are mostly identical.
+    return chunk['nursingchartcelltypevalname'] == 'Temperature (C)'
+
+def vitals_rows(chunk):
+    #Used by SuspectedSepsis.py.
+    return chunk['nursingchartcelltypevalname'].str.contains(
+        'bp systolic|bp mean|respiratory rate',case=False,na=False)
+
+def ventilation_rows(chunk):
+    #Used by MVDurationDynamic.py. Everything it searches nurseCharting for,
+    #MV starts and O2 therapy stops.
+    keep = tag_column(vent_matcher,chunk['nursingchartvalue']).any(axis=1)
+    keep |= chunk['nursingchartcelltypevallabel'] == 'O2 L/%'
+    return keep & chunk['nursingchartvalue'].notna()
+
+extractors = {'gcs':gcs_rows,
+              'rass':rass_rows,
+              'temperature':temperature_rows,
+              'vitals':vitals_rows,
+              'ventilation':ventilation_rows}
+
+def register_extractor(name, extractor):
+    #Add another subset to the scan. extractor takes a chunk of nurseCharting
+    #and returns a boolean Series of the rows to keep.
+    extractors[name] = extractor
+
+
+#%% Scanning.
+def has_pyarrow():
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+def subset_suffixes():
+    #Formats subsets can be read from, the one they're saved in first.
+    return ['.parquet','.pkl'] if has_pyarrow() else ['.pkl']
+
+def subset_file(name):
+    #The saved subset, or where it gets saved if there isn't one yet.
+    for suffix in subset_suffixes():
+        if subset_path.joinpath(name + suffix).exists():
+            return subset_path.joinpath(name + suffix)
+    return subset_path.joinpath(name + subset_suffixes()[0])
+
+def save_subset(subset, name):
+    #Save in the first format, and drop any older copy in the other one.
+    for suffix in ['.parquet','.pkl']:
+        old_file = subset_path.joinpath(name + suffix)
+        if old_file.exists():
+            old_file.unlink()
+    out_file = subset_path.joinpath(name + subset_suffixes()[0])
+    if out_file.suffix == '.parquet':
+        subset.to_parquet(out_file, index=False)
+    else:
+        subset.to_pickle(out_file)
+
+def scan_nursecharting(names=None, chunksize=1000000):
+    from time import time
+    start = time()
+    if names is None:
+        names = list(extractors)
+
+    kept = {name:[] for name in names}
+    for chunk in iter_table('nurseCharting', columns=columns,
+                            chunksize=chunksize):
+        for name in names:
+            kept[name].append(chunk[np.asarray(extractors[name](chunk))])
+
+    subset_path.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        subset = pd.concat(kept[name], ignore_index=True)
+        #Values are free text mixed with numbers, store them all as text.
+        subset['nursingchartvalue'] = subset['nursingchartvalue'].where(
+            subset['nursingchartvalue'].isna(),
+            subset['nursingchartvalue'].astype(str))
+        save_subset(subset, name)
+        print(name + ': ' + str(subset.shape[0]) + ' rows.')
+
+    calc = time() - start
+    print('nurseCharting scanned in ' + str(round(calc)) + ' seconds.')
+
+def load_nursecharting_subset(name, stay_ids=None):
+    """
+    Loads one extractor's subset of nurseCharting, only for stay_ids if given.
+    Runs the scan (for all the missing subsets at once) if needed.
+    """
+    if not subset_file(name).exists():
+        scan_nursecharting([key for key in extractors
+                            if not subset_file(key).exists()])
+    if subset_file(name).suffix == '.parquet':
+        data = pd.read_parquet(subset_file(name))
+    else:
+        data = pd.read_pickle(subset_file(name))
+    if stay_ids is not None:
+        data = data[data['patientunitstayid'].isin(clean_stay_ids(stay_ids))]
+        data = data.reset_index(drop=True)
+    return data
+
+
+if __name__ == '__main__':
+    scan_nursecharting()
@@ -8,7 +8,7 @@ Split out pre-processed PTS data into separate files of just our dataset's value
 a special 2-hour interpolation for BP data that also combines the non-invasive 
 and invasive data, generally assuming that invasive data is more accurate.
 
-Runtime: 11 minutes
+Runtime: a couple minutes, mostly reading and writing the csvs.
 
 @author: Kirby
 """
@@ -37,33 +37,86 @@ eicu_path = wd.parent.parent.parent.joinpath('eicu')
 comp = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
 
 
-#%% Interpolation function that only interpolates if less than threshold 
+#%% Interpolation functions that only interpolate if less than threshold 
     # consecutive nans and is same unit stay.
+# Everything works on arrays sorted so each stay's rows are one contiguous 
+# segment, given by the start and end (exclusive) row of each segment, so no 
+# stay ever gets filtered out of the whole frame on its own.
+def stay_segments(ids):
+    # Get the start and end rows of each run of the same stay id.
+    bounds = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(ids)]])
+    return starts, ends
+
+def interp_segments(values, starts, ends, thresh):
+    # Same as interpolate().bfill() on each segment, but only filling runs of 
+    # thresh or fewer consecutive nans.
+    n = len(values)
+    if n == 0:
+        return values
+    idx = np.arange(n)
+    lengths = ends - starts
+    seg_start = np.repeat(starts, lengths)
+    seg_end = np.repeat(ends, lengths)
+    valid = ~np.isnan(values)
+    # Closest non nan row before and after each row, in the same stay.
+    prev = np.maximum.accumulate(np.where(valid, idx, -1))
+    nxt = np.minimum.accumulate(np.where(valid, idx, n)[::-1])[::-1]
+    has_prev = prev >= seg_start
+    has_next = nxt < seg_end
+    prev_val = values[np.clip(prev, 0, n - 1)]
+    next_val = values[np.clip(nxt, 0, n - 1)]
+    # Linear between the two, like interpolate(). Before the first value gets 
+    # backfilled, after the last value gets carried forward.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = (idx - prev)/(nxt - prev)
+    filled = np.where(has_prev & has_next, prev_val + (next_val - prev_val)*frac,
+                      np.where(has_prev, prev_val, next_val))
+    filled[~(has_prev | has_next)] = np.nan
+    filled[valid] = values[valid]
+    # Length of the run of nans each row is in.
+    gap = (np.where(has_next, nxt, seg_end) - 
+           np.where(has_prev, prev, seg_start - 1) - 1)
+    return np.where(valid | (gap <= thresh), filled, np.nan)
+
 def interp_thresh(vitals,thresh,col):
-    # Get stays. 
-    stays = vitals['patientunitstayid'].drop_duplicates()
-    df_list = list()
-    
-    for stay in stays:
-        temp_vitals = vitals[vitals['patientunitstayid'] == stay].copy()
-        # Only interpolates if gap less than 2 hour. 
-        mask = temp_vitals.copy()
-        # Create column that makes new id for each value or consecutive group of nans.
-        grp = pd.DataFrame(
-            ((mask[col].notnull() != mask[col].shift().notnull()).cumsum()),
-            columns=[col])
-        grp['ones'] = 1
-        # Group by that column and count to find where less than thresh consecutive nans are.
-        mask['mask'] = ((grp.groupby(col)['ones'].transform('count') <= thresh) | 
-                        temp_vitals[col].notnull())
-        temp_vitals[col] = temp_vitals[col].interpolate().bfill()[mask['mask']]
-        df_list.append(temp_vitals)
-    
-    vitals = pd.concat(df_list)
+    # Put each stay's rows together, keeping stays in order of first 
+    # appearance and rows in their original order.
+    codes = pd.factorize(vitals['patientunitstayid'])[0]
+    order = np.argsort(codes, kind='stable')
+    vitals = vitals.iloc[order].copy()
+    starts, ends = stay_segments(codes[order])
+    vitals[col] = interp_segments(vitals[col].values.astype(float), starts, 
+                                  ends, thresh)
     return vitals
 
-# But can't allow interpolation to cross over unit stays...
-# process each patient unit stay id's data separately?'
+def resample_interp(both,thresh,col):
+    # Resample each stay down to 1 minute, from its first offset up to (not 
+    # including) its last one, then interpolate the gaps, all on arrays. 
+    # Data must already be sorted by stay and offset.
+    ids = both['patientunitstayid'].values
+    offsets = both['observationoffset'].values.astype(np.int64)
+    starts, ends = stay_segments(ids)
+    first = offsets[starts]
+    last = offsets[ends - 1]
+    lengths = np.maximum(last - first, 0)
+    out_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    # New minute by minute offsets and stay ids.
+    new_offsets = (np.arange(lengths.sum()) + 
+                   np.repeat(first - out_starts, lengths))
+    new_ids = np.repeat(ids[starts], lengths)
+    # Put the values we have on their minute, everything else is nan.
+    values = np.full(len(new_offsets), np.nan)
+    seg = np.repeat(np.arange(len(starts)), ends - starts)
+    keep = offsets < last[seg]
+    pos = out_starts[seg] + offsets - first[seg]
+    values[pos[keep]] = both[col].values[keep]
+    # Interpolate 2 hr gaps one more time.
+    values = interp_segments(values, out_starts, out_starts + lengths, thresh)
+    return pd.DataFrame({'observationoffset':new_offsets,
+                         'patientunitstayid':new_ids,
+                         col:values})
 
 #%% Split out and interpolate non BP data.
 
@@ -113,22 +166,8 @@ for bp_type in ['systolic','diastolic','mean']:
     noninv.rename(columns={'noninvasive' + bp_type: 'all' + bp_type}, inplace=True)
     both = pd.concat([inv,noninv])
     both.sort_values(['patientunitstayid','observationoffset'],inplace=True)
-    # resample down to 1 minute.
-    stays = both['patientunitstayid'].drop_duplicates()
-    df_list = list()
-    for stay in stays:
-        temp_data = both[both['patientunitstayid'] == stay]
-        first = temp_data.iloc[0,1]
-        last = temp_data.iloc[-1,1]
-        temp_data = temp_data.set_index('observationoffset')
-        temp_data = temp_data.reindex(list(range(first,last)))
-        temp_data.reset_index(inplace=True)
-        temp_data['patientunitstayid'] = stay
-        df_list.append(temp_data)
-    both = pd.concat(df_list)
-        
-    # Interpolate 2 hr gaps one more time.
-    both = interp_thresh(both,120,'all' + bp_type)
+    # resample down to 1 minute, and interpolate 2 hr gaps one more time.
+    both = resample_interp(both,120,'all' + bp_type)
     # Save off data. 
     both.to_csv('pre-processed_all' + bp_type + '.csv', index=False)
     print(bp_type + ' done!')
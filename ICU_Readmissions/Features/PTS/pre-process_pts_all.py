@@ -12,6 +12,7 @@ Runtime: 11 minutes
 """
 
 #%% Package setup
+import sys
 import numpy as np
 import pandas as pd
 #import multiprocessing as mp
@@ -29,25 +30,27 @@ wd = Path(file_path)
 print(file_path)
 cohort_path = wd.parent.parent.joinpath('Cohort')
 eicu_path = wd.parent.parent.parent.joinpath('eicu')
+sys.path.append(str(wd.parent.parent))
+from eicu_tables import load_table
 
 #%% Load in data. 
 
 # Get LOS data. 
-los = pd.read_csv(eicu_path.joinpath('patient.csv'),
-                  usecols=['patientunitstayid','unitdischargeoffset'])
+los = load_table('patient',
+                 columns=['patientunitstayid','unitdischargeoffset'])
 los.rename(columns={'unitdischargeoffset':'los'},inplace=True)
 
 # Load in vitals data. 
 
-vitals = pd.read_csv(eicu_path.joinpath('vitalPeriodic.csv'),
-                     usecols=['patientunitstayid','observationoffset',
-                              'sao2','heartrate','respiration',
-                              'systemicsystolic','systemicdiastolic',
-                              'systemicmean'])
-avitals = pd.read_csv(eicu_path.joinpath('vitalAperiodic.csv'),
-                     usecols=['patientunitstayid','observationoffset',
-                              'noninvasivesystolic','noninvasivediastolic',
-                              'noninvasivemean'])
+vitals = load_table('vitalPeriodic',
+                    columns=['patientunitstayid','observationoffset',
+                             'sao2','heartrate','respiration',
+                             'systemicsystolic','systemicdiastolic',
+                             'systemicmean'])
+avitals = load_table('vitalAperiodic',
+                    columns=['patientunitstayid','observationoffset',
+                             'noninvasivesystolic','noninvasivediastolic',
+                             'noninvasivemean'])
 
 #%% Split out data.
 
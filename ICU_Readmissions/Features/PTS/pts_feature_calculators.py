@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:10:00 2026
+
+Calculates a given list of tsfresh features, instead of running every
+tsfresh calculator and selecting afterwards.
+
+The feature names come from the headers of a previous run's
+<signal>_<timeframe>.csv files, so only features that were kept get
+recalculated. The common calculators (mean, std, quantiles, autocorrelation,
+linear trend, FFT coefficients...) are done in NumPy for every stay at once,
+over the data sorted by stay and offset. Anything else gets handed to tsfresh,
+with just those calculators turned on.
+
+Values match tsfresh's own calculators, including their nan cases.
+
+@author: Kirby
+"""
+import re
+import ast
+import numpy as np
+import pandas as pd
+
+
+#%% Reading feature names.
+def read_feature_names(col, timeframe, folder='.'):
+    """
+    Returns the feature names in a previous run's <col>_<timeframe>.csv.
+    """
+    from pathlib import Path
+    data = pd.read_csv(Path(folder).joinpath(col + '_' + timeframe + '.csv'),
+                       index_col=0, nrows=0)
+    return list(data.columns)
+
+#Splits "q_0.1", "attr_"slope"", "max_lag_40" into their name and value.
+param_regex = re.compile(r'^(.*?)_(-?[\d.e+-]+|".*"|True|False|None|\(.*\))$')
+
+def parse_feature_name(name):
+    #tsfresh names are <kind>__<calculator>__<param>_<value>__...
+    parts = name.split('__')
+    params = {}
+    for part in parts[2:]:
+        found = param_regex.match(part)
+        if found is None:
+            return parts[1], None
+        params[found.group(1)] = ast.literal_eval(found.group(2))
+    return parts[1], params
+
+
+#%% Segments.
+def make_segments(ids, x):
+    #ids and x must already be sorted by stay, then offset.
+    bounds = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(ids)]])
+    n = ends - starts
+    seg = np.repeat(np.arange(len(starts)), n)
+    return {'x':x,
+            'seg':seg,
+            'pos':np.arange(len(x)) - np.repeat(starts, n),
+            'starts':starts,
+            'ends':ends,
+            'n':n,
+            'cache':{}}
+
+def seg_sum(s, values):
+    return np.bincount(s['seg'], weights=values, minlength=len(s['n']))
+
+def seg_mean(s):
+    if 'mean' not in s['cache']:
+        s['cache']['mean'] = seg_sum(s, s['x'])/s['n']
+    return s['cache']['mean']
+
+def seg_var(s):
+    if 'var' not in s['cache']:
+        d = s['x'] - seg_mean(s)[s['seg']]
+        s['cache']['var'] = seg_sum(s, d*d)/s['n']
+    return s['cache']['var']
+
+def seg_sorted(s):
+    #Values sorted within each segment.
+    if 'sorted' not in s['cache']:
+        s['cache']['sorted'] = s['x'][np.lexsort((s['x'], s['seg']))]
+    return s['cache']['sorted']
+
+def seg_diffs(s):
+    #Differences between consecutive values, and the segment they're in.
+    if 'diffs' not in s['cache']:
+        same = s['seg'][1:] == s['seg'][:-1]
+        s['cache']['diffs'] = (np.diff(s['x'])[same], s['seg'][1:][same])
+    return s['cache']['diffs']
+
+def seg_rfft(s):
+    #np.fft.rfft of every segment. Segments of the same length get done
+    #together, as rows of one array.
+    if 'rfft' not in s['cache']:
+        groups = []
+        for length in np.unique(s['n']):
+            which = np.flatnonzero(s['n'] == length)
+            rows = s['x'][s['starts'][which].reshape(-1,1) + np.arange(length)]
+            groups.append((which, np.fft.rfft(rows, axis=1)))
+        s['cache']['rfft'] = groups
+    return s['cache']['rfft']
+
+def diff_sum(s, values):
+    diffs, seg = seg_diffs(s)
+    return np.bincount(seg, weights=values, minlength=len(s['n']))
+
+
+#%% Calculators. Each takes the segments and tsfresh's parameters.
+def calc_mean(s):
+    return seg_mean(s)
+
+def calc_variance(s):
+    return seg_var(s)
+
+def calc_standard_deviation(s):
+    return np.sqrt(seg_var(s))
+
+def calc_minimum(s):
+    return np.minimum.reduceat(s['x'], s['starts'])
+
+def calc_maximum(s):
+    return np.maximum.reduceat(s['x'], s['starts'])
+
+def calc_sum_values(s):
+    return seg_sum(s, s['x'])
+
+def calc_length(s):
+    return s['n'].astype(float)
+
+def calc_abs_energy(s):
+    return seg_sum(s, s['x']*s['x'])
+
+def calc_root_mean_square(s):
+    return np.sqrt(seg_sum(s, s['x']*s['x'])/s['n'])
+
+def calc_quantile(s, q):
+    #Linear interpolation, like np.quantile.
+    h = (s['n'] - 1)*q
+    low = np.floor(h).astype(int)
+    high = np.minimum(low + 1, s['n'] - 1)
+    values = seg_sorted(s)
+    low_val = values[s['starts'] + low]
+    high_val = values[s['starts'] + high]
+    return low_val + (h - low)*(high_val - low_val)
+
+def calc_median(s):
+    return calc_quantile(s, 0.5)
+
+def calc_mean_change(s):
+    x = s['x']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (x[s['ends'] - 1] - x[s['starts']])/(s['n'] - 1)
+    return np.where(s['n'] > 1, result, np.nan)
+
+def calc_mean_abs_change(s):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return diff_sum(s, np.abs(seg_diffs(s)[0]))/(s['n'] - 1)
+
+def calc_absolute_sum_of_changes(s):
+    return diff_sum(s, np.abs(seg_diffs(s)[0]))
+
+def calc_count_above_mean(s):
+    return seg_sum(s, (s['x'] > seg_mean(s)[s['seg']]).astype(float))
+
+def calc_count_below_mean(s):
+    return seg_sum(s, (s['x'] < seg_mean(s)[s['seg']]).astype(float))
+
+def calc_autocorrelation(s, lag):
+    x = s['x']
+    n = s['n']
+    d = x - seg_mean(s)[s['seg']]
+    #Products of each value with the one lag after it, in the same segment.
+    pair = np.arange(len(x) - lag) if lag < len(x) else np.arange(0)
+    pair = pair[s['seg'][pair] == s['seg'][pair + lag]]
+    sum_product = np.bincount(s['seg'][pair], weights=d[pair]*d[pair + lag],
+                              minlength=len(n))
+    var = seg_var(s)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = sum_product/((n - lag)*var)
+    result[np.isclose(var, 0) | (n < lag)] = np.nan
+    return result
+
+def calc_linear_trend(s, attr):
+    #Same as scipy.stats.linregress(range(len(x)), x), for every segment.
+    from scipy.stats import t as t_dist
+    n = s['n'].astype(float)
+    t_mean = (n - 1)/2
+    ssxm = (n*n - 1)/12
+    ym = seg_mean(s)
+    ssym = seg_var(s)
+    ssxym = seg_sum(s, (s['pos'] - t_mean[s['seg']])*
+                    (s['x'] - ym[s['seg']]))/n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.clip(ssxym/np.sqrt(ssxm*ssym), -1.0, 1.0)
+        #linregress calls a flat line uncorrelated, so pvalue is 1 and
+        #stderr is 0.
+        r = np.where(ssxm*ssym == 0, 0.0, r)
+        slope = ssxym/ssxm
+        intercept = ym - slope*t_mean
+        df = n - 2
+        tiny = 1.0e-20
+        t_stat = r*np.sqrt(df/((1.0 - r + tiny)*(1.0 + r + tiny)))
+        pvalue = 2*t_dist.sf(np.abs(t_stat), df)
+        stderr = np.sqrt((1 - r**2)*ssym/ssxm/df)
+    #Two points are a perfect fit, unless they're the same.
+    two = n == 2
+    pvalue[two] = np.where(ssym[two] == 0, 1.0, 0.0)
+    stderr[two] = 0.0
+    result = {'pvalue':pvalue,
+              'rvalue':r,
+              'intercept':intercept,
+              'slope':slope,
+              'stderr':stderr}[attr]
+    #One point has no line.
+    return np.where(n < 2, np.nan, result)
+
+def calc_fft_coefficient(s, coeff, attr):
+    #rfft only has n//2 + 1 coefficients, the rest are nan.
+    fft = np.full(len(s['n']), complex(np.nan, np.nan))
+    for which, group_fft in seg_rfft(s):
+        if coeff < group_fft.shape[1]:
+            fft[which] = group_fft[:,coeff]
+    return {'real':fft.real,
+            'imag':fft.imag,
+            'abs':np.abs(fft),
+            'angle':np.angle(fft, deg=True)}[attr]
+
+calculators = {'mean':calc_mean,
+               'variance':calc_variance,
+               'standard_deviation':calc_standard_deviation,
+               'minimum':calc_minimum,
+               'maximum':calc_maximum,
+               'median':calc_median,
+               'sum_values':calc_sum_values,
+               'length':calc_length,
+               'abs_energy':calc_abs_energy,
+               'root_mean_square':calc_root_mean_square,
+               'quantile':calc_quantile,
+               'mean_change':calc_mean_change,
+               'mean_abs_change':calc_mean_abs_change,
+               'absolute_sum_of_changes':calc_absolute_sum_of_changes,
+               'count_above_mean':calc_count_above_mean,
+               'count_below_mean':calc_count_below_mean,
+               'autocorrelation':calc_autocorrelation,
+               'linear_trend':calc_linear_trend,
+               'fft_coefficient':calc_fft_coefficient}
+
+def register_calculator(name, calculator):
+    #Add a NumPy version of a tsfresh calculator. calculator takes the
+    #segments from make_segments() and the feature's parameters, and returns
+    #one value per segment.
+    calculators[name] = calculator
+
+
+#%% Calculating features.
+def tsfresh_features(pts, col, feature_names):
+    #Features without a NumPy version, straight from tsfresh.
+    from tsfresh import extract_features
+    from tsfresh.feature_extraction.settings import from_columns
+    return extract_features(pts, column_id='patientunitstayid',
+                            column_sort='observationoffset',
+                            kind_to_fc_parameters=from_columns(feature_names),
+                            n_jobs=0, disable_progressbar=True)
+
+def compute_features(pts, col, feature_names):
+    """
+    Calculates feature_names (tsfresh style names) for the values in col.
+    pts has patientunitstayid, observationoffset and col, with no nans.
+    Returns a row per stay with data, like extract_features does.
+    """
+    pts = pts[['patientunitstayid','observationoffset',col]].sort_values(
+        ['patientunitstayid','observationoffset'])
+    ids = pts['patientunitstayid'].values
+    if len(ids) == 0:
+        return pd.DataFrame(columns=feature_names, dtype=float)
+    s = make_segments(ids, pts[col].values.astype(float))
+
+    features = {}
+    leftover = []
+    for name in feature_names:
+        calc, params = parse_feature_name(name)
+        if (calc not in calculators) | (params is None):
+            leftover.append(name)
+            continue
+        features[name] = calculators[calc](s, **params)
+    features = pd.DataFrame(features, index=ids[s['starts']])
+
+    if len(leftover) > 0:
+        features = features.join(tsfresh_features(pts, col, leftover))
+    features.index.name = None
+    return features[feature_names]
+
+
+#%% Checking against scipy.
+def check_linear_trend():
+    #Constant, two point and ordinary segments, against linregress.
+    from scipy.stats import linregress
+    segments = [[100.0, 100.0, 100.0, 100.0], [97.0, 99.0], [5.0, 5.0],
+                [1.0, 3.0, 2.0, 5.0, 4.0], [7.0, 7.5, 9.0]]
+    ids = np.repeat(np.arange(len(segments)), [len(x) for x in segments])
+    s = make_segments(ids, np.concatenate(segments))
+    #Older scipy calls a flat line uncorrelated (r=0, pvalue=1, stderr=0),
+    #newer scipy gives nan for those, so flat lines are checked against the
+    #older values.
+    flat = {'rvalue':0.0, 'pvalue':1.0, 'stderr':0.0}
+    for attr in ['pvalue', 'rvalue', 'intercept', 'slope', 'stderr']:
+        ours = calc_linear_trend(s, attr)
+        theirs = [flat[attr] if (np.ptp(x) == 0) & (attr in flat) else
+                  getattr(linregress(range(len(x)), x), attr)
+                  for x in segments]
+        np.testing.assert_allclose(ours, theirs, err_msg=attr)
+    print('linear_trend matches scipy.stats.linregress.')
+
+
+if __name__ == '__main__':
+    check_linear_trend()
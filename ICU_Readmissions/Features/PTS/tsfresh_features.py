@@ -2,23 +2,36 @@
 """
 Created on Tue May 11 17:59:51 2021
 
-Extract PTS features. All needed files should be placed in the same folder 
-as this script. 
+Extract PTS features. All needed files should be placed in the same folder
+as this script.
 
-Runtime, on local computer.
+Each signal's pre-processed file is loaded once, and all the timeframes get
+sliced out of it. Every (signal, timeframe) pair is a job, and the jobs are
+run across a pool of n_workers processes. Each job saves its own
+<signal>_<timeframe>.csv when it finishes, and jobs whose file already
+exists get skipped, so rerunning after a crash picks up where it left off.
+Delete the csvs to redo them.
+
+With hourly_single_extraction on, the 12 1-hour intervals of a signal are
+one job, with a single tsfresh extraction over per stay, per hour segments.
+It's then split back up into the same 12 files as before.
+
+With feature_set_folder set, only the features kept in a previous run get
+calculated, for re-extracting on a new cohort in minutes instead of days.
+
+Runtime, on local computer, per job (one signal, one timeframe).
 1 hour long interval - 4 min
 36 hour long interval - 35 min
-Estimated total - 3 hours per signal analyzed. 36 hours for all 12.
-
-Extra safe estimate, assuming 35 hr interval times for all runs - 126 hr total
+Jobs run n_workers at a time, so overnight for all of them with 24 workers.
 
 @author: Kirby
 """
 
 #%% Package setup
+import sys
 import numpy as np
 import pandas as pd
-#import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from time import time
 from pathlib import Path
 # from tsfresh import extract_relevant_features
@@ -33,92 +46,248 @@ start = time()
 filename = insp.getframeinfo(insp.currentframe()).filename
 file_path = os.path.dirname(os.path.abspath(filename))
 wd = Path(file_path)
-print(file_path)
 parent = wd.parent
 cohort_path = wd.parent.parent.joinpath('Cohort')
 eicu_path = wd.parent.parent.parent.joinpath('eicu')
+sys.path.append(str(wd.parent.parent))
+from eicu_tables import load_table
+from pts_feature_calculators import read_feature_names, compute_features
+
+#Number of jobs run at once. Each job runs tsfresh on a single core.
+n_workers = 24
 
-#%% Load in data.
-#Get the patient ids.
-comp = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'),
-                   usecols=['patientunitstayid','bad_disch_plan'])
+#Whether to do the 12 1-hour intervals of each signal in one extraction.
+hourly_single_extraction = True
 
-#Get LOS.
-pat = pd.read_csv(eicu_path.joinpath('patient.csv'),
-                  usecols=['patientunitstayid','unitdischargeoffset'])
-pat = pat[pat['patientunitstayid'].isin(comp['patientunitstayid'])]
-comp = comp.merge(pat,on='patientunitstayid',how='left')
-comp.rename(columns={'unitdischargeoffset':'LOS'},inplace=True)
+#Folder with a previous run's <signal>_<timeframe>.csv files. If given, only
+#the features in those files get calculated (mostly in NumPy, see
+#pts_feature_calculators.py), and select_features is skipped. Use a different
+#folder than this one, or the old files count as already done.
+feature_set_folder = None
 
 #Get all PTS column names.
 cols = ['sao2','heartrate','respiration','allsystolic','alldiastolic','allmean']
 
-#%% Get different start/stop times. 
+#File to track progress.
+progress_file = "pts_extraction_progress.txt"
 
-# Store column names without start/end in here. 
-timeframes = []
+#%% Get different start/stop times.
+def make_timeframes(comp):
+    # Store column names without start/end in here.
+    timeframes = []
+    hourly = []
 
-# Last 1,3,6,12,24,36 hours pre-discharge.
-for hours in [1,3,6,12,24,36]:
-    col_str = str(hours) + 'beforedisch'
-    comp[col_str + 'start'] = comp['LOS'] - (hours*60)
-    comp[col_str + 'end'] = comp['LOS']
-    timeframes.append(col_str)
-# 12 1-hour intervals before discharge. 
-for hours in list(range(1,13)):
-    col_str = '1hrinterval' + str(hours) + 'hrbeforedisch'
-    comp[col_str + 'start'] = comp['LOS'] - (hours * 60)
-    comp[col_str + 'end'] = comp[col_str + 'start'] + 60
-    timeframes.append(col_str)
+    # Last 1,3,6,12,24,36 hours pre-discharge.
+    for hours in [1,3,6,12,24,36]:
+        col_str = str(hours) + 'beforedisch'
+        comp[col_str + 'start'] = comp['LOS'] - (hours*60)
+        comp[col_str + 'end'] = comp['LOS']
+        timeframes.append(col_str)
+    # 12 1-hour intervals before discharge.
+    for hours in list(range(1,13)):
+        col_str = '1hrinterval' + str(hours) + 'hrbeforedisch'
+        comp[col_str + 'start'] = comp['LOS'] - (hours * 60)
+        comp[col_str + 'end'] = comp[col_str + 'start'] + 60
+        timeframes.append(col_str)
+        hourly.append(col_str)
+    return comp, timeframes, hourly
 
-#File to track progress.
-f = open("pts_extraction_progress.txt", "w")
-f.close()
+#%% Slicing windows out of a signal.
+def load_signal(col):
+    #Load the pre-processed PTS data.
+    #Pre-processing already removed patient stays I don't care about.
+    pts = pd.read_csv('pre-processed_' + col +'.csv',
+                      usecols=['patientunitstayid','observationoffset',col])
 
-#%% Calculate features. 
-for timeframe in timeframes:
-    for col in cols:
-        #Load the pre-processed PTS data. 
-        pts = pd.read_csv('pre-processed_' + col +'.csv')
-        #Pre-processing already removed patient stays I don't care about.
-        
-        # Get the relevant window of pts given a start/stop time bound.
-        start_col = timeframe + 'start'
-        end_col = timeframe + 'end'
-        windows = comp[['patientunitstayid',start_col,end_col]]
-        
-        # Drop data outside window. 
-        pts = pts.merge(windows,on='patientunitstayid',how='left')
-        pts = pts[pts['observationoffset'] >= pts[start_col]]
-        pts = pts[pts['observationoffset'] <= pts[end_col]]
-        pts = pts[['patientunitstayid','observationoffset',col]]
-        
-        # Clear out any remaining nans or duplicates, although there shouldn't be any. 
-        pts.dropna(inplace=True)
-        pts.drop_duplicates(inplace=True)
-        
-        #Calculate features. 
-        ext = extract_features(pts, column_id="patientunitstayid", 
-                               column_sort="observationoffset",
-                               n_jobs=24)
-        #Get rid of nan features.
+    # Clear out any remaining nans or duplicates, although there shouldn't be any.
+    pts.dropna(inplace=True)
+    pts.drop_duplicates(inplace=True)
+    pts = pts.sort_values(['patientunitstayid','observationoffset'])
+    pts.reset_index(drop=True, inplace=True)
+
+    # Sort key of each row, stay then offset, so a stay's window is one
+    # contiguous range of rows that can be found with searchsorted.
+    stays = np.unique(pts['patientunitstayid'].values)
+    offsets = pts['observationoffset'].values.astype(float)
+    low = offsets.min() if len(offsets) > 0 else 0
+    span = (offsets.max() - low + 1) if len(offsets) > 0 else 1
+    rank = np.searchsorted(stays, pts['patientunitstayid'].values)
+    return {'col':col,
+            'data':pts,
+            'stays':stays,
+            'low':low,
+            'span':span,
+            'key':rank*span + (offsets - low)}
+
+def slice_window(signal, windows, start_col, end_col):
+    # Get the relevant window of pts given a start/stop time bound.
+    # Same as keeping start <= observationoffset <= end for each stay.
+    windows = windows.dropna(subset=[start_col,end_col])
+    windows = windows[windows['patientunitstayid'].isin(signal['stays'])]
+    rank = np.searchsorted(signal['stays'], windows['patientunitstayid'].values)
+    # Clipping keeps out of range windows from running into the next stay.
+    start = np.clip(windows[start_col].values - signal['low'], 0, signal['span'])
+    end = np.clip(windows[end_col].values - signal['low'], -1, signal['span'] - 1)
+    first = np.searchsorted(signal['key'], rank*signal['span'] + start, 'left')
+    last = np.searchsorted(signal['key'], rank*signal['span'] + end, 'right')
+    lengths = np.maximum(last - first, 0)
+    # Row numbers of every window's range, in one array.
+    rows = (np.arange(lengths.sum()) +
+            np.repeat(first - np.concatenate([[0], np.cumsum(lengths)[:-1]]),
+                      lengths))
+    return signal['data'].iloc[rows]
+
+#%% Jobs.
+def out_file(col, timeframe):
+    return col + '_' + timeframe + '.csv'
+
+def save_features(feat, col, timeframe):
+    # Write to a temp file first, so a crash never leaves a partial csv that
+    # looks finished.
+    temp_file = out_file(col, timeframe) + '.tmp'
+    feat.to_csv(temp_file)
+    os.replace(temp_file, out_file(col, timeframe))
+
+def select_for_target(ext, target):
+    #Get rid of nan features.
+    impute(ext)
+
+    #Ensure IDs in data and target series match.
+    pts_ids = ext.index.drop_duplicates()
+    temp_target = target[target.index.isin(pts_ids)]
+
+    #Pick ones with relevant p-values.
+    return select_features(ext,temp_target)
+
+def timeframe_job(pts, col, timeframe, target, feature_names=None):
+    #Just calculate the features from the previous run.
+    if feature_names is not None:
+        ext = compute_features(pts, col, feature_names)
         impute(ext)
-        
-        #Ensure IDs in data and target series match.
-        pts_ids = ext.index.drop_duplicates()
-        temp_comp = comp[comp['patientunitstayid'].isin(pts_ids)]
-        temp_comp= temp_comp.set_index('patientunitstayid')['bad_disch_plan']
-        
-        #Pick ones with relevant p-values.
-        feat = select_features(ext,temp_comp)
-        
-        feat.to_csv(col + '_' + timeframe + '.csv')
-        
-        # Track progress in txt file.
-        f = open("pts_extraction_progress.txt", "a")
-        f.write(col + '_' + timeframe + ' done! ' + str(time()-start) + 
+        save_features(ext, col, timeframe)
+        return [timeframe]
+
+    #Calculate features.
+    ext = extract_features(pts, column_id="patientunitstayid",
+                           column_sort="observationoffset",
+                           n_jobs=0, disable_progressbar=True)
+    save_features(select_for_target(ext, target), col, timeframe)
+    return [timeframe]
+
+def hourly_job(pts, col, hourly, target, feature_names=None):
+    # Each row is in a segment made from its stay and which hour it's in,
+    # stay*100 + hour. Rows right on an hour boundary are in both hours.
+    pts = pts.assign(patientunitstayid=pts['patientunitstayid']*100 +
+                     pts['hour']).drop(columns=['hour'])
+    if feature_names is not None:
+        # Every hour's features, calculated for all the segments.
+        all_names = list(dict.fromkeys(name for timeframe in hourly
+                                       for name in feature_names[timeframe]))
+        ext = compute_features(pts, col, all_names)
+    else:
+        ext = extract_features(pts, column_id="patientunitstayid",
+                               column_sort="observationoffset",
+                               n_jobs=0, disable_progressbar=True)
+    hour = ext.index % 100
+    for i, timeframe in enumerate(hourly):
+        # Split back out, as if the hour was extracted on its own.
+        hour_ext = ext[hour == (i + 1)].copy()
+        hour_ext.index = hour_ext.index // 100
+        if feature_names is not None:
+            hour_ext = hour_ext[feature_names[timeframe]]
+            impute(hour_ext)
+            save_features(hour_ext, col, timeframe)
+        else:
+            save_features(select_for_target(hour_ext, target), col, timeframe)
+    return hourly
+
+def is_done(col, timeframes):
+    return all(os.path.exists(out_file(col, timeframe))
+               for timeframe in timeframes)
+
+def get_feature_names(col, timeframe):
+    if feature_set_folder is None:
+        return None
+    return read_feature_names(col, timeframe, feature_set_folder)
+
+def make_jobs(comp, timeframes, hourly):
+    # Yields (function, args) for each job that still needs doing, loading
+    # each signal once.
+    target = comp.set_index('patientunitstayid')['bad_disch_plan']
+    for col in cols:
+        single = [timeframe for timeframe in timeframes
+                  if not (hourly_single_extraction & (timeframe in hourly))]
+        single = [timeframe for timeframe in single
+                  if not is_done(col, [timeframe])]
+        do_hourly = hourly_single_extraction & (not is_done(col, hourly))
+        if (len(single) == 0) & (not do_hourly):
+            continue
+
+        signal = load_signal(col)
+        for timeframe in single:
+            windows = comp[['patientunitstayid',timeframe + 'start',
+                            timeframe + 'end']]
+            pts = slice_window(signal, windows, timeframe + 'start',
+                               timeframe + 'end')
+            yield timeframe_job, (pts, col, timeframe, target,
+                                  get_feature_names(col, timeframe))
+
+        if do_hourly:
+            pts_list = []
+            for i, timeframe in enumerate(hourly):
+                windows = comp[['patientunitstayid',timeframe + 'start',
+                                timeframe + 'end']]
+                pts = slice_window(signal, windows, timeframe + 'start',
+                                   timeframe + 'end')
+                pts_list.append(pts.assign(hour=i + 1))
+            names = None
+            if feature_set_folder is not None:
+                names = {timeframe:get_feature_names(col, timeframe)
+                         for timeframe in hourly}
+            yield hourly_job, (pd.concat(pts_list, ignore_index=True), col,
+                               hourly, target, names)
+        del signal
+
+def log_progress(col, timeframes):
+    # Track progress in txt file.
+    f = open(progress_file, "a")
+    for timeframe in timeframes:
+        f.write(col + '_' + timeframe + ' done! ' + str(time()-start) +
                 ' seconds since code started\n')
-        f.close()
+    f.close()
+
+def run_jobs(comp, timeframes, hourly):
+    # Only keep a couple jobs per worker waiting, so all the windows' data
+    # isn't held in memory at once.
+    jobs = make_jobs(comp, timeframes, hourly)
+    running = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for func, args in jobs:
+            while len(running) >= 2*n_workers:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    log_progress(running.pop(future), future.result())
+            running[pool.submit(func, *args)] = args[1]
+        for future in wait(running).done:
+            log_progress(running[future], future.result())
+
+#%% Calculate features.
+if __name__ == '__main__':
+    print(file_path)
+
+    #Get the patient ids.
+    comp = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'),
+                       usecols=['patientunitstayid','bad_disch_plan'])
+
+    #Get LOS.
+    pat = load_table('patient',
+                     columns=['patientunitstayid','unitdischargeoffset'])
+    pat = pat[pat['patientunitstayid'].isin(comp['patientunitstayid'])]
+    comp = comp.merge(pat,on='patientunitstayid',how='left')
+    comp.rename(columns={'unitdischargeoffset':'LOS'},inplace=True)
+
+    comp, timeframes, hourly = make_timeframes(comp)
+
+    run_jobs(comp, timeframes, hourly)
 
-    
-calc = time() - start
\ No newline at end of file
+    calc = time() - start
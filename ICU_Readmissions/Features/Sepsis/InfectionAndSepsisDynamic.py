@@ -18,6 +18,7 @@ Run time: ~15 sec
 def full_script():
     
     #%% Package setup
+    import sys
     import pandas as pd
     import numpy as np
     import time
@@ -29,6 +30,10 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(file_path.parent.parent))
+    from obs_windows import filter_to_window
     
     #%% Load in data. 
     
@@ -36,8 +41,9 @@ def full_script():
     pat_stays = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=pat_stays['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     pat_stays = pat_stays.merge(pat,on='patientunitstayid',how='left')
@@ -45,9 +51,10 @@ def full_script():
     pat_stays['start'] = 0
     
     #Just get diagnosis data. 
-    infect_data = pd.read_csv(eicu_path.joinpath("diagnosis.csv"),
-                              usecols=['patientunitstayid','diagnosisoffset',
-                                       'diagnosisstring','icd9code'])
+    infect_data = load_table("diagnosis",
+                             columns=['patientunitstayid','diagnosisoffset',
+                                      'diagnosisstring','icd9code'],
+                             stay_ids=pat_stays['patientunitstayid'])
     
     #Get SOFA data.
     sofa = pd.read_csv('suspected_sepsis.csv')
@@ -66,21 +73,7 @@ def full_script():
             pat_stays['patientunitstayid'])]
     
     #Drop data after the observation window for each patient. 
-    lookup = pat_stays.set_index('patientunitstayid')
-    def keep_row(current_ID,offset):
-        #Get window time stamps.
-        window_start = lookup.loc[current_ID,'start']
-        window_end = lookup.loc[current_ID,'end']
-        #If the infection took place before/in window, keep it. 
-        if (offset <= window_end):
-            return 1
-        else:
-            return 0
-    
-    infect_data['keep'] = infect_data.apply(
-        lambda row: keep_row(
-            row['patientunitstayid'],row['diagnosisoffset']),axis=1)
-    infect_data = infect_data[infect_data['keep']==1]
+    infect_data = filter_to_window(infect_data,pat_stays,'diagnosisoffset')
     
     #Make it all lowercase.
     infect_data = infect_data.applymap(
@@ -5,7 +5,7 @@ Created on Mon Mar 15 13:31:20 2021
 Calculates sofa scores and whether a patient has suspected Sepsis/septic shock
 based on the SOFA criteria. 
 
-Runtime: 15 minutes.
+Runtime: 1 minute.
 
 @author: Kirby
 """
@@ -21,11 +21,17 @@ def full_script():
     start = time()
     filepath = Path(__file__)
     eicu_path = filepath.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(filepath.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(filepath.parent.parent.joinpath('NurseCharting')))
+    from NurseChartingScan import load_nursecharting_subset
+    sys.path.append(str(filepath.parent.parent))
+    from string_matcher import compile_patterns, contains
+    from obs_windows import filter_to_window
     cohort_path = filepath.parent.parent.parent.joinpath('Cohort')
     
     # Set file paths
     inp_filename = cohort_path.joinpath("ICU_readmissions_dataset.csv")
-    nurseCharting_file = eicu_path.joinpath("nurseCharting_delirium.csv")
     sbp_file = eicu_path.joinpath("isys_delirium.csv")
     mbp_file = eicu_path.joinpath("imean_delirium.csv")
     resp_file = eicu_path.joinpath("resp_delirium.csv")
@@ -54,177 +60,105 @@ def full_script():
         feature = pd.concat([feature_df, df]) 
         return feature
     
-    # Generate the result of variables found in nurseCharting
-    # Used for SBP, MBP, RESP
-    def result_nurseCharting(row, df):
-        temp = df[df['patientunitstayid'] == row['patientunitstayid']]
-        temp = temp[(temp['offset'] >= (row['end']-1440)) & (temp['offset'] <= row['end'])]
-        return np.amin(temp.dropna(subset = ['value'])['value'])
-    
-    # Generate the result of variables found in nurseCharting
-    # Used for GCS
-    def result_nurseCharting2(row, df):
-        temp = df[df['patientunitstayid'] == row['patientunitstayid']]
-        temp = temp[(temp['nursingchartoffset'] >= (row['end']-1440)) & (temp['nursingchartoffset'] <= row['end'])]
-        return np.amin(temp.dropna(subset = ['nursingchartvalue'])['nursingchartvalue'])
-    
-    # Generate the result of variables found in lab
-    # Used for PaO2, FiO2, Bilirubin, Platelets, Creatinine, Lactate
-    def result_lab(row, df):
-        temp = df[df['patientunitstayid'] == row['patientunitstayid']]
-        temp = temp[(temp['labresultrevisedoffset'] >= (row['end']-1440)) & (temp['labresultrevisedoffset'] <= row['end'])]
-        return np.amin(temp.dropna(subset = ['labresult'])['labresult'])
-    
-    # Generate the result of variables found in intakeOutput
-    # Used for Urine
-    def result_intakeOutput(row, df):
-        temp = df[df['patientunitstayid'] == row['patientunitstayid']]
-        temp = temp[(temp['intakeoutputoffset'] >= (row['end']-1440)) & (temp['intakeoutputoffset'] <= row['end'])]
-        return np.sum(temp.dropna(subset = ['cellvaluenumeric'])['cellvaluenumeric'])
-    
-    # Generate the result of vasopressors
-    def result_vasopressors(row):
-        vs1 = vasopressors1[vasopressors1['patientunitstayid'] == row['patientunitstayid']]
-        vs1 = vs1[(vs1['infusionoffset'] >= (row['end']-1440)) & (vs1['infusionoffset'] <= row['end'])]
-        vs2 = vasopressors2[vasopressors2['patientunitstayid'] == row['patientunitstayid']]
-        vs2 = vs2[(vs2['drugstartoffset'] >= (row['end']-1440)) & (vs2['drugstartoffset'] <= row['end'])]
-        vs3 = vasopressors3[vasopressors3['patientunitstayid'] == row['patientunitstayid']]
-        vs3 = vs3[(vs3['treatmentoffset'] >= (row['end']-1440)) & (vs3['treatmentoffset'] <= row['end'])]
-        return ((len(vs1)+len(vs2)+len(vs3)) > 0)
-    
-    # Generate the result of ventilator
-    def result_ventilator(row):
-        temp = ventilator[ventilator['patientunitstayid'] == row['patientunitstayid']]
-        temp = temp[(temp['hrs'] >= (row['end']-1440)) & (temp['hrs'] <= row['end'])]
-        return (len(temp) > 0)
+    # Get the rows in the last 24 hours of each stay's observation window
+    def last_day(df, offset_col):
+        return filter_to_window(df, day_windows, offset_col, start_col = 'day_start')
+    
+    # Summarize each stay's values in the last 24 hours of its window, as a
+    # column lined up with pids. Stays without values get NaN for min, 0 for sum.
+    # Used for SBP, MBP, RESP, GCS, and Urine
+    def last_day_stat(df, offset_col, value_col, how):
+        df = last_day(df, offset_col).dropna(subset = [value_col])
+        stat = df.groupby('patientunitstayid')[value_col].agg(how)
+        result = pids['patientunitstayid'].map(stat)
+        if how == 'sum':
+            result = result.fillna(0)
+        return result.values
+    
+    # Check if each stay had any rows in the last 24 hours of its window
+    # Used for Vasopressors and ventilator
+    def last_day_any(df, offset_col):
+        return pids['patientunitstayid'].isin(last_day(df, offset_col)['patientunitstayid']).values
     
     # Generate SOFA score and component features
-    def SOFA_score(row):
+    def SOFA_score(df):
         
         # Resp: (PaO2/FiO2, ventilation) into "sofa_resp" 
-        sofa_resp = 0
-        if ((not np.isnan(row['paO2'])) and (not np.isnan(row['fiO2']))):
-            try:
-                paO2_fiO2_ratio = row['paO2']/row['fiO2']
-            except ZeroDivisionError:
-                paO2_fiO2_ratio = 1000
-            if (paO2_fiO2_ratio < 100 and row['ventilator']):
-                sofa_resp = 4
-            elif (paO2_fiO2_ratio < 200 and row['ventilator']):
-                sofa_resp = 3
-            elif (paO2_fiO2_ratio < 300):
-                sofa_resp = 2
-            elif (paO2_fiO2_ratio < 400):
-                sofa_resp = 1
+        # Dividing by 0 gives inf, which scores 0 like before.
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            paO2_fiO2_ratio = df['paO2'].values/df['fiO2'].values
+        ventilator = df['ventilator'].values
+        sofa_resp = np.select([(paO2_fiO2_ratio < 100) & ventilator,
+                               (paO2_fiO2_ratio < 200) & ventilator,
+                               paO2_fiO2_ratio < 300,
+                               paO2_fiO2_ratio < 400],
+                              [4, 3, 2, 1], 0)
                 
         # Nervous: (GCS) into "sofa_nervous"
-        sofa_nervous = 0
-        if (not np.isnan(row['gcs'])):
-            if (row['gcs'] < 6):
-                sofa_nervous = 4
-            elif (row['gcs'] < 10 and row['gcs'] >= 6):
-                sofa_nervous = 3
-            elif (row['gcs'] < 13 and row['gcs'] >= 10):
-                sofa_nervous = 2
-            elif (row['gcs'] < 15 and row['gcs'] >= 13):
-                sofa_nervous = 1
+        gcs = df['gcs'].values
+        sofa_nervous = np.select([gcs < 6, gcs < 10, gcs < 13, gcs < 15],
+                                 [4, 3, 2, 1], 0)
                 
         # Cardio: (MBP, vasopressors) into "sofa_cardio"
-        sofa_cardio = 0
-        if ((not np.isnan(row['mbp'])) and (row['mbp'] < 70)):
-            sofa_cardio = 1
-        if (row['vasopressors']):
-            sofa_cardio = 2
+        sofa_cardio = np.select([df['vasopressors'].values, df['mbp'].values < 70],
+                                [2, 1], 0)
         
         # Liver: (bilirubin) into "sofa_liver"
-        sofa_liver = 0
-        if (not np.isnan(row['bilirubin'])):
-            if (row['bilirubin'] >= 12):
-                sofa_liver = 4
-            elif (row['bilirubin'] >= 6 and row['bilirubin'] < 12):
-                sofa_liver = 3
-            elif (row['bilirubin'] >= 2 and row['bilirubin'] < 6):
-                sofa_liver = 2
-            elif (row['bilirubin'] >= 1.2 and row['bilirubin'] < 2):
-                sofa_liver = 1
+        bilirubin = df['bilirubin'].values
+        sofa_liver = np.select([bilirubin >= 12, bilirubin >= 6, bilirubin >= 2,
+                                bilirubin >= 1.2],
+                               [4, 3, 2, 1], 0)
         
         # Coag: (platelets) into "sofa_coag"
-        sofa_coag = 0
-        if (not np.isnan(row['platelets'])):
-            if (row['platelets'] < 20):
-                sofa_coag = 4
-            elif (row['platelets'] < 50):
-                sofa_coag = 3
-            elif (row['platelets'] < 100):
-                sofa_coag = 2
-            elif (row['platelets'] < 150):
-                sofa_coag = 1
+        platelets = df['platelets'].values
+        sofa_coag = np.select([platelets < 20, platelets < 50, platelets < 100,
+                               platelets < 150],
+                              [4, 3, 2, 1], 0)
         
         # Kidneys: (creatinine and urine output) into "sofa_kidney"
-        sofa_kidney = 0
-        if (not np.isnan(row['creatinine'])):
-            if (row['creatinine'] >= 5):
-                sofa_kidney = 4
-            elif (row['creatinine'] >= 3.4 and row['creatinine'] < 5):
-                sofa_kidney = 3
-            elif (row['creatinine'] >= 2 and row['creatinine'] < 3.4):
-                sofa_kidney = 2
-            elif (row['creatinine'] >= 1.2 and row['creatinine'] < 2):
-                sofa_kidney = 1
-        elif (not np.isnan(row['urine'])):
-            if (row['urine'] <= 200):
-                sofa_kidney = 4
-            elif (row['urine'] <= 500):
-                sofa_kidney = 3
+        # Urine is only used when there's no creatinine.
+        creatinine = df['creatinine'].values
+        urine = df['urine'].values
+        sofa_kidney = np.select([creatinine >= 5, creatinine >= 3.4,
+                                 creatinine >= 2, creatinine >= 1.2,
+                                 ~np.isnan(creatinine),
+                                 urine <= 200, urine <= 500],
+                                [4, 3, 2, 1, 0, 4, 3], 0)
                 
         temp_sofa_score = sofa_resp + sofa_nervous + sofa_cardio + sofa_liver + sofa_coag + sofa_kidney
         
         return sofa_resp, sofa_nervous, sofa_cardio, sofa_liver, sofa_coag, sofa_kidney, temp_sofa_score
     
     # Generate qSOFA score and component features
-    def qSOFA_score(row):
+    def qSOFA_score(df):
         
         # GCS
-        if row['sofa_nervous'] == 0:
-            altered_mental_state = False
-        else:
-            altered_mental_state = True
+        altered_mental_state = df['sofa_nervous'].values != 0
             
         # Resp
-        resp_rate = False
-        if ((not np.isnan(row['resp'])) and (row['resp'] >= 22)):
-            resp_rate = True
+        resp_rate = df['resp'].values >= 22
          
         # Systolic
-        sys_bp = False
-        if ((not np.isnan(row['sbp'])) and (row['sbp'] <= 100)):
-            sys_bp = True
+        sys_bp = df['sbp'].values <= 100
          
-        qSOFA = altered_mental_state + resp_rate + sys_bp
+        qSOFA = altered_mental_state.astype(int) + resp_rate + sys_bp
         
         return altered_mental_state, resp_rate, sys_bp, qSOFA
     
     # Generate sepsis and component features
-    def sepsis(row):
+    def sepsis(df):
         
         # Sepsis suspected
-        if (row['sofa_score'] >= 2 and row['qsofa_score'] >= 2):
-            suspected_sepsis = True
-        else:
-            suspected_sepsis = False
+        suspected_sepsis = (df['sofa_score'].values >= 2) & (df['qsofa_score'].values >= 2)
             
         # Lactate
-        sepsis_lactate = False
-        if ((not np.isnan(row['lactate'])) and (row['lactate'] > 2)):
-            sepsis_lactate = True
+        sepsis_lactate = df['lactate'].values > 2
     
         # MBP
-        sepsis_map = False
-        if ((not np.isnan(row['mbp'])) and (row['mbp'] >= 65)):
-            sepsis_map = True
+        sepsis_map = df['mbp'].values >= 65
             
         # Septic shock suspected
-        suspected_septic_shock = (suspected_sepsis and sepsis_lactate and sepsis_map)
+        suspected_septic_shock = suspected_sepsis & sepsis_lactate & sepsis_map
       
         return suspected_sepsis, sepsis_lactate, sepsis_map, suspected_septic_shock
     
@@ -233,43 +167,50 @@ def full_script():
     pids = pd.read_csv(inp_filename)
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=pids['patientunitstayid'])
     
     # Attach LOS as end, make admission start of window. 
     pids = pids.merge(pat,on='patientunitstayid',how='left')
     pids.rename(columns={'unitdischargeoffset':'end'},inplace=True)
     pids['start'] = 0
     
+    # Windows for the last 24 hours of each stay's observation window
+    day_windows = pids[['patientunitstayid', 'end']].copy()
+    day_windows['day_start'] = day_windows['end'] - 1440
+    
     # Load Nurse Charting to "nurseCharting"
     # Used for SBP, MBP, RESP, GCS
-    nurseCharting = pd.read_csv(nurseCharting_file)
-    nurseCharting = nurseCharting[nurseCharting['patientunitstayid'].isin(pids['patientunitstayid'])]
+    nurseCharting = pd.concat([
+        load_nursecharting_subset('vitals', stay_ids=pids['patientunitstayid']),
+        load_nursecharting_subset('gcs', stay_ids=pids['patientunitstayid'])],
+        ignore_index=True)
     nurseCharting['nursingchartoffset'] = pd.to_numeric(nurseCharting['nursingchartoffset'],errors='coerce')
     nurseCharting['nursingchartvalue'] = pd.to_numeric(nurseCharting['nursingchartvalue'],errors='coerce')
     
     # SBP (Systolic Blood Pressure) to "sbp"
     sbp = pd.read_csv(sbp_file)
     sbp = combine_nurseCharting(sbp, 'bp systolic')
-    pids['sbp'] = pids.apply(lambda row: result_nurseCharting(row, sbp), axis=1)
+    pids['sbp'] = last_day_stat(sbp, 'offset', 'value', 'min')
     del sbp
     
     # MBP (Mean Blood Pressure) to "mbp"
     mbp = pd.read_csv(mbp_file)
     mbp = combine_nurseCharting(mbp, 'bp mean')
-    pids['mbp'] = pids.apply(lambda row: result_nurseCharting(row, mbp), axis=1)
+    pids['mbp'] = last_day_stat(mbp, 'offset', 'value', 'min')
     del mbp
     
     # RESP (Respiratory Rate) to "resp"
     resp = pd.read_csv(resp_file)
     resp = combine_nurseCharting(resp, 'respiratory rate')
-    pids['resp'] = pids.apply(lambda row: result_nurseCharting(row, resp), axis=1)
+    pids['resp'] = last_day_stat(resp, 'offset', 'value', 'min')
     del resp
     
     # GCS (Glasgow Coma Score) into "gcs"
     gcs = nurseCharting[nurseCharting['nursingchartcelltypevallabel'] == 'Glasgow coma score']
     gcs = gcs[gcs['nursingchartcelltypevalname'] == 'GCS Total']
-    pids['gcs'] = pids.apply(lambda row: result_nurseCharting2(row, gcs), axis=1)
+    pids['gcs'] = last_day_stat(gcs, 'nursingchartoffset', 'nursingchartvalue', 'min')
     del gcs
     
     del nurseCharting
@@ -279,35 +220,19 @@ def full_script():
     lab = pd.read_csv(lab_file)
     lab = lab[lab['patientunitstayid'].isin(pids['patientunitstayid'])]
     
-    # PaO2 (Partial Pressure of Oxygen) to "paO2"
-    paO2 = lab[lab['labname'] == "paO2"]
-    pids['paO2'] = pids.apply(lambda row: result_lab(row, paO2), axis=1)
-    del paO2
-    
-    # FiO2 (Fraction of Inspired Oxygen) to "fiO2"
-    fiO2 = lab[lab['labname'] == "FiO2"]
-    pids['fiO2'] = pids.apply(lambda row: result_lab(row, fiO2), axis=1)
-    del fiO2
-    
-    # Bilirubin into "bilirubin"
-    bilirubin = lab[lab['labname'] == "direct bilirubin"]
-    pids['bilirubin'] = pids.apply(lambda row: result_lab(row, bilirubin), axis=1)
-    del bilirubin
-    
-    # Platelets into "platelets"
-    platelets = lab[lab['labname'] == "platelets x 1000"]
-    pids['platelets'] = pids.apply(lambda row: result_lab(row, platelets), axis=1)
-    del platelets
-    
-    # Creatinine into "creatinine"
-    creatinine = lab[lab['labname'] == "creatinine"]
-    pids['creatinine'] = pids.apply(lambda row: result_lab(row, creatinine), axis=1)
-    del creatinine
-    
-    # Lactate into "lactate"
-    lactate = lab[lab['labname'] == "lactate"]
-    pids['lactate'] = pids.apply(lambda row: result_lab(row, lactate), axis=1)
-    del lactate
+    # Lowest value of each lab in the last 24 hours, all labs at once
+    lab_names = {'paO2':"paO2",                    # PaO2 (Partial Pressure of Oxygen) to "paO2"
+                 'fiO2':"FiO2",                    # FiO2 (Fraction of Inspired Oxygen) to "fiO2"
+                 'bilirubin':"direct bilirubin",   # Bilirubin into "bilirubin"
+                 'platelets':"platelets x 1000",   # Platelets into "platelets"
+                 'creatinine':"creatinine",        # Creatinine into "creatinine"
+                 'lactate':"lactate"}              # Lactate into "lactate"
+    lab = lab[lab['labname'].isin(lab_names.values())]
+    lab = last_day(lab, 'labresultrevisedoffset').dropna(subset = ['labresult'])
+    lab = lab.groupby(['patientunitstayid', 'labname'])['labresult'].min().unstack()
+    lab = lab.reindex(columns = list(lab_names.values()))
+    for col, lab_name in lab_names.items():
+        pids[col] = pids['patientunitstayid'].map(lab[lab_name]).values
     
     del lab
     
@@ -318,7 +243,7 @@ def full_script():
     
     # Urine into "urine"
     urine = intakeOutput[intakeOutput['celllabel'] == "Urine"]
-    pids['urine'] = pids.apply(lambda row: result_intakeOutput(row, urine), axis=1)
+    pids['urine'] = last_day_stat(urine, 'intakeoutputoffset', 'cellvaluenumeric', 'sum')
     del intakeOutput, urine
     
     # Load infusiondrug into "infusionDrug"
@@ -343,13 +268,16 @@ def full_script():
     treatment['treatmentoffset'] = pd.to_numeric(treatment['treatmentoffset'],errors='coerce')
     
     # Vasopressors into ""vasopressors1", "vasopressors2", and "vasopressors3"
-    vasopressors1 = infusionDrug[infusionDrug['drugname'].str.contains('dopamine|dobutamine|epinephrine|norepinephrine', case=False)]
-    vasopressors2 = medication[medication['drugname'].str.contains('dopamine|dobutamine|epinephrine|norepinephrine', case=False)]
-    vasopressors3 = treatment[treatment['treatmentstring'].str.contains('dopamine|dobutamine|epinephrine|norepinephrine', case=False)]
+    vasopressor_matcher = compile_patterns(['dopamine', 'dobutamine', 'epinephrine', 'norepinephrine'])
+    vasopressors1 = infusionDrug[contains(vasopressor_matcher, infusionDrug['drugname'])]
+    vasopressors2 = medication[contains(vasopressor_matcher, medication['drugname'])]
+    vasopressors3 = treatment[contains(vasopressor_matcher, treatment['treatmentstring'])]
     
     del infusionDrug, medication, treatment
     
-    pids['vasopressors'] = pids.apply(lambda row: result_vasopressors(row), axis=1)
+    pids['vasopressors'] = (last_day_any(vasopressors1, 'infusionoffset') |
+                            last_day_any(vasopressors2, 'drugstartoffset') |
+                            last_day_any(vasopressors3, 'treatmentoffset'))
     
     del vasopressors1, vasopressors2, vasopressors3
     
@@ -358,12 +286,12 @@ def full_script():
     ventilator = ventilator[ventilator['patientunitstayid'].isin(pids['patientunitstayid'])]
     ventilator = ventilator[ventilator['event'].str.contains('mechvent', case=False)]
     ventilator['hrs'] = ventilator['hrs']*60
-    pids['ventilator'] = pids.apply(lambda row: result_ventilator(row), axis=1)
+    pids['ventilator'] = last_day_any(ventilator, 'hrs')
     del ventilator
     
-    pids['sofa_resp'], pids['sofa_nervous'], pids['sofa_cardio'], pids['sofa_liver'], pids['sofa_coag'], pids['sofa_kidney'], pids['sofa_score'] = zip(*pids.apply(lambda row: SOFA_score(row), axis=1))
-    pids['qsofa_altered_mental'], pids['qsofa_resp_rate'], pids['qsofa_sys_bp'], pids['qsofa_score'] = zip(*pids.apply(lambda row: qSOFA_score(row), axis=1))
-    pids['suspected_sepsis'], pids['sepsis_lactate'], pids['sepsis_map'], pids['suspected_septic_shock'] = zip(*pids.apply(lambda row: sepsis(row), axis=1))
+    pids['sofa_resp'], pids['sofa_nervous'], pids['sofa_cardio'], pids['sofa_liver'], pids['sofa_coag'], pids['sofa_kidney'], pids['sofa_score'] = SOFA_score(pids)
+    pids['qsofa_altered_mental'], pids['qsofa_resp_rate'], pids['qsofa_sys_bp'], pids['qsofa_score'] = qSOFA_score(pids)
+    pids['suspected_sepsis'], pids['sepsis_lactate'], pids['sepsis_map'], pids['suspected_septic_shock'] = sepsis(pids)
     
     # Export to csv
     pids.to_csv(out_filename)
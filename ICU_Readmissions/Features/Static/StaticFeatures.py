@@ -14,6 +14,7 @@ runtime: 10 sec
 def full_script():
     
     #%% Packages
+    import sys
     import numpy as np
     import pandas as pd
     import time as time
@@ -26,32 +27,29 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
     
     #%% Load in needed data.
     
     comp = pd.read_csv(cohort_path.joinpath("ICU_readmissions_dataset.csv"))
     today = datetime.now().replace(hour=0,minute=0,second=0,microsecond=0)
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                                         usecols=['patientunitstayid','age',
-                                                  'gender','ethnicity',
-                                                  'hospitalid',
-                                                  'admissionheight',
-                                                  'hospitaladmittime24',
-                                                  'hospitaladmitoffset',
-                                                  'hospitaladmitsource','unittype',
-                                                  'unitadmittime24',
-                                                  'unitadmitsource',
-                                                  'unitvisitnumber',
-                                                  'admissionweight',
-                                                  'dischargeweight',
-                                                  'unitdischargeoffset'],
-                                         parse_dates=['hospitaladmittime24',
-                                                      'unitadmittime24'])
-    hosp = pd.read_csv(eicu_path.joinpath("hospital.csv"))
-    apache = pd.read_csv(eicu_path.joinpath("apachepatientresult.csv"),
-                                            usecols=['patientunitstayid',
-                                                     'apachescore',
-                                                     'apacheversion'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid','age','gender','ethnicity',
+                              'hospitalid','admissionheight',
+                              'hospitaladmittime24','hospitaladmitoffset',
+                              'hospitaladmitsource','unittype',
+                              'unitadmittime24','unitadmitsource',
+                              'unitvisitnumber','admissionweight',
+                              'dischargeweight','unitdischargeoffset'],
+                     stay_ids=comp['patientunitstayid'])
+    for col in ['hospitaladmittime24','unitadmittime24']:
+        pat[col] = pd.to_datetime(pat[col])
+    hosp = load_table("hospital")
+    apache = load_table("apachepatientresult",
+                        columns=['patientunitstayid','apachescore',
+                                 'apacheversion'],
+                        stay_ids=comp['patientunitstayid'])
     
     #%% Get apache scores.
     apache = apache[apache['apacheversion']=='IV']
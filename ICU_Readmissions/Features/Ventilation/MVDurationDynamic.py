@@ -17,6 +17,7 @@ Run time: 4 minutes
 """
 def full_script():
     #%% Package setup
+    import sys
     import pandas as pd
     import numpy as np
     from time import time
@@ -29,6 +30,12 @@ def full_script():
     file_path = Path(__file__)
     cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
     eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+    sys.path.append(str(file_path.parent.parent.parent))
+    from eicu_tables import load_table
+    sys.path.append(str(file_path.parent.parent.joinpath('NurseCharting')))
+    from NurseChartingScan import load_nursecharting_subset
+    sys.path.append(str(file_path.parent.parent))
+    from string_matcher import compile_patterns, tag_column
     
     #%% Load in data.
     
@@ -39,8 +46,9 @@ def full_script():
     pat_stays = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
     
     #Get patient info table for LOS, serve as end of window. 
-    pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                      usecols=['patientunitstayid', 'unitdischargeoffset'])
+    pat = load_table("patient",
+                     columns=['patientunitstayid', 'unitdischargeoffset'],
+                     stay_ids=pat_stays['patientunitstayid'])
     pat_stays = pat_stays.merge(pat,on='patientunitstayid',how='left')
     pat_stays.rename(columns={'unitdischargeoffset':'end'},inplace=True)
     pat_stays['start'] = 0
@@ -50,20 +58,22 @@ def full_script():
     #                    usecols=['patientunitstayid','physicalexamoffset',
     #                             'physicalexamtext'])
     #Get treatment
-    treat = pd.read_csv(eicu_path.joinpath("treatment.csv"),
-                        usecols=['patientunitstayid','treatmentoffset',
-                                'treatmentstring'])
+    treat = load_table("treatment",
+                       columns=['patientunitstayid','treatmentoffset',
+                                'treatmentstring'],
+                       stay_ids=pat_stays['patientunitstayid'])
     
     #Get respiratorycharting
-    resp = pd.read_csv(eicu_path.joinpath("respiratoryCharting.csv"),
-                       usecols=['patientunitstayid','respchartoffset',
-                                'respchartvaluelabel','respchartvalue'])
+    resp = load_table("respiratoryCharting",
+                      columns=['patientunitstayid','respchartoffset',
+                               'respchartvaluelabel','respchartvalue'],
+                      stay_ids=pat_stays['patientunitstayid'])
     
-    #Get nursecharting
-    nurse = pd.read_csv(eicu_path.joinpath("nurseCharting.csv"),
-                       usecols=['patientunitstayid','nursingchartoffset',
-                                'nursingchartcelltypevallabel',
-                                'nursingchartvalue'])
+    #Get nursecharting, just the rows with ventilation/o2 therapy strings.
+    nurse = load_nursecharting_subset('ventilation',
+                                      stay_ids=pat_stays['patientunitstayid'])
+    nurse = nurse[['patientunitstayid','nursingchartoffset',
+                   'nursingchartcelltypevallabel','nursingchartvalue']]
     
     #%% Pre-processing
     #Only keep the stays we care about and add obs window times. 
@@ -96,17 +106,23 @@ def full_script():
                                'respchartvalue':'string'},inplace=True)
     comb = pd.concat([comb,resp_label,resp_value])
     
+    #Search all the strings for everything below at once.
+    vent_words = pd.read_csv('ventilation_search_strings.csv')
+    vent_words = list(vent_words['string'])
+    o2_words = pd.read_csv('o2therapy_search_strings.csv')
+    o2_words = list(o2_words['string'])
+    matcher = compile_patterns({'vent':['vent'],
+                                'wake':['Wake up assessment'],
+                                'vent_words':vent_words,
+                                'o2_words':o2_words})
+    tags = tag_column(matcher,comb['string'])
+    
     #%%Find mechanical ventilation starts/settings, indicating it was going.
     
     #Find rows containing "vent" but not "Wake up assessment"
-    comb_mv = comb[comb['string'].str.contains('vent',case=False,na=False)]
-    comb_mv = comb_mv[~comb_mv['string'].str.contains(
-        'Wake up assessment',case=False,na=False)]
+    comb_mv = comb[tags['vent'].values & ~tags['wake'].values]
     #Combine with other searched rows.
-    vent_words = pd.read_csv('ventilation_search_strings.csv')
-    vent_words = list(vent_words['string'])
-    temp = comb[comb['string'].str.contains(
-        '|'.join(vent_words),case=False,na=False)]
+    temp = comb[tags['vent_words'].values]
     
     #Add in the MV info from treatment and physical exam. 
     # phys_mv = phys[phys['physicalexamtext']=='ventilated'].copy()
@@ -125,10 +141,7 @@ def full_script():
     
     #Find oxygen therapy, also indicating stops. 
     #From respiratorycare or nurse charting.
-    o2_words = pd.read_csv('o2therapy_search_strings.csv')
-    o2_words = list(o2_words['string'])
-    comb_o2 = comb[comb['string'].str.contains('|'.join(o2_words),
-                                               case=False,na=False)]
+    comb_o2 = comb[tags['o2_words'].values]
     #From treatment.
     treat_o2 = treat[treat['treatmentstring'].str.contains(
         'oxygen therapy|non-invasive ventilation',case=False)].copy()
@@ -15,6 +15,7 @@ Run time: 2 minutes
 @author: Kirby
 """
 #%% Package setup
+import sys
 import pandas as pd
 import numpy as np
 import time
@@ -26,6 +27,10 @@ start_timer = time.time()
 file_path = Path(__file__)
 cohort_path = file_path.parent.parent.parent.joinpath('Cohort')
 eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
+sys.path.append(str(file_path.parent.parent.parent))
+from eicu_tables import load_table
+sys.path.append(str(file_path.parent.parent))
+from obs_windows import filter_to_window
 
 #%% Load in data.
 
@@ -34,8 +39,8 @@ eicu_path = file_path.parent.parent.parent.parent.joinpath('eicu')
 pat_stays = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
 
 #Get patient info table for LOS, serve as end of window. 
-pat = pd.read_csv(eicu_path.joinpath("patient.csv"),
-                  usecols=['patientunitstayid', 'unitdischargeoffset'])
+pat = load_table("patient",
+                 columns=['patientunitstayid', 'unitdischargeoffset'])
 
 # Attach LOS as end, make admission start of window. 
 pat_stays = pat_stays.merge(pat,on='patientunitstayid',how='left')
@@ -43,37 +48,21 @@ pat_stays.rename(columns={'unitdischargeoffset':'end'},inplace=True)
 pat_stays['start'] = 0
 
 #Get physicalexam data.
-phys = pd.read_csv(eicu_path.joinpath("physicalexam.csv"),
-                   usecols=['patientunitstayid','physicalexamoffset',
-                            'physicalexamtext'])
+phys = load_table("physicalexam",
+                  columns=['patientunitstayid','physicalexamoffset',
+                           'physicalexamtext'])
 #Get treatment
-treat = pd.read_csv(eicu_path.joinpath("treatment.csv"),
-                    usecols=['patientunitstayid','treatmentoffset',
-                            'treatmentstring'])
+treat = load_table("treatment",
+                   columns=['patientunitstayid','treatmentoffset',
+                           'treatmentstring'])
 #%% Get feature and save it off.
 #Only keep the stays we care about.
 phys = phys[phys['patientunitstayid'].isin(pat_stays['patientunitstayid'])]
 treat = treat[treat['patientunitstayid'].isin(pat_stays['patientunitstayid'])]
 
 #Drop data after the observation window for each patient. 
-lookup = pat_stays.set_index('patientunitstayid')
-def keep_row(current_ID,offset):
-    #Get window time stamps.
-    window_start = lookup.loc[current_ID,'start']
-    window_end = lookup.loc[current_ID,'end']
-    #If the ventilation took place before/in window, keep it. 
-    if (offset <= window_end):
-        return 1
-    else:
-        return 0
-
-phys['keep'] = phys.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['physicalexamoffset']),axis=1)
-treat['keep'] = treat.apply(lambda row: keep_row(
-        row['patientunitstayid'],row['treatmentoffset']),axis=1)
-
-phys = phys[phys['keep']==1]
-treat = treat[treat['keep']==1]
+phys = filter_to_window(phys,pat_stays,'physicalexamoffset')
+treat = filter_to_window(treat,pat_stays,'treatmentoffset')
 
 #Get ventilation data.
 phys = phys[phys['physicalexamtext']=='ventilated']
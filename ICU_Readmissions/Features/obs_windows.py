@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:05:00 2026
+
+Shared observation window filtering for the feature scripts. Replaces the
+keep_row() functions that looked up each row's window one at a time, with a
+single vectorized comparison against the cohort's windows.
+
+windows is a table of patientunitstayid and window times, like ids/comp in
+the feature scripts after 'end' (and usually 'start') have been added.
+
+If there's one window per stay, the window times are mapped onto the events
+directly. If a stay has multiple windows, the events get joined to every
+window of their stay, and come back with the windows' other columns attached
+(so you can group by whatever labels the windows).
+
+@author: Kirby
+"""
+import numpy as np
+
+
+def window_times(events, windows, cols, id_col):
+    #Map each window time onto the events when there's one window per stay.
+    lookup = windows.set_index(id_col)
+    return {col:events[id_col].map(lookup[col]).values for col in cols}
+
+def filter_to_window(events, windows, offset_col, start_col=None, end_col='end',
+                     id_col='patientunitstayid'):
+    """
+    Returns the events whose offset_col is <= the end of their stay's window
+    (and >= the start of it, if start_col is given). Stays with no window, and
+    events with no offset, are dropped.
+    """
+    cols = [end_col] if start_col is None else [start_col, end_col]
+
+    if not windows[id_col].duplicated().any():
+        times = window_times(events, windows, cols, id_col)
+        offset = events[offset_col].values
+        keep = offset <= times[end_col]
+        if start_col is not None:
+            keep &= offset >= times[start_col]
+        return events[keep]
+
+    #Multiple windows per stay, join and compare.
+    #Window columns that clash with event columns take the window's values.
+    events = events.drop(columns=[col for col in windows.columns
+                                  if (col in events.columns) & (col != id_col)])
+    events = events.merge(windows, on=id_col, how='inner')
+    keep = events[offset_col] <= events[end_col]
+    if start_col is not None:
+        keep &= events[offset_col] >= events[start_col]
+    return events[keep].reset_index(drop=True)
+
+def active_at_window_end(events, windows, start_offset_col, stop_offset_col,
+                         end_col='end', id_col='patientunitstayid'):
+    """
+    Returns the events (like drug orders) that started before the end of their
+    stay's window, and either never stopped or stopped after the window ended.
+    """
+    if not windows[id_col].duplicated().any():
+        end = window_times(events, windows, [end_col], id_col)[end_col]
+        start = events[start_offset_col].values.astype(float)
+        stop = events[stop_offset_col].values.astype(float)
+        keep = (start < end) & (np.isnan(stop) | (stop > end))
+        return events[keep]
+
+    events = events.drop(columns=[col for col in windows.columns
+                                  if (col in events.columns) & (col != id_col)])
+    events = events.merge(windows, on=id_col, how='inner')
+    keep = ((events[start_offset_col] < events[end_col]) &
+            (events[stop_offset_col].isna() |
+             (events[stop_offset_col] > events[end_col])))
+    return events[keep].reset_index(drop=True)
@@ -2,56 +2,276 @@
 """
 Created on Tue Jun 15 20:56:25 2021
 
-Reruns all feature code to regenerate features, excluding PTS. 
+Reruns all feature code to regenerate features, excluding PTS.
 
-Usually needs to be done after making a new data set. 
+Usually needs to be done after making a new data set.
+
+Each script is a node, listed with the eICU tables and files it reads and the
+files it writes. A node runs after the nodes that write its inputs, and nodes
+that don't depend on each other run at the same time, in n_workers processes.
+
+A node is skipped if its inputs haven't changed since it last ran (and its
+outputs are still there). Files are compared by a hash of their contents,
+eICU tables by the sizes and modified times of their files, since they're
+too big to hash every time. The hashes are kept in regenerate_state.json,
+delete it (or use force_rerun) to rerun everything.
 
 @author: Kirby
 """
+import os
+import sys
+import json
+import glob
+import fnmatch
+import hashlib
+import importlib.util
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
 file_path = Path(__file__).parent
-import importlib.util
-import os
+sys.path.append(str(file_path.parent))
+from eicu_tables import eicu_path, store_path, is_converted, table_store_path, find_csv
+
+state_file = file_path.joinpath('regenerate_state.json')
+
+# Number of scripts run at once. Most of them load big eICU tables, so this
+# is limited by memory more than cores.
+n_workers = 4
+
+# Names of nodes to rerun even if nothing changed.
+force_rerun = []
+
+#%% List out the scripts, with their inputs and outputs.
+cohort_file = file_path.parent.joinpath('Cohort','ICU_readmissions_dataset.csv')
+subset_path = store_path.joinpath('nursecharting_subsets')
+
+# Shared code every script uses.
+shared = ['../eicu_tables.py', 'obs_windows.py', 'string_matcher.py']
+
+def node(folder, file, tables=(), inputs=(), outputs=(), func='full_script'):
+    # inputs and outputs are paths relative to this folder, or full paths.
+    # inputs can be glob patterns, or folders (everything in them).
+    return {'name':file[:-3],
+            'folder':folder,
+            'file':file,
+            'func':func,
+            'tables':list(tables),
+            'inputs':[folder + '/' + file, cohort_file] + shared + list(inputs),
+            'outputs':list(outputs)}
+
+nodes = [node('Static','StaticFeatures.py',
+              tables=['patient','hospital','apachePatientResult'],
+              outputs=['Static/static_features.csv']),
+         node('Comorbidity','Elixhauser.py',
+              tables=['patient','diagnosis'],
+              inputs=['Comorbidity/Elixhauser_mappings_ICD9.csv'],
+              outputs=['Comorbidity/Elixhauser_features.csv']),
+         node('Dialysis','DialysisFeature.py',
+              tables=['patient','carePlanGeneral','apacheApsVar','treatment'],
+              outputs=['Dialysis/dialysis_feature.csv']),
+         node('History','HistoryFeatures.py',
+              tables=['pastHistory'],
+              inputs=['History/*.csv'],
+              outputs=['History/HistoryFeatures.csv']),
+         node('IntakeOutput','UrineTransfusions.py',
+              tables=['patient','intakeOutput','treatment'],
+              inputs=['IntakeOutput/*paths.csv'],
+              outputs=['IntakeOutput/urine_transfusions_features.csv']),
+         node('Labs','AllLabsDuringStay.py', func=None,
+              tables=['patient','lab'],
+              inputs=['Labs/LabsDuringStay.py','Labs/RawLabsList.csv'],
+              outputs=['Labs/AllLabsDuringStay']),
+         node('Labs','LastLabFeatures.py',
+              tables=['patient'],
+              inputs=['Labs/LabsDuringStay.py','Labs/AllLabsDuringStay',
+                      'Labs/LabsList.csv',
+                      'Labs/feature_normal_ranges_KG.xlsx'],
+              outputs=['Labs/lab_feature_data.csv']),
+         node('Medications','Create HICL Drug Name Legend.py',
+              tables=['medication'],
+              outputs=['Medications/HICLlegend.csv']),
+         node('Medications','AllDrugFeatures.py',
+              tables=['patient','infusionDrug','medication','treatment'],
+              inputs=['Medications/DrugFeaturesFunction.py',
+                      'Medications/HICLlegend.csv',
+                      'Medications/DrugNameLists',
+                      'Medications/TreatmentStrings'],
+              outputs=['Medications/AllDrugFeatures.csv']),
+         node('NurseCharting','NurseChartingScan.py', func='scan_nursecharting',
+              tables=['nurseCharting'],
+              inputs=['Ventilation/*_search_strings.csv'],
+              outputs=[subset_path]),
+         node('NurseCharting','LastGCS.py',
+              tables=['patient'],
+              inputs=['NurseCharting/NurseChartingScan.py', subset_path],
+              outputs=['NurseCharting/GCS_feature.csv']),
+         node('NurseCharting','LastRASS.py',
+              tables=['patient'],
+              inputs=['NurseCharting/NurseChartingScan.py', subset_path],
+              outputs=['NurseCharting/rass_feature.csv']),
+         node('NurseCharting','LastTemperature.py',
+              tables=['patient'],
+              inputs=['NurseCharting/NurseChartingScan.py', subset_path],
+              outputs=['NurseCharting/temp_feature.csv']),
+         node('Sepsis','SuspectedSepsis.py',
+              tables=['patient'],
+              inputs=['NurseCharting/NurseChartingScan.py', subset_path,
+                      eicu_path.joinpath('*_delirium.csv'),
+                      'Sepsis/df_vent_event.csv'],
+              outputs=['Sepsis/suspected_sepsis.csv']),
+         node('Sepsis','InfectionAndSepsisDynamic.py',
+              tables=['patient','diagnosis'],
+              inputs=['Sepsis/suspected_sepsis.csv','Sepsis/ICD9_codes_*.csv'],
+              outputs=['Sepsis/sepsis_and_infection.csv']),
+         node('Ventilation','MVDurationDynamic.py',
+              tables=['patient','treatment','respiratoryCharting'],
+              inputs=['NurseCharting/NurseChartingScan.py', subset_path,
+                      'Ventilation/*_search_strings.csv'],
+              outputs=['Ventilation/MV_duration.csv'])
+         ]
+
+#%% Dependencies and hashes.
+def full_path(path):
+    return os.path.normpath(str(file_path.joinpath(path)))
 
-# List out folders and files to run. 
-folders_and_files = [('Static','StaticFeatures.py'),
-                     ('Comorbidity','Elixhauser.py'),
-                     ('Dialysis','DialysisFeature.py'),
-                     ('History','HistoryFeatures.py'),
-                     ('IntakeOutput','UrineTransfusions.py'),
-                     ('Labs','LastLabFeatures.py'),
-                     ('Medications','Create HICL Drug Name Legend.py'),
-                     ('Medications','AllDrugFeatures.py'),
-                     ('NurseCharting','LastGCS.py'),
-                     ('NurseCharting','LastRASS.py'),
-                     ('NurseCharting','LastTemperature.py'),
-                     ('Sepsis','SuspectedSepsis.py'),
-                     ('Sepsis','InfectionAndSepsisDynamic.py'),
-                     ('Ventilation','MVDurationDynamic.py')
-                     ]
-
-# Use this to run just part of it. 
-# folders_and_files = [('IntakeOutput','UrineTransfusions.py'),
-#                      ('Labs','LastLabFeatures.py'),
-#                      ('Medications','Create HICL Drug Name Legend.py'),
-#                      ('Medications','AllDrugFeatures.py'),
-#                      ('NurseCharting','LastGCS.py'),
-#                      ('NurseCharting','LastRASS.py'),
-#                      ('NurseCharting','LastTemperature.py'),
-#                      ('Sepsis','SuspectedSepsis.py'),
-#                      ('Sepsis','InfectionAndSepsisDynamic.py'),
-#                      ('Ventilation','MVDurationDynamic.py')
-#                      ]
-
-for folder_and_file in folders_and_files:
-    # Get file path of script. 
-    folder = folder_and_file[0]
-    file = folder_and_file[1]
+def covers(inp, out):
+    # Whether the input path/pattern includes the output file or folder.
+    inp = full_path(inp)
+    out = full_path(out)
+    return ((inp == out) | fnmatch.fnmatch(out, inp) |
+            inp.startswith(out + os.sep))
+
+def find_dependencies(nodes):
+    deps = {}
+    for n in nodes:
+        deps[n['name']] = [other['name'] for other in nodes
+                           if (other is not n) &
+                           any(covers(inp, out) for inp in n['inputs']
+                               for out in other['outputs'])]
+    return deps
+
+def input_files(path):
+    # All files matching an input, going through folders.
+    files = []
+    for match in sorted(glob.glob(full_path(path))):
+        if os.path.isdir(match):
+            for root, dirs, names in os.walk(match):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(match)
+    return files
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def table_fingerprint(table_name):
+    # Sizes and modified times of the table's parquet files, or its csv.
+    if is_converted(table_name):
+        files = input_files(table_store_path(table_name))
+    else:
+        files = [str(find_csv(table_name))]
+    return [[f, os.path.getsize(f), os.path.getmtime(f)] for f in files]
+
+def is_output(n, f):
+    # Inputs like History/*.csv can pick up the node's own outputs.
+    return any(covers(f, out) | f.startswith(full_path(out) + os.sep)
+               for out in n['outputs'])
+
+def input_hash(n):
+    h = hashlib.sha256()
+    h.update(json.dumps([n['folder'], n['file'], n['func']]).encode())
+    for table_name in n['tables']:
+        h.update(json.dumps(table_fingerprint(table_name)).encode())
+    for path in n['inputs']:
+        for f in input_files(path):
+            if not is_output(n, f):
+                h.update((f + file_hash(f)).encode())
+    return h.hexdigest()
+
+def outputs_exist(n):
+    return all(len(glob.glob(full_path(out))) > 0 for out in n['outputs'])
+
+def load_state():
+    if state_file.exists():
+        with open(state_file) as f:
+            return json.load(f)
+    return {}
+
+def save_state(state):
+    temp_file = str(state_file) + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(temp_file, state_file)
+
+#%% Running scripts.
+def run_node(folder, file, func):
+    # Get file path of script.
     curr_path = file_path.joinpath(folder,file)
     # Change working directory.
     os.chdir(curr_path.parent)
+    sys.path.insert(0, str(curr_path.parent))
     # Run file.
     spec = importlib.util.spec_from_file_location("module.name", curr_path)
     foo = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(foo)
-    foo.full_script()
+    if func is not None:
+        getattr(foo, func)()
+
+def regenerate(nodes):
+    deps = find_dependencies(nodes)
+    by_name = {n['name']:n for n in nodes}
+    state = load_state()
+    pending = [n['name'] for n in nodes]
+    finished = set()
+    running = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        while (len(pending) > 0) | (len(running) > 0):
+            # Start (or skip) everything whose inputs are ready.
+            ready = [name for name in pending
+                     if all(dep in finished for dep in deps[name])]
+            for name in ready:
+                pending.remove(name)
+                n = by_name[name]
+                new_hash = input_hash(n)
+                if ((state.get(name) == new_hash) & outputs_exist(n) &
+                    (name not in force_rerun)):
+                    print(name + ' unchanged, skipped.')
+                    finished.add(name)
+                    continue
+                print(name + ' started.')
+                future = pool.submit(run_node, n['folder'], n['file'],
+                                     n['func'])
+                running[future] = (name, new_hash)
+            if len(ready) > 0:
+                continue
+            if len(running) == 0:
+                raise ValueError('Dependency loop between ' + str(pending))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, new_hash = running.pop(future)
+                future.result()
+                print(name + ' done!')
+                state[name] = new_hash
+                save_state(state)
+                finished.add(name)
+
+def select_nodes(names):
+    # The named nodes only, not what they depend on.
+    unknown = set(names) - set(n['name'] for n in nodes)
+    if len(unknown) > 0:
+        raise ValueError('No nodes named ' + str(sorted(unknown)))
+    return [n for n in nodes if n['name'] in names]
+
+if __name__ == '__main__':
+    # Node names can be passed to only run those, e.g.
+    # python regenerate_features.py StaticFeatures LastGCS
+    if len(sys.argv) > 1:
+        regenerate(select_nodes(sys.argv[1:]))
+    else:
+        regenerate(nodes)
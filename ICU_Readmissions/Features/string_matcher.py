@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:40:00 2026
+
+Multi-pattern string matching for the feature scripts. Replaces running
+str.contains('|'.join(search_list)) over every row, once per search list.
+
+compile_patterns() takes a dict of search lists (drug classes, vent words...)
+and compiles them together. Search lists that are all plain strings go into
+one Aho-Corasick automaton, so every one of them gets checked in a single
+pass over each string. Search lists with any regex characters in them (like
+'(%)' or a leading '|') are kept as the joined regex, so they match exactly
+what str.contains() matched before.
+
+Strings are only matched once per unique value, and results are cached on the
+matcher, since drug names, treatment strings etc. repeat a lot. Matching a
+column gets done on its unique values, then broadcast back to the rows.
+
+Like str.contains(..., na=False), missing/non-text values never match.
+
+@author: Kirby
+"""
+import re
+import numpy as np
+import pandas as pd
+from collections import deque
+
+#Characters that make a search string a regex instead of plain text.
+regex_chars = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+#%% Building the matcher.
+def is_literal(pattern):
+    return (len(pattern) > 0) & (regex_chars.search(pattern) is None)
+
+def build_automaton(literals):
+    #literals is a list of (pattern, bit) pairs. Each trie node keeps the
+    #bits of every pattern that ends there (or at its failure links).
+    goto = [{}]
+    fail = [0]
+    out = [0]
+    for pattern, bit in literals:
+        node = 0
+        for char in pattern:
+            nxt = goto[node].get(char)
+            if nxt is None:
+                nxt = len(goto)
+                goto.append({})
+                fail.append(0)
+                out.append(0)
+                goto[node][char] = nxt
+            node = nxt
+        out[node] |= bit
+
+    #Failure links, breadth first so shorter suffixes are done first.
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for char, nxt in goto[node].items():
+            queue.append(nxt)
+            back = fail[node]
+            while (back != 0) & (char not in goto[back]):
+                back = fail[back]
+            fail[nxt] = goto[back].get(char, 0)
+            out[nxt] |= out[fail[nxt]]
+    return goto, fail, out
+
+def compile_patterns(patterns, case=False):
+    """
+    patterns - dict of label: list of search strings, or just one list.
+    case - False to ignore case, like str.contains(case=False).
+    """
+    if not isinstance(patterns, dict):
+        patterns = {0:patterns}
+    labels = list(patterns)
+
+    literals = []
+    regexes = []
+    literal_bits = 0
+    for i, label in enumerate(labels):
+        search_list = [str(pattern) for pattern in patterns[label]]
+        #An empty list joins to '', which matches everything, leave it to re.
+        if (len(search_list) > 0) & all(is_literal(pattern)
+                                        for pattern in search_list):
+            for pattern in search_list:
+                literals.append((pattern if case else pattern.lower(), 1 << i))
+            literal_bits |= 1 << i
+        else:
+            flags = 0 if case else re.IGNORECASE
+            regexes.append((re.compile('|'.join(search_list), flags), 1 << i))
+
+    goto, fail, out = build_automaton(literals)
+    return {'labels':labels,
+            'case':case,
+            'goto':goto,
+            'fail':fail,
+            'out':out,
+            'literal_bits':literal_bits,
+            'regexes':regexes,
+            'cache':{}}
+
+
+#%% Matching.
+def scan_string(matcher, text):
+    #Returns the bits of every label that matched text.
+    goto = matcher['goto']
+    fail = matcher['fail']
+    out = matcher['out']
+    found = 0
+    if matcher['literal_bits'] != 0:
+        node = 0
+        for char in (text if matcher['case'] else text.lower()):
+            while (node != 0) & (char not in goto[node]):
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found |= out[node]
+            if found == matcher['literal_bits']:
+                break
+    for regex, bit in matcher['regexes']:
+        if regex.search(text) is not None:
+            found |= bit
+    return found
+
+def match_strings(matcher, values):
+    """
+    Returns a boolean array, a row per value and a column per label, of
+    which labels each value matched.
+    """
+    cache = matcher['cache']
+    found = []
+    for value in values:
+        if not isinstance(value, str):
+            found.append(0)
+            continue
+        bits = cache.get(value)
+        if bits is None:
+            bits = scan_string(matcher, value)
+            cache[value] = bits
+        found.append(bits)
+
+    #Unpack the bits, 62 labels at a time so they fit in int64s.
+    n_labels = len(matcher['labels'])
+    matched = np.zeros((len(found), n_labels), dtype=bool)
+    for first in range(0, n_labels, 62):
+        word = np.array([(bits >> first) & ((1 << 62) - 1) for bits in found],
+                        dtype=np.int64).reshape(-1,1)
+        label_bits = 1 << np.arange(min(62, n_labels - first), dtype=np.int64)
+        matched[:,first:first + len(label_bits)] = (word & label_bits) != 0
+    return matched
+
+def tag_column(matcher, column):
+    """
+    Returns a DataFrame of True/False, one column per label, for whether each
+    row of column matched that label's search list.
+    """
+    codes, uniques = pd.factorize(column)
+    matched = match_strings(matcher, uniques)
+    #Missing values get code -1, add a row of False for them to land on.
+    matched = np.vstack([matched, np.zeros((1,matched.shape[1]), dtype=bool)])
+    return pd.DataFrame(matched[codes], index=column.index,
+                        columns=matcher['labels'])
+
+def contains(matcher, column, label=None):
+    """
+    Same as column.str.contains('|'.join(search_list), case=..., na=False),
+    for one label's search list (the first one if label isn't given).
+    """
+    if label is None:
+        label = matcher['labels'][0]
+    return tag_column(matcher, column)[label].values
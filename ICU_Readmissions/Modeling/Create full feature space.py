@@ -15,6 +15,7 @@ import pandas as pd
 from pathlib import Path
 from time import time
 from datetime import datetime
+from feature_bundle import save_bundle
 
 start = time()
 now = str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))
@@ -76,4 +77,7 @@ cols2 = cat.columns.to_frame(index=False)
 all_cols = pd.concat([cols1,cols2],axis=0)
 all_cols.to_csv('column_names.csv',index=False)
 
+#Binary version for run_model to load quickly.
+save_bundle('feature_bundle',num,cat,columns=list(all_cols.iloc[:,0]))
+
 #final.to_csv('All_Features.csv',index=False)
\ No newline at end of file
@@ -16,6 +16,8 @@ from datetime import datetime
 import pickle
 from sklearn.feature_selection import SelectFromModel
 from sklearn.impute import SimpleImputer
+from feature_bundle import save_bundle
+from model_artifact import load_artifact, top_features
 
 start = time()
 now = str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))
@@ -25,15 +27,25 @@ feature_path = file_path.parent.parent.joinpath('Features')
 cohort_path = file_path.parent.parent.joinpath('Cohort')
 
 #%% Load in data. 
+def load_top(name):
+    # Use the exact column names from the model artifact if there is one, 
+    # otherwise the Top_Features csv (which can mangle quotes in names).
+    artifact_file = Path(name + '_artifact.joblib')
+    if artifact_file.exists():
+        top = top_features(load_artifact(artifact_file))
+        top['column_name'] = top['column_name'].str.replace(',','_')
+        return top
+    return pd.read_csv(name + '_Top_Features.csv')
+
 nonpts_cat = pd.read_csv('categorical_data.csv')
 nonpts_num = pd.read_csv('numeric_data.csv')
 nonpts_cols = pd.read_csv('column_names.csv')
-nonpts_top = pd.read_csv('all_orig_features_rf_Top_Features.csv')
+nonpts_top = load_top('all_orig_features_rf')
 
 pts_cat = pd.read_csv('categorical_data_12beforedisch.csv')
 pts_num = pd.read_csv('numeric_data_12beforedisch.csv')
 pts_cols = pd.read_csv('column_names_12beforedisch.csv')
-pts_top = pd.read_csv('12beforedisch_rf_Top_Features.csv')
+pts_top = load_top('12beforedisch_rf')
 
 # convert commas in column names to underscores.
 for data in [nonpts_cat,nonpts_num,pts_cat,pts_num]:
@@ -92,4 +104,8 @@ all_cat.to_csv('categorical_data_mixed.csv',index=False)
 cols1 = all_num.columns.to_frame(index=False)
 cols2 = all_cat.columns.to_frame(index=False)
 all_cols = pd.concat([cols1,cols2],axis=0)
-all_cols.to_csv('column_names_mixed.csv',index=False)
\ No newline at end of file
+all_cols.to_csv('column_names_mixed.csv',index=False)
+
+#Binary version for run_model to load quickly.
+save_bundle('feature_bundle_mixed',all_num,all_cat,
+            columns=list(all_cols.iloc[:,0]))
\ No newline at end of file
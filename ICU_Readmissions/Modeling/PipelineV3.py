@@ -16,8 +16,12 @@ XGB - 12 hours with 23 processors on MARCC.
 @author: Kirby
 """
 #%% Pick which model to use.
-#Options: 'lr','rf','svm', 'xgb'
+#Options: 'lr','rf','svm', 'xgb', 'xgb_hist', 'hgb'
+#'xgb_hist' is XGBoost with histogram splits, 'hgb' is sklearn's
+#HistGradientBoostingClassifier. Both handle missing values themselves, so the
+#data isn't imputed for them.
 model_set = 'rf'
+native_missing = ['xgb_hist','hgb']
 
 #Use previous model for feature selection?
 use_prev_model = False
@@ -33,82 +37,79 @@ col_names_name = 'column_namessao2_1hrintervals.csv'
 output_name = '1hr_intervals_sao2'
 
 
-def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
-              cat_data_name,col_names_name,output_name,shapley):
-    #%% Package setup. 
-    #Miscellaneous packages. 
-    from matplotlib import pyplot as plt
+#How to parallelize the nested cross validation.
+#'flat' runs every outer fold/candidate/inner fold fit in one pool of n_jobs.
+#'nested' is the old way, cross_val_score around RandomizedSearchCV.
+parallel_plan = 'flat'
+n_jobs = -2
+
+#How to search hyperparameters, see search_strategies.py.
+#'random' is RandomizedSearchCV with 30 candidates.
+#'halving' is successive halving, over the number of trees for tree models, 
+#rows otherwise.
+#'early_stopping' is xgb/xgb_hist/hgb only, trees are picked on a held out part
+#of each fold.
+#'path' is lr only, the 'random' candidates fit as a warm started path over C.
+search_strategy = 'random'
+
+#Folder to keep cross validation scores in, so reruns on the same data don't
+#redo fits that were already scored. None to not keep them.
+score_cache = 'cv_score_cache'
+
+#Rows to get Shapley values for (a stratified sample of the training set), 
+#None for all of them. See shap_tools.py.
+shap_rows = None
+
+
+def load_feature_space(num_data_name,cat_data_name,col_names_name,wd,
+                       impute=True):
+    """
+    Loads a feature space, splits it 80-20, and standardizes and imputes it.
+    impute=False leaves the missing values in, for models that handle them.
+    Returns X_train, X_test, y_train, y_test, the column names, and a dict
+    with the fitted preprocessing pipeline and a hash of the feature space.
+    """
     import numpy as np
     import pandas as pd
-    from pathlib import Path
-    from time import time
-    from datetime import datetime
-    import pickle
-    import inspect as insp
-    import os
-    import warnings
-    
-    #Preprocessing
+    from feature_bundle import bundle_name, bundle_is_current, load_bundle
+    from model_artifact import files_hash
     from sklearn import preprocessing
+    from sklearn.compose import ColumnTransformer
     from sklearn.impute import SimpleImputer
     from sklearn.model_selection import train_test_split
-    
-    #Models
-    from sklearn.svm import SVC
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.linear_model import LogisticRegression
-    from xgboost import XGBClassifier
-    
-    #Evaluation
-    from sklearn.model_selection import StratifiedKFold
-    from sklearn.model_selection import GridSearchCV
-    from scipy.stats import uniform
-    from scipy.stats import loguniform
-    from scipy.stats import randint
-    from sklearn.model_selection import RandomizedSearchCV
-    from sklearn.model_selection import cross_val_score
-    from sklearn.metrics import roc_auc_score
-    from sklearn.metrics import roc_curve
-    from sklearn.metrics import plot_roc_curve
-    from sklearn.feature_selection import SelectFromModel
-    import shap
-    
-    start = time()
-    # Get current date/time for file names.
-    if output_name == '':
-        now = str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))
-    else:
-        now = output_name
-    
-    # Get relative file paths.
-    filename = insp.getframeinfo(insp.currentframe()).filename
-    file_path = os.path.dirname(os.path.abspath(filename))
-    wd = Path(file_path)
-    print(file_path)
-    parent = wd.parent
-    cohort_path = parent.joinpath('Cohort')
-    feature_path = parent.joinpath('Features')
-    
+    from sklearn.pipeline import Pipeline
+    cohort_path = wd.parent.joinpath('Cohort')
     
     #%% Load in data. 
     
-    ids = np.genfromtxt(cohort_path.joinpath('ICU_readmissions_dataset.csv'), 
-                          delimiter=',',skip_header=1)
-    # ids = np.genfromtxt('ICU_readmissions_dataset.csv', 
-    #                      delimiter=',',skip_header=1,)
-    #Numeric data.
-    num_data = np.genfromtxt(wd.joinpath(num_data_name),
-                             delimiter=',',skip_header=1)
-    
-    #Categorical/binary data, already one-hot encoded.
-    cat_data = np.genfromtxt(wd.joinpath(cat_data_name),
-                             delimiter=',',skip_header=1)
+    ids = pd.read_csv(cohort_path.joinpath('ICU_readmissions_dataset.csv'))
+    # ids = pd.read_csv('ICU_readmissions_dataset.csv')
     
-    #Column names. 
-    cols = np.genfromtxt(wd.joinpath(col_names_name),
-                         delimiter=',',dtype=str,skip_header=1)
+    #Use the binary version of the feature space if it's there and up to date.
+    bundle = bundle_name(num_data_name)
+    csv_files = [wd.joinpath(name) for name in 
+                 [num_data_name,cat_data_name,col_names_name]]
+    if bundle_is_current(bundle, csv_files, folder=wd):
+        data = load_bundle(bundle, folder=wd)
+        num_data = data['numeric']
+        cat_data = data['categorical']
+        cols = data['columns']
+    else:
+        #Numeric data.
+        num_data = np.genfromtxt(wd.joinpath(num_data_name),
+                                 delimiter=',',skip_header=1)
+        
+        #Categorical/binary data, already one-hot encoded.
+        cat_data = np.genfromtxt(wd.joinpath(cat_data_name),
+                                 delimiter=',',skip_header=1)
+        
+        #Column names. 
+        cols = np.genfromtxt(wd.joinpath(col_names_name),
+                             delimiter=',',dtype=str,skip_header=1)
+    #Hash the csvs either way, so the hash doesn't depend on the bundle.
+    feature_hash = files_hash(csv_files)
     
-    y = ids[:,3].astype(bool)
+    y = ids.iloc[:,3].values.astype(bool)
     #For testing.
     print(y)
     
@@ -117,44 +118,46 @@ def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
         num_data, cat_data, y, test_size=0.2, random_state=1, shuffle=True)
     
     #%% Put together and standardize numerical stuff. 
-    
-    scaler = preprocessing.StandardScaler().fit(num_train)
-    num_train = scaler.transform(num_train)
-    num_test = scaler.transform(num_test)
-    
     X_train = np.concatenate([num_train,cat_train],axis=1)
     X_test = np.concatenate([num_test,cat_test],axis=1)
     
-    #%% Do imputation. 
-    
-    imp = SimpleImputer(missing_values=np.nan, strategy='median')
-    imp.fit(X_train)
-    X_train = imp.transform(X_train)
-    X_test = imp.transform(X_test)
+    #Scaling and imputation are one pipeline on the raw columns, so they can
+    #be saved with the model.
+    scale = ColumnTransformer([('scale',preprocessing.StandardScaler(),
+                                np.arange(num_train.shape[1]))],
+                              remainder='passthrough')
+    steps = [('scale',scale)]
     
-    #%% Select features to model on, if desired.
-    if use_prev_model == True:
-        # Cut down features. 
-        with open(prev_model_file, 'rb') as p:
-            prev_model = pickle.load(p)
-        selection = SelectFromModel(prev_model, threshold=thresh, prefit=True)
-        X_train = selection.transform(X_train)
-        X_test = selection.transform(X_test)
-        # Cut down list of columns. 
-        cols = selection.transform(cols.reshape(1,len(cols)))
-        cols = cols.reshape(cols.shape[1],)
-        # Don't run the model if the threshold cuts to less than 2 features. 
-        if X_train.shape[1] < 2:
-            warnings.warn("Threshold cuts too many features. Drop it.")
-            return
+    #%% Do imputation. 
+    if impute == True:
+        steps.append(('impute',SimpleImputer(missing_values=np.nan, 
+                                             strategy='median')))
+    preprocess = Pipeline(steps)
+    X_train = preprocess.fit_transform(X_train)
+    X_test = preprocess.transform(X_test)
     
-    #%% Model selection and parameters to optimize over.
+    info = {'preprocess':preprocess,
+            'feature_hash':feature_hash}
+    return X_train, X_test, y_train, y_test, cols, info
+
+
+def model_params(model_set,n_features):
+    """
+    Returns the model for model_set, and the parameters to search over.
+    """
+    from sklearn.svm import SVC
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from scipy.stats import uniform
+    from scipy.stats import loguniform
+    from scipy.stats import randint
     
     #Random Forest
     if model_set == 'rf':
         model = RandomForestClassifier(random_state=1)
         params = {'n_estimators':randint(10,1000),
-             'max_features':randint(1,X_train.shape[1]),
+             'max_features':randint(1,n_features),
              'max_depth':randint(1,30),
              'min_samples_leaf':randint(1,100),
              'min_samples_split':randint(2,100)}
@@ -170,45 +173,43 @@ def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
                   "gamma": uniform(loc=0,scale=1)}
     #XGBoost
     elif model_set == 'xgb':
+        from xgboost import XGBClassifier
         model = XGBClassifier(use_label_encoder=False)
         params = {'eta':uniform(loc=0,scale=1),
                   'gamma':randint(0,100),
-                  'max_depth':randint(1,X_train.shape[1]),
+                  'max_depth':randint(1,n_features),
                   'n_estimators':randint(10,1000)}
+    #XGBoost with histogram splits.
+    elif model_set == 'xgb_hist':
+        from xgboost import XGBClassifier
+        model = XGBClassifier(tree_method='hist',use_label_encoder=False)
+        params = {'eta':uniform(loc=0,scale=1),
+                  'gamma':randint(0,100),
+                  'max_depth':randint(1,n_features),
+                  'n_estimators':randint(10,1000)}
+    #sklearn's histogram gradient boosting. max_iter is the number of trees.
+    elif model_set == 'hgb':
+        model = HistGradientBoostingClassifier(early_stopping=False,
+                                               random_state=1)
+        params = {'learning_rate':loguniform(a=10**-2,b=1),
+                  'max_iter':randint(10,1000),
+                  'max_leaf_nodes':randint(2,256),
+                  'min_samples_leaf':randint(1,100),
+                  'l2_regularization':uniform(loc=0,scale=10)}
+    return model, params
+
+
+def test_results(classifier,X_test,y_test,model_set,now):
+    """
+    Saves the test set ROC curve and the model.
+    """
+    from matplotlib import pyplot as plt
+    import numpy as np
+    import pandas as pd
+    import pickle
+    from sklearn.metrics import roc_auc_score
+    from sklearn.metrics import roc_curve
     
-    
-    #%% Nested cross validation.
-    f = open(now + '_' + model_set + '_results_pipelineV3.txt','a')
-    
-    # configure the cross-validation procedure
-    cv_inner = StratifiedKFold(n_splits=3, shuffle=True, random_state=1)
-    
-    # define search
-    # search = GridSearchCV(model, params, scoring='roc_auc', n_jobs=3, cv=cv_inner, 
-    #                       verbose=0, refit=True)
-    search = RandomizedSearchCV(model, params, n_iter=30, scoring='roc_auc', 
-                                n_jobs=-2, cv=cv_inner, verbose=1, refit=True, 
-                                random_state=1)
-    # configure the cross-validation procedure
-    cv_outer = StratifiedKFold(n_splits=5, shuffle=True, random_state=1)
-    # execute the nested cross-validation
-    scores = cross_val_score(search, X_train, y_train, scoring='roc_auc', 
-                             cv=cv_outer, n_jobs=-2, verbose=1)
-    # report performance
-    print('AUROC: %.3f (%.3f)' % (np.mean(scores), np.std(scores)))
-    f.write('AUROC: %.3f (%.3f)' % (np.mean(scores), np.std(scores)))
-    
-    #%% Get best model, Train it on the full dataset, and evaluate on test dataset. 
-    search = RandomizedSearchCV(model, params, n_iter=30,scoring='roc_auc', 
-                                cv=cv_inner, n_jobs=-2,verbose=1,refit=True, 
-                                random_state=1)
-    # execute search
-    result = search.fit(X_train, y_train)
-    # get the best performing model fit on the whole training set
-    best_model = result.best_estimator_
-    print(best_model.get_params())
-    f.write('\n' + str(best_model.get_params()))
-    classifier = best_model.fit(X_train,y_train)
     y_test_pred = classifier.predict_proba(X_test)[:,1]
     fpr,tpr,thresholds = roc_curve(y_test,y_test_pred)
     roc_score = roc_auc_score(y_test,y_test_pred)
@@ -226,17 +227,14 @@ def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
     
     with open(now + '_' + model_set + '_model.pkl', "wb") as m:
         pickle.dump(classifier, m)
-        
-    #%% If shapley == True, get a Shapley summary plot too.
-    if shapley == True:
-        ex = shap.Explainer(classifier, X_train)
-        shap_values = ex.shap_values(X_train,check_additivity=False)
-        # shap_obj = ex(X_train,check_additivity=False)
-        fig = plt.figure()
-        shap.summary_plot(shap_values, X_train)
-        #shap.plots.beeswarm(shap_values)
-        fig.savefig(now + '_' + model_set + '_shapley.png', bbox_inches='tight')
-    #%% Get feature importance. 
+
+
+def feature_importance(classifier,cols,model_set,now):
+    """
+    Saves the top features of the model.
+    """
+    from matplotlib import pyplot as plt
+    import pandas as pd
     
     #Random Forest
     if model_set == 'rf':
@@ -267,7 +265,7 @@ def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
         plt.savefig(now + '_' + model_set + '_Top_Features.png',
                     bbox_inches='tight')
         plt.show()
-    elif model_set == 'xgb':
+    elif model_set in ['xgb','xgb_hist']:
         rf_top_feat = classifier.feature_importances_
         top_feats = pd.DataFrame(data={'column_name':cols,
                                        'feat_importance':rf_top_feat})
@@ -280,6 +278,164 @@ def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
         plt.savefig(now + '_' + model_set + '_Top_Features.png',
                     bbox_inches='tight')
         plt.show()
+    #HistGradientBoostingClassifier has no feature importances, use shapley.
+    elif model_set == 'hgb':
+        print('No feature importances for hgb, run with shapley = True.')
+
+
+def run_model(model_set,use_prev_model,prev_model_file,thresh,num_data_name,
+              cat_data_name,col_names_name,output_name,shapley,
+              parallel_plan=parallel_plan,n_jobs=n_jobs,
+              search_strategy=search_strategy,score_cache=score_cache,
+              shap_rows=shap_rows):
+    #%% Package setup. 
+    #Miscellaneous packages. 
+    from matplotlib import pyplot as plt
+    import numpy as np
+    import pandas as pd
+    from pathlib import Path
+    from time import time
+    from datetime import datetime
+    import pickle
+    import inspect as insp
+    import os
+    import warnings
+    from nested_cv import nested_cv
+    from search_strategies import make_search, strategy_model
+    from shap_tools import shap_values
+    from model_artifact import (model_pipeline, save_artifact, load_model,
+                                model_importance)
+    
+    #Evaluation
+    from sklearn.model_selection import StratifiedKFold
+    from sklearn.model_selection import GridSearchCV
+    from sklearn.model_selection import cross_val_score
+    from sklearn.feature_selection import SelectFromModel
+    import shap
+    
+    start = time()
+    # Get current date/time for file names.
+    if output_name == '':
+        now = str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))
+    else:
+        now = output_name
+    
+    # Get relative file paths.
+    filename = insp.getframeinfo(insp.currentframe()).filename
+    file_path = os.path.dirname(os.path.abspath(filename))
+    wd = Path(file_path)
+    print(file_path)
+    parent = wd.parent
+    feature_path = parent.joinpath('Features')
+    
+    
+    #%% Load in data. 
+    X_train, X_test, y_train, y_test, cols, info = load_feature_space(
+        num_data_name,cat_data_name,col_names_name,wd,
+        impute=model_set not in native_missing)
+    all_cols = cols
+    
+    #%% Select features to model on, if desired.
+    selection = None
+    if use_prev_model == True:
+        # Cut down features. prev_model_file can be a pickled model or an 
+        # artifact.
+        prev_model = load_model(prev_model_file)
+        #Fails clearly for models without importances, like hgb.
+        model_importance(prev_model)
+        selection = SelectFromModel(prev_model, threshold=thresh, prefit=True)
+        X_train = selection.transform(X_train)
+        X_test = selection.transform(X_test)
+        # Cut down list of columns. 
+        cols = selection.transform(cols.reshape(1,len(cols)))
+        cols = cols.reshape(cols.shape[1],)
+        # Don't run the model if the threshold cuts to less than 2 features. 
+        if X_train.shape[1] < 2:
+            warnings.warn("Threshold cuts too many features. Drop it.")
+            return
+    
+    #%% Model selection and parameters to optimize over.
+    model, params = model_params(model_set,X_train.shape[1])
+    
+    
+    #%% Nested cross validation.
+    f = open(now + '_' + model_set + '_results_pipelineV3.txt','a')
+    
+    # configure the cross-validation procedure
+    cv_inner = StratifiedKFold(n_splits=3, shuffle=True, random_state=1)
+    
+    # configure the cross-validation procedure
+    cv_outer = StratifiedKFold(n_splits=5, shuffle=True, random_state=1)
+    flat = ((parallel_plan == 'flat') & 
+            (search_strategy not in ['halving','path']))
+    if flat:
+        # execute the nested cross-validation, all fits in one pool, along 
+        # with the search for the final model
+        search_model, search_params = strategy_model(model_set, model, params,
+                                                     search_strategy)
+        nested = nested_cv(search_model, search_params, X_train, y_train,
+                           cv_outer, cv_inner, n_iter=30, scoring='roc_auc',
+                           n_jobs=n_jobs, random_state=1, verbose=1,
+                           final=True, cache_folder=score_cache)
+        scores = nested['scores']
+    else:
+        # halving rounds depend on each other, so only the search runs in 
+        # parallel, one outer fold at a time. paths are the other way around,
+        # each outer fold runs its paths one after another.
+        outer_jobs = 1 if search_strategy == 'halving' else n_jobs
+        inner_jobs = 1 if search_strategy == 'path' else n_jobs
+        # define search
+        # search = GridSearchCV(model, params, scoring='roc_auc', n_jobs=3, cv=cv_inner, 
+        #                       verbose=0, refit=True)
+        search = make_search(model_set, model, params, search_strategy,
+                             cv_inner, inner_jobs)
+        # execute the nested cross-validation
+        scores = cross_val_score(search, X_train, y_train, scoring='roc_auc', 
+                                 cv=cv_outer, n_jobs=outer_jobs, verbose=1)
+    # report performance
+    print('AUROC: %.3f (%.3f)' % (np.mean(scores), np.std(scores)))
+    f.write('AUROC: %.3f (%.3f)' % (np.mean(scores), np.std(scores)))
+    
+    #%% Get best model, Train it on the full dataset, and evaluate on test dataset. 
+    if flat:
+        # already searched and fit in the nested cross validation
+        best_model = nested['best_model']
+    else:
+        search = make_search(model_set, model, params, search_strategy, 
+                             cv_inner, n_jobs)
+        # execute search
+        result = search.fit(X_train, y_train)
+        # get the best performing model fit on the whole training set
+        best_model = result.best_estimator_
+    print(best_model.get_params())
+    f.write('\n' + str(best_model.get_params()))
+    # refit=True already fit it on the whole training set
+    classifier = best_model
+    if search_strategy == 'early_stopping':
+        #XGB's wrapper has the best tree's index, HGB how many trees it kept.
+        trees = getattr(classifier, 'best_iteration_', None)
+        trees = classifier.n_iter_ if trees is None else trees + 1
+        f.write('\nTrees picked by early stopping: ' + str(trees))
+    test_results(classifier,X_test,y_test,model_set,now)
+    
+    # Save the preprocessing, feature selection, and model together.
+    pipeline = model_pipeline(info['preprocess'], classifier, selection)
+    save_artifact(now + '_' + model_set, pipeline, all_cols, cols, 
+                  info['feature_hash'], model_set)
+        
+    #%% If shapley == True, get a Shapley summary plot too.
+    if shapley == True:
+        #The early stopping wrapper keeps the XGBClassifier in model_.
+        #Tree models use TreeExplainer, in parallel chunks, saved to disk.
+        values, rows = shap_values(getattr(classifier, 'model_', classifier),
+                                   X_train, y_train, n_rows=shap_rows,
+                                   n_jobs=n_jobs)
+        fig = plt.figure()
+        shap.summary_plot(values, X_train[rows])
+        #shap.plots.beeswarm(shap_values)
+        fig.savefig(now + '_' + model_set + '_shapley.png', bbox_inches='tight')
+    #%% Get feature importance. 
+    feature_importance(classifier,cols,model_set,now)
     
     calc = time() - start
     f.write('\nCalculation time: ' + str(calc/60) + ' min.')
@@ -19,4 +19,5 @@ run_model(model_set = 'lr',
           cat_data_name = 'categorical_data_mixed.csv',
           col_names_name = 'column_names_mixed.csv',
           output_name = 'mixed_features',
-          shapley = False)
+          shapley = False,
+          search_strategy = 'path')
@@ -11,6 +11,7 @@ Runs an RF model on the mixed features, then runs pruned models.
 import pandas as pd
 from PipelineV3 import run_model
 from generate_thresholds import generate_thresholds
+from pruning_sweep import run_sweep
 
 # Run the RF model on the original feature space (no PTS)
 run_model(model_set = 'rf',
@@ -30,18 +31,14 @@ thresholds = generate_thresholds('mixed_features_rf_Top_Features.csv')
 # Just get a few of them to run. 
 thresholds = thresholds.iloc[0:10]
 
-# Try different thresholds.
+# Try different thresholds, all in one sweep.
 # Generate names that indicate proportion of useful features kept.
 prop_features = [100,80,70,60,50,40,30,20,10]
-i = -1
-for threshold in thresholds:
-    i += 1
-    run_model(model_set = 'rf',
-              use_prev_model = True,
-              prev_model_file = 'mixed_features_rf_model.pkl',
-              thresh = threshold,
-              num_data_name = 'numeric_data_mixed.csv',
-              cat_data_name = 'categorical_data_mixed.csv',
-              col_names_name = 'column_names_mixed.csv',
-              output_name = 'mixed_features_' + str(prop_features[i]),
-              shapley = False)
\ No newline at end of file
+run_sweep(model_set = 'rf',
+          prev_model_file = 'mixed_features_rf_artifact.joblib',
+          thresholds = thresholds,
+          num_data_name = 'numeric_data_mixed.csv',
+          cat_data_name = 'categorical_data_mixed.csv',
+          col_names_name = 'column_names_mixed.csv',
+          output_names = ['mixed_features_' + str(prop) 
+                          for prop in prop_features])
\ No newline at end of file
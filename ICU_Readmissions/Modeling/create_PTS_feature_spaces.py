@@ -20,6 +20,7 @@ from time import time
 from datetime import datetime
 import inspect as insp
 import os
+from feature_bundle import save_bundle, bundle_name
 
 start = time()
 now = str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))
@@ -107,6 +108,10 @@ for timeframe in timeframes:
     all_cols.replace(to_replace=',',value='_',inplace=True,regex=True)
     all_cols.to_csv('column_names' + timeframe + '.csv',index=False)
     
+    # Binary version for run_model to load quickly.
+    save_bundle(bundle_name('numeric_data' + timeframe),num,cat,
+                columns=list(all_cols.iloc[:,0]))
+    
 #%% Put together all 1hr interval features over 12 hours for each signal.
 
 for signal in signals:
@@ -164,5 +169,9 @@ for signal in signals:
     all_cols.to_csv('column_names_'+ signal + '_' + '1hrintervals' + '.csv',
                     index=False)
     
+    # Binary version for run_model to load quickly.
+    save_bundle(bundle_name('numeric_data_' + signal + '_' + '1hrintervals'),
+                num,cat,columns=list(all_cols.iloc[:,0]))
+    
 
 calc_time = time() - start
\ No newline at end of file
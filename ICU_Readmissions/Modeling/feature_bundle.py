@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:05:00 2026
+
+Saves feature spaces as binary bundles, next to their csvs, so run_model()
+doesn't have to parse the csvs with np.genfromtxt (very slow for the wide PTS
+feature spaces).
+
+A bundle is a folder with the numeric and categorical data as .npy files
+(float32 by default), and a meta.json with the column names, shape, and a
+hash of the contents. Loading memory maps the .npy files, so it's near
+instant, and the data only gets read off disk as it's used.
+
+Bundles are named after the csvs they go with, numeric_data<suffix>.csv goes
+with the feature_bundle<suffix> folder.
+
+@author: Kirby
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+def bundle_name(num_data_name):
+    #numeric_data_mixed.csv -> feature_bundle_mixed
+    suffix = Path(num_data_name).name
+    if suffix.endswith('.csv'):
+        suffix = suffix[:-4]
+    if suffix.startswith('numeric_data'):
+        suffix = suffix[len('numeric_data'):]
+    return 'feature_bundle' + suffix
+
+def to_matrix(data, dtype):
+    #Bools become 1/0, anything that isn't a number becomes nan.
+    data = data.apply(lambda col: col.astype(float) if col.dtype == bool
+                      else pd.to_numeric(col, errors='coerce'))
+    return np.ascontiguousarray(data.to_numpy(dtype=dtype))
+
+def content_hash(num, cat, columns):
+    h = hashlib.sha256()
+    h.update(json.dumps(columns).encode())
+    for data in [num, cat]:
+        h.update(str(data.shape).encode())
+        h.update(data.tobytes())
+    return h.hexdigest()
+
+def save_bundle(name, num, cat, columns=None, folder='.', dtype=np.float32):
+    """
+    Saves the numeric and categorical DataFrames as bundle name in folder.
+    columns - column names to store, defaults to num's then cat's columns.
+    """
+    out_path = Path(folder).joinpath(name)
+    out_path.mkdir(parents=True, exist_ok=True)
+    if columns is None:
+        columns = list(num.columns) + list(cat.columns)
+    columns = [str(col) for col in columns]
+
+    num = to_matrix(num, dtype)
+    cat = to_matrix(cat, dtype)
+    np.save(out_path.joinpath('numeric.npy'), num)
+    np.save(out_path.joinpath('categorical.npy'), cat)
+
+    #meta.json goes last, a bundle without it is unfinished.
+    meta = {'rows':num.shape[0],
+            'numeric_columns':columns[:num.shape[1]],
+            'categorical_columns':columns[num.shape[1]:],
+            'dtype':np.dtype(dtype).name,
+            'hash':content_hash(num, cat, columns)}
+    temp_file = out_path.joinpath('meta.json.tmp')
+    with open(temp_file, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_file, out_path.joinpath('meta.json'))
+    return meta['hash']
+
+def bundle_is_current(name, csv_files, folder='.'):
+    """
+    Whether bundle name exists, and was saved after all of csv_files (so it
+    isn't from an older version of the feature space).
+    """
+    meta_file = Path(folder).joinpath(name, 'meta.json')
+    if not meta_file.exists():
+        return False
+    saved = meta_file.stat().st_mtime
+    return all(os.path.getmtime(f) <= saved for f in csv_files
+               if os.path.exists(f))
+
+def load_bundle(name, folder='.', mmap_mode='r', verify=False):
+    """
+    Loads bundle name from folder. Returns a dict with the numeric and
+    categorical arrays (memory mapped, read only by default), all the column
+    names, and the content hash. verify rehashes the data to check it.
+    """
+    in_path = Path(folder).joinpath(name)
+    with open(in_path.joinpath('meta.json')) as f:
+        meta = json.load(f)
+    num = np.load(in_path.joinpath('numeric.npy'), mmap_mode=mmap_mode)
+    cat = np.load(in_path.joinpath('categorical.npy'), mmap_mode=mmap_mode)
+    columns = meta['numeric_columns'] + meta['categorical_columns']
+    if verify & (content_hash(num, cat, columns) != meta['hash']):
+        raise ValueError('Feature bundle ' + str(in_path) +
+                         ' does not match its hash.')
+    return {'numeric':num,
+            'categorical':cat,
+            'columns':np.array(columns),
+            'hash':meta['hash']}
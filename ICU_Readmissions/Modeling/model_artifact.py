@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:30:00 2026
+
+Saves a trained model as one artifact with everything needed to use it:
+a sklearn Pipeline (scaling, imputation, feature selection, model) that takes
+the raw [numeric, categorical] columns of a feature space, the names of those
+columns, the columns the model kept, and hashes of the feature space it was
+trained on and of the model.
+
+Artifacts are saved with joblib (uncompressed, so they can be loaded with
+mmap_mode), with a json next to them holding everything but the pipeline, to
+see what's in them without loading the model.
+
+@author: Kirby
+"""
+import os
+import json
+import pickle
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sklearn.pipeline import Pipeline
+#Same model hash the Shapley value cache is keyed by.
+from shap_tools import model_hash
+
+#Bump when what's saved in an artifact changes.
+artifact_version = 1
+
+
+#%% Hashes.
+def files_hash(files):
+    #Feature spaces are hashed from their csvs, even when loaded from a bundle.
+    h = hashlib.sha256()
+    for file in files:
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+#%% Making and saving artifacts.
+def model_pipeline(preprocess, model, selector=None):
+    """
+    Returns a Pipeline of the fitted preprocess, selector (if any) and model.
+    """
+    steps = [('preprocess', preprocess)]
+    if selector is not None:
+        steps.append(('select', selector))
+    steps.append(('model', model))
+    return Pipeline(steps)
+
+def save_artifact(name, pipeline, columns, kept_columns, feature_hash,
+                  model_set, folder='.'):
+    """
+    Saves the pipeline as <name>_artifact.joblib in folder, with its json.
+    columns - names of the columns the pipeline takes, in order.
+    kept_columns - names of the columns the model uses, after selection.
+    Returns the artifact file's path.
+    """
+    info = {'version':artifact_version,
+            'model_set':model_set,
+            'columns':[str(col) for col in columns],
+            'kept_columns':[str(col) for col in kept_columns],
+            'feature_hash':feature_hash,
+            'model_hash':model_hash(pipeline)}
+    out_path = Path(folder)
+    file = out_path.joinpath(name + '_artifact.joblib')
+    temp_file = str(file) + '.tmp'
+    joblib.dump(dict(info, pipeline=pipeline), temp_file)
+    os.replace(temp_file, file)
+    with open(out_path.joinpath(name + '_artifact.json'), 'w') as f:
+        json.dump(info, f, indent=1)
+    return file
+
+
+#%% Using artifacts.
+def load_artifact(file, mmap_mode='r'):
+    artifact = joblib.load(file, mmap_mode=mmap_mode)
+    if artifact['version'] != artifact_version:
+        raise ValueError(str(file) + ' is artifact version ' +
+                         str(artifact['version']) + ', expected ' +
+                         str(artifact_version) + '.')
+    return artifact
+
+def load_model(file):
+    #The trained model from an artifact, or from a pickled classifier.
+    if str(file).endswith('.joblib'):
+        return load_artifact(file)['pipeline'].steps[-1][1]
+    with open(file, 'rb') as p:
+        return pickle.load(p)
+
+def predict_risk(artifact, X):
+    """
+    Readmission probabilities for X, the raw columns of the feature space
+    (numeric, then categorical, in the order of artifact['columns']).
+    """
+    if isinstance(X, pd.DataFrame):
+        X = X[artifact['columns']]
+    X = np.asarray(X)
+    if X.shape[1] != len(artifact['columns']):
+        raise ValueError('Expected ' + str(len(artifact['columns'])) +
+                         ' columns, got ' + str(X.shape[1]) + '.')
+    return artifact['pipeline'].predict_proba(X)[:,1]
+
+def model_importance(model):
+    """
+    Returns the model's feature importances, or absolute coefficients for
+    linear models. Models with neither (like hgb) raise a ValueError.
+    """
+    if hasattr(model, 'feature_importances_'):
+        return model.feature_importances_
+    if hasattr(model, 'coef_'):
+        return np.abs(model.coef_).ravel()
+    raise ValueError(type(model).__name__ + ' has no feature importances ' +
+                     'or coefficients to rank features by. For hgb, use ' +
+                     'the Shapley values from run_model(shapley=True).')
+
+def top_features(artifact):
+    """
+    Returns the model's kept columns and their feature importances (or
+    absolute coefficients), most important first, like *_Top_Features.csv.
+    """
+    model = artifact['pipeline'].steps[-1][1]
+    #The early stopping wrapper keeps the XGBClassifier in model_.
+    model = getattr(model, 'model_', model)
+    top = pd.DataFrame(data={'column_name':artifact['kept_columns'],
+                             'feat_importance':model_importance(model)})
+    return top.sort_values('feat_importance',ascending=False,
+                           ignore_index=True)
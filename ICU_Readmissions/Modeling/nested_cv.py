@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:10:00 2026
+
+Nested cross validation as one flat set of jobs, instead of
+cross_val_score(RandomizedSearchCV(...)) with both levels using n_jobs.
+
+Nesting the two pools oversubscribes the cores (each outer fold's search
+starts its own pool), and every fold gets its own pickled copy of the data.
+Here every (outer fold, candidate, inner fold) fit is its own job, all run
+in one pool with single threaded models. The data is written once to a
+memory mapped file that all the workers read from.
+
+Candidates are drawn the same way RandomizedSearchCV draws them, and the best
+one per outer fold is picked the same way (highest mean inner score, first
+one on ties), so the scores match cross_val_score with the search.
+
+If a preprocess transformer is given, it's fit once on each set of training
+rows, and the transformed data is cached for all the candidates that use it.
+
+With final=True, the search for the final model (every candidate on cv_inner
+splits of all the rows, then the best one refit on all of them) goes in the
+same pool, so there's no separate RandomizedSearchCV afterwards.
+
+With a cache_folder, every score is saved to disk, keyed by a hash of the
+data, the model with the candidate's params, and the rows of the split. Fits
+that have already been scored (like after a crash, or rerunning to get
+Shapley values) are read back instead of being redone.
+
+@author: Kirby
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import warnings
+import numpy as np
+from joblib import Parallel, delayed, dump, load
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterSampler
+from sklearn.pipeline import make_pipeline
+
+
+#%% Setup.
+def make_candidates(params, n_iter, random_state=1):
+    #Same candidates RandomizedSearchCV(n_iter, random_state) would try.
+    return list(ParameterSampler(params, n_iter, random_state=random_state))
+
+def make_folds(X, y, cv_outer, cv_inner):
+    """
+    Returns a list of outer folds, each a dict with the training and test
+    rows, and the inner splits of the training rows (as rows of X).
+    """
+    folds = []
+    for train, test in cv_outer.split(X, y):
+        inner = [(train[inner_train], train[inner_val]) for inner_train, inner_val
+                 in cv_inner.split(X[train], y[train])]
+        folds.append({'train':train, 'test':test, 'inner':inner})
+    return folds
+
+def single_threaded(model):
+    #The pool does the parallel work, so models shouldn't start their own.
+    #XGBoost (and the early stopping wrapper around it) uses every core when
+    #n_jobs is None, sklearn uses one.
+    n_jobs = model.get_params().get('n_jobs', 1)
+    if ((n_jobs not in [None, 1]) |
+        ((n_jobs is None) & ('XGB' in type(model).__name__))):
+        model = clone(model).set_params(n_jobs=1)
+    return model
+
+def share_array(X, folder, name):
+    #Write X once, and hand out a read only memory map of it.
+    file = os.path.join(folder, name + '.mmap')
+    dump(np.asarray(X), file)
+    return load(file, mmap_mode='r')
+
+def prepare_splits(X, splits, preprocess, folder):
+    """
+    Makes the data for each (train rows, validation rows) split. Without
+    preprocess, that's just the shared X and the rows. With it, it's fit once
+    per split on the training rows, and both parts get cached as memory maps.
+    """
+    shared = share_array(X, folder, 'X')
+    prepared = {}
+    for i, (train, val) in enumerate(splits):
+        key = (train.tobytes(), val.tobytes())
+        if key in prepared:
+            continue
+        if preprocess is None:
+            prepared[key] = {'X':shared, 'train':train, 'val':val}
+            continue
+        fitted = clone(preprocess).fit(X[train])
+        prepared[key] = {'X_train':share_array(fitted.transform(X[train]),
+                                               folder, 'train' + str(i)),
+                         'X_val':share_array(fitted.transform(X[val]),
+                                             folder, 'val' + str(i)),
+                         'train':train,
+                         'val':val,
+                         'preprocess':fitted}
+    return prepared
+
+def split_data(split, y, cols=None):
+    if 'X' in split:
+        X_train = split['X'][split['train']]
+        X_val = split['X'][split['val']]
+    else:
+        X_train = split['X_train']
+        X_val = split['X_val']
+    #Only some of the columns, when searching over a subset of features.
+    if cols is not None:
+        X_train = X_train[:, cols]
+        X_val = X_val[:, cols]
+    return X_train, y[split['train']], X_val, y[split['val']]
+
+
+#%% Jobs.
+def fit_and_score(model, params, split, y, scoring, cols=None):
+    X_train, y_train, X_val, y_val = split_data(split, y, cols)
+    est = clone(model).set_params(**params)
+    try:
+        est.fit(X_train, y_train)
+        return check_scoring(est, scoring)(est, X_val, y_val), est
+    except Exception as err:
+        #Same as error_score=np.nan in the sklearn searches.
+        warnings.warn('Fit failed for ' + str(params) + ': ' + repr(err))
+        return np.nan, None
+
+def score_only(model, params, split, y, scoring, cols=None):
+    return fit_and_score(model, params, split, y, scoring, cols)[0]
+
+def fit_final(model, params, X, y, preprocess, cols=None):
+    #Best candidate fit on all the rows, with its preprocessing if there is any.
+    est = clone(model).set_params(**params)
+    X = np.asarray(X)
+    if cols is not None:
+        X = X[:, cols]
+    if preprocess is not None:
+        est = make_pipeline(clone(preprocess), est)
+    return est.fit(X, y)
+
+
+#%% Score cache.
+def data_hash(X, y, preprocess, scoring):
+    h = hashlib.sha256()
+    for data in [X, y]:
+        h.update(str(data.shape).encode())
+        h.update(np.ascontiguousarray(data).tobytes())
+    h.update(repr(preprocess).encode())
+    h.update(repr(scoring).encode())
+    return h.hexdigest()
+
+def cache_key(data_key, model, params, train, val, cols=None):
+    h = hashlib.sha256(data_key.encode())
+    est = clone(model).set_params(**params)
+    h.update(type(est).__name__.encode())
+    h.update(repr(sorted(est.get_params().items())).encode())
+    h.update(train.tobytes())
+    h.update(val.tobytes())
+    if cols is not None:
+        h.update(b'cols' + np.asarray(cols).tobytes())
+    return h.hexdigest()
+
+def read_cached(cache_folder, key):
+    file = os.path.join(cache_folder, key + '.json')
+    if not os.path.exists(file):
+        return None
+    with open(file) as f:
+        return json.load(f)['score']
+
+def write_cached(cache_folder, key, score):
+    #Failed fits aren't saved, so they get retried.
+    if np.isnan(score):
+        return
+    file = os.path.join(cache_folder, key + '.json')
+    with open(file + '.tmp', 'w') as f:
+        json.dump({'score':float(score)}, f)
+    os.replace(file + '.tmp', file)
+
+def read_scores(model, jobs, cache_folder, data_key):
+    """
+    Looks up each (params, train rows, validation rows, columns) job in the
+    cache. Returns the scores (None if not cached), their keys, and the jobs
+    to run.
+    """
+    results = [None]*len(jobs)
+    keys = [None]*len(jobs)
+    if cache_folder is not None:
+        for i, (params, train, val, cols) in enumerate(jobs):
+            keys[i] = cache_key(data_key, model, params, train, val, cols)
+            results[i] = read_cached(cache_folder, keys[i])
+    todo = [i for i in range(len(jobs)) if results[i] is None]
+    return results, keys, todo
+
+def save_scores(results, keys, todo, scores, cache_folder):
+    for i, score in zip(todo, scores):
+        results[i] = score
+        if cache_folder is not None:
+            write_cached(cache_folder, keys[i], score)
+    return results
+
+def score_calls(model, jobs, todo, y, scoring, prep):
+    return [delayed(score_only)(model, jobs[i][0], prep(jobs[i][1], jobs[i][2]),
+                                y, scoring, jobs[i][3])
+            for i in todo]
+
+def best_candidate(scores):
+    #Highest mean score over the inner folds, first one on ties. Candidates
+    #with a failed fold (nan) are last, like in RandomizedSearchCV.
+    means = scores.mean(axis=1)
+    if np.isnan(means).all():
+        return 0
+    return int(np.nanargmax(means))
+
+
+#%% Nested cross validation.
+def nested_cv(model, params, X, y, cv_outer, cv_inner, n_iter=30,
+              scoring='roc_auc', n_jobs=-2, random_state=1, preprocess=None,
+              verbose=0, final=False, cache_folder=None):
+    """
+    Returns the outer fold scores of a RandomizedSearchCV(model, params,
+    n_iter, cv=cv_inner, refit=True) evaluated with cv_outer, plus the inner
+    scores ([outer fold, candidate, inner fold]) and each fold's best params.
+    final - also run that search on all of X, and return its scores
+        ([candidate, inner fold]), best params, and best model fit on all of X.
+    cache_folder - folder to keep scores in between runs, None to not cache.
+    """
+    return nested_cv_subsets(model, [params], X, y, cv_outer, cv_inner, [None],
+                             n_iter=n_iter, scoring=scoring, n_jobs=n_jobs,
+                             random_state=random_state, preprocess=preprocess,
+                             verbose=verbose, final=final,
+                             cache_folder=cache_folder)[0]
+
+def nested_cv_subsets(model, params, X, y, cv_outer, cv_inner, subsets,
+                      n_iter=30, scoring='roc_auc', n_jobs=-2, random_state=1,
+                      preprocess=None, verbose=0, final=False,
+                      cache_folder=None):
+    """
+    nested_cv() for several subsets of X's columns at once, all with the same
+    folds, and all their fits in one pool.
+    params - list of parameter spaces, one per subset.
+    subsets - list of column indexes (or bool masks) to use, None for all.
+    Returns a list of nested_cv() results, one per subset.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    model = single_threaded(model)
+    candidates = [make_candidates(p, n_iter, random_state) for p in params]
+    folds = make_folds(X, y, cv_outer, cv_inner)
+    #Groups of inner splits to search over. One per outer fold, and one over
+    #all the rows for the final model.
+    groups = [fold['inner'] for fold in folds]
+    if final:
+        groups.append(list(cv_inner.split(X, y)))
+    data_key = None
+    if cache_folder is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+        data_key = data_hash(X, y, preprocess, scoring)
+
+    folder = tempfile.mkdtemp(prefix='nested_cv_')
+    try:
+        splits = ([split for group in groups for split in group] +
+                  [(fold['train'], fold['test']) for fold in folds])
+        prepared = prepare_splits(X, splits, preprocess, folder)
+        def prep(train, val):
+            return prepared[(train.tobytes(), val.tobytes())]
+
+        #Every candidate on every inner fold of every group, for every
+        #subset, in one pool.
+        tasks = [(s, g, c, k) for s in range(len(subsets))
+                 for g, group in enumerate(groups)
+                 for c in range(len(candidates[s]))
+                 for k in range(len(group))]
+        jobs = [(candidates[s][c],) + tuple(groups[g][k]) + (subsets[s],)
+                for s, g, c, k in tasks]
+        results, keys, todo = read_scores(model, jobs, cache_folder, data_key)
+        with Parallel(n_jobs=n_jobs, verbose=verbose) as parallel:
+            found = parallel(score_calls(model, jobs, todo, y, scoring, prep))
+            results = save_scores(results, keys, todo, found, cache_folder)
+            scores = [np.full((len(groups), len(candidates[s]),
+                               max(len(group) for group in groups)), np.nan)
+                      for s in range(len(subsets))]
+            for (s, g, c, k), score in zip(tasks, results):
+                scores[s][g, c, k] = score
+
+            #Refit each outer fold's best candidate, and score it on the test.
+            #The final models get fit alongside them.
+            best = [[best_candidate(scores[s][g]) for g in range(len(groups))]
+                    for s in range(len(subsets))]
+            outer_jobs = [(candidates[s][best[s][f]], fold['train'],
+                           fold['test'], subsets[s])
+                          for s in range(len(subsets))
+                          for f, fold in enumerate(folds)]
+            outer_scores, keys, todo = read_scores(model, outer_jobs,
+                                                   cache_folder, data_key)
+            calls = score_calls(model, outer_jobs, todo, y, scoring, prep)
+            if final:
+                calls += [delayed(fit_final)(model, candidates[s][best[s][-1]],
+                                             X, y, preprocess, subsets[s])
+                          for s in range(len(subsets))]
+            found = parallel(calls)
+            if final:
+                final_models = found[len(todo):]
+                found = found[:len(todo)]
+            outer_scores = save_scores(outer_scores, keys, todo, found,
+                                       cache_folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    all_results = []
+    for s in range(len(subsets)):
+        result = {'scores':np.array(outer_scores[s*len(folds):
+                                                 (s + 1)*len(folds)]),
+                  'inner_scores':scores[s][:len(folds)],
+                  'candidates':candidates[s],
+                  'best_params':[candidates[s][b]
+                                 for b in best[s][:len(folds)]]}
+        if final:
+            result.update({'final_scores':scores[s][-1],
+                           'final_params':candidates[s][best[s][-1]],
+                           'best_model':final_models[s]})
+        all_results.append(result)
+    return all_results
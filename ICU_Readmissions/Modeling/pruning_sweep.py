@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:10:00 2026
+
+Runs a model on several pruned versions of a feature space, one for each
+feature importance threshold (like the ones from generate_thresholds.py).
+
+Calling run_model once per threshold reloads and preprocesses the data,
+unpickles the previous model, and redoes the whole nested search every time.
+Here the data is loaded and preprocessed once, the previous model's feature
+importances are read once, and every threshold's nested cross validation
+(and final model search) goes in one pool of jobs, all on the same folds.
+
+Each threshold gets the same output files run_model would make for it.
+
+@author: Kirby
+"""
+
+def run_sweep(model_set,prev_model_file,thresholds,num_data_name,
+              cat_data_name,col_names_name,output_names,n_jobs=-2,
+              search_strategy='random',score_cache='cv_score_cache'):
+    """
+    Runs model_set on the features of the prev_model_file model with
+    importance >= each of thresholds, naming outputs with output_names.
+    Returns a dict of output name to nested cross validation results.
+    """
+    import numpy as np
+    import warnings
+    from pathlib import Path
+    from time import time
+    from sklearn.model_selection import StratifiedKFold
+    from nested_cv import nested_cv_subsets
+    from search_strategies import strategy_model
+    from model_artifact import (model_pipeline, save_artifact, load_model,
+                                model_importance)
+    from sklearn.compose import ColumnTransformer
+    from PipelineV3 import (load_feature_space, model_params, test_results,
+                            feature_importance, native_missing)
+
+    if search_strategy in ['halving','path']:
+        raise ValueError('Pruning sweeps need a flat search strategy, ' +
+                         "'random' or 'early_stopping'.")
+    start = time()
+    wd = Path(__file__).parent
+
+    #%% Load in data, once.
+    X_train, X_test, y_train, y_test, cols, info = load_feature_space(
+        num_data_name,cat_data_name,col_names_name,wd,
+        impute=model_set not in native_missing)
+
+    #%% Feature importances of the previous model, once.
+    importance = model_importance(load_model(prev_model_file))
+
+    #Same columns SelectFromModel(prev_model, threshold) would keep.
+    subsets = []
+    names = []
+    for thresh, name in zip(thresholds, output_names):
+        keep = np.flatnonzero(importance >= thresh)
+        # Don't run the model if the threshold cuts to less than 2 features.
+        if len(keep) < 2:
+            warnings.warn("Threshold " + str(thresh) +
+                          " cuts too many features. Drop it.")
+            continue
+        subsets.append(keep)
+        names.append(name)
+
+    #%% Nested cross validation for every threshold at once.
+    model = None
+    params = []
+    for keep in subsets:
+        model, subset_params = model_params(model_set,len(keep))
+        model, subset_params = strategy_model(model_set, model, subset_params,
+                                              search_strategy)
+        params.append(subset_params)
+    cv_inner = StratifiedKFold(n_splits=3, shuffle=True, random_state=1)
+    cv_outer = StratifiedKFold(n_splits=5, shuffle=True, random_state=1)
+    results = nested_cv_subsets(model, params, X_train, y_train, cv_outer,
+                                cv_inner, subsets, n_iter=30,
+                                scoring='roc_auc', n_jobs=n_jobs,
+                                random_state=1, verbose=1, final=True,
+                                cache_folder=score_cache)
+    calc = time() - start
+
+    #%% Save the same outputs as run_model, for each threshold.
+    for keep, name, result in zip(subsets, names, results):
+        scores = result['scores']
+        classifier = result['best_model']
+        with open(name + '_' + model_set + '_results_pipelineV3.txt','a') as f:
+            print(name + ' AUROC: %.3f (%.3f)' % (np.mean(scores),
+                                                   np.std(scores)))
+            f.write('AUROC: %.3f (%.3f)' % (np.mean(scores), np.std(scores)))
+            f.write('\n' + str(classifier.get_params()))
+            f.write('\nCalculation time: ' + str(calc/60) +
+                    ' min (whole sweep).')
+        test_results(classifier,X_test[:,keep],y_test,model_set,name)
+        selection = ColumnTransformer([('keep','passthrough',keep)],
+                                      remainder='drop').fit(X_train)
+        save_artifact(name + '_' + model_set,
+                      model_pipeline(info['preprocess'], classifier, selection),
+                      cols, cols[keep], info['feature_hash'], model_set)
+        feature_importance(classifier,cols[keep],model_set,name)
+
+    return dict(zip(names, results))
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:00:00 2026
+
+Scores new ICU discharges with a saved model artifact (see model_artifact.py).
+
+Takes a cohort csv of the stays to score, in the same format as
+Cohort/ICU_readmissions_dataset.csv, and writes their readmission risk to a
+csv. Stays are done batch_size at a time, so memory doesn't grow with the
+size of the cohort, and each batch's scores are appended to the output as
+soon as they're done.
+
+Only the feature scripts that make columns the model kept (and the scripts
+those depend on) get run, through regenerate_features.py, on just the
+batch's stays. Which script makes which column is read off the headers of the
+feature files already made for the research cohort, so those have to be made
+first. A kept column that no script makes is an error, instead of being
+left for the imputer to fill in.
+
+The feature scripts pass the cohort's stay IDs to load_table()/iter_table(),
+so with the parquet store (see eicu_tables.py) each batch only reads its own
+stays' rows. Without the store, every batch still reads through the whole
+csvs, just filtering them chunk by chunk, so that's a pass over each table per
+batch. Run eicu_tables.py first when scoring more than a batch or two.
+
+The scripts read the cohort from, and write their outputs to, fixed places
+relative to their own files. So they're run from a copy of the Features
+folder in workspace, with its own Cohort folder, and the eICU files linked in,
+to leave the research cohort's features alone. NurseChartingScan and the HICL
+legend don't depend on the cohort, so their outputs get linked in if they've
+already been made. Otherwise they're run once, before the first batch, and
+those are the only full passes over nurseCharting and medication.
+
+PTS features aren't made by regenerate_features.py, so models that kept any
+are refused. Columns the model didn't keep are left blank, the pipeline's
+selection step drops them anyway.
+
+Usage:
+python score_stays.py full_features_rf_artifact.joblib new_stays.csv
+    risk_scores.csv --batch-size 5000
+
+@author: Kirby
+"""
+import os
+import sys
+import shutil
+import argparse
+import subprocess
+import importlib.util
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from model_artifact import load_artifact, predict_risk
+
+file_path = Path(__file__).parent
+project_path = file_path.parent
+
+#Stays scored at once.
+batch_size = 1000
+
+#Where the copy of the feature code is run.
+workspace = file_path.joinpath('scoring_workspace')
+
+#Nodes whose outputs are the same for any cohort.
+cohort_free = ['NurseChartingScan','Create HICL Drug Name Legend']
+
+
+#%% Finding the features a model needs.
+def load_regenerate(features_path):
+    #regenerate_features.py, with its paths set from features_path.
+    spec = importlib.util.spec_from_file_location(
+        'regenerate_features', features_path.joinpath('regenerate_features.py'))
+    regen = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(regen)
+    return regen
+
+def output_csvs(regen, n):
+    return [regen.full_path(out) for out in n['outputs']
+            if str(out).endswith('.csv')]
+
+def column_sources(regen):
+    """
+    Returns a dict of column name to the node whose output has it (from the
+    research cohort's outputs), and the names of nodes without outputs yet.
+    """
+    sources = {}
+    unknown = []
+    for n in regen.nodes:
+        for out in output_csvs(regen, n):
+            if not os.path.exists(out):
+                unknown.append(n['name'])
+                continue
+            for col in pd.read_csv(out, nrows=0).columns:
+                #Mixed feature spaces swap commas for underscores in names.
+                sources.setdefault(col, n['name'])
+                sources.setdefault(col.replace(',','_'), n['name'])
+    return sources, unknown
+
+def pts_columns(columns):
+    #tsfresh names its features <signal>__<calculator>__<parameters>.
+    return [col for col in columns if '__' in col]
+
+def needed_nodes(regen, kept_columns):
+    """
+    Returns the names of the nodes needed to make kept_columns, with
+    everything they depend on, in the order of regen.nodes.
+    """
+    pts = pts_columns(kept_columns)
+    if len(pts) > 0:
+        raise ValueError('The model kept ' + str(len(pts)) + ' PTS features '
+                         + '(like ' + pts[0] + '), which score_stays.py '
+                         + 'can\'t make.')
+    sources, unknown = column_sources(regen)
+    missing = [col for col in kept_columns if col not in sources]
+    if len(missing) > 0:
+        message = 'No feature script makes ' + str(missing) + '.'
+        if len(unknown) > 0:
+            message += (' These scripts have no outputs yet, run them for '
+                        + 'the research cohort first: ' + str(unknown))
+        raise ValueError(message)
+    names = set(sources[col] for col in kept_columns)
+    deps = regen.find_dependencies(regen.nodes)
+    todo = list(names)
+    while len(todo) > 0:
+        for dep in deps[todo.pop()]:
+            if dep not in names:
+                names.add(dep)
+                todo.append(dep)
+    return [n['name'] for n in regen.nodes if n['name'] in names]
+
+
+#%% Workspace.
+def in_workspace(path, folder=workspace):
+    #Where a path in the project (or eICU folder) is in the workspace.
+    return Path(folder).joinpath(os.path.relpath(path, project_path.parent))
+
+def link_folder(src, dst, skip=()):
+    #A real folder at dst, with links to everything in src except skip.
+    dst.mkdir(parents=True, exist_ok=True)
+    for path in src.iterdir():
+        if (path.name not in skip) & (not dst.joinpath(path.name).exists()):
+            os.symlink(path, dst.joinpath(path.name))
+
+def make_workspace(regen, names, folder=workspace):
+    """
+    Copies the feature code into folder, links in the eICU files, and the
+    outputs of cohort free nodes that exist already. Returns the names of the
+    nodes that still need to be run.
+    """
+    folder = Path(folder)
+    if folder.exists():
+        shutil.rmtree(folder)
+    outputs = [regen.full_path(out) for n in regen.nodes
+               for out in n['outputs']]
+
+    def ignore(root, files):
+        return [f for f in files if (f == '__pycache__') |
+                (f == 'regenerate_state.json') | (f == 'PTS') |
+                (os.path.normpath(os.path.join(root, f)) in outputs)]
+    shutil.copytree(regen.file_path, in_workspace(regen.file_path, folder),
+                    ignore=ignore)
+    shutil.copy(project_path.joinpath('eicu_tables.py'),
+                in_workspace(project_path, folder))
+    in_workspace(regen.cohort_file, folder).parent.mkdir()
+
+    #eICU files are linked, so they aren't copied, but writes stay here.
+    link_folder(regen.eicu_path, in_workspace(regen.eicu_path, folder),
+                skip=[regen.store_path.name])
+    if regen.store_path.exists():
+        link_folder(regen.store_path, in_workspace(regen.store_path, folder),
+                    skip=[regen.subset_path.name])
+
+    to_run = []
+    for n in regen.nodes:
+        if n['name'] not in names:
+            continue
+        if (n['name'] in cohort_free) & regen.outputs_exist(n):
+            for out in n['outputs']:
+                os.symlink(regen.full_path(out),
+                           in_workspace(regen.full_path(out), folder))
+            continue
+        to_run.append(n['name'])
+    return to_run
+
+
+#%% Scoring.
+def batch_features(regen, names, columns, batch, folder=workspace):
+    """
+    Returns the batch's feature space, with columns in order, from the
+    outputs of the named nodes in the workspace.
+    """
+    X = pd.DataFrame(np.nan, index=range(len(batch)), columns=columns)
+    for n in regen.nodes:
+        if n['name'] not in names:
+            continue
+        for out in output_csvs(regen, n):
+            feats = pd.read_csv(in_workspace(out, folder))
+            if 'patientunitstayid' in feats.columns:
+                feats = feats.set_index('patientunitstayid').reindex(
+                    batch['patientunitstayid']).reset_index(drop=True)
+            else:
+                #Outputs without ids are in the same order as the cohort.
+                feats = feats.reset_index(drop=True)
+            feats.columns = [str(col) for col in feats.columns]
+            for col in feats.columns:
+                for name in [col, col.replace(',','_')]:
+                    if name in X.columns:
+                        X[name] = feats[col].to_numpy()
+    return X
+
+def run_nodes(regen, to_run, folder=workspace):
+    #With no names, regenerate_features.py would run everything.
+    if len(to_run) > 0:
+        subprocess.run([sys.executable, 'regenerate_features.py'] + to_run,
+                       cwd=in_workspace(regen.file_path, folder), check=True)
+
+def score_stays(artifact_file, cohort_file, out_file, batch_size=batch_size,
+                folder=workspace):
+    """
+    Writes the readmission risk of each stay in cohort_file to out_file,
+    scored with the artifact in artifact_file, batch_size stays at a time.
+    """
+    artifact = load_artifact(artifact_file)
+    regen = load_regenerate(project_path.joinpath('Features'))
+    names = needed_nodes(regen, artifact['kept_columns'])
+    to_run = make_workspace(regen, names, folder)
+    print('Running ' + str(to_run))
+
+    #Cohort free nodes only need running once, not for every batch.
+    once = [name for name in to_run if name in cohort_free]
+    to_run = [name for name in to_run if name not in cohort_free]
+
+    first = True
+    for batch in pd.read_csv(cohort_file, chunksize=batch_size):
+        batch = batch.reset_index(drop=True)
+        batch.to_csv(in_workspace(regen.cohort_file, folder), index=False)
+        if first:
+            run_nodes(regen, once, folder)
+        run_nodes(regen, to_run, folder)
+        X = batch_features(regen, names, artifact['columns'], batch, folder)
+        scores = pd.DataFrame({'patientunitstayid':batch['patientunitstayid'],
+                               'readmission_risk':predict_risk(artifact, X)})
+        scores.to_csv(out_file, mode='w' if first else 'a', header=first,
+                      index=False)
+        first = False
+        print(str(len(batch)) + ' stays scored.')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Scores ICU stays with a saved model artifact.')
+    parser.add_argument('artifact', help='*_artifact.joblib file.')
+    parser.add_argument('cohort', help='Cohort csv of the stays to score.')
+    parser.add_argument('output', help='Csv to write the scores to.')
+    parser.add_argument('--batch-size', type=int, default=batch_size)
+    parser.add_argument('--workspace', default=str(workspace))
+    args = parser.parse_args()
+    score_stays(args.artifact, args.cohort, args.output, args.batch_size,
+                args.workspace)
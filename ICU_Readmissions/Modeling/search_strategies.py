@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:00:00 2026
+
+Hyperparameter search strategies for run_model.
+
+'random' - RandomizedSearchCV with 30 candidates, all trained on everything.
+    This is what run_model always did.
+'halving' - HalvingRandomSearchCV. Lots of candidates start on a small budget,
+    and only the best third move on to 3 times the budget each round. For RF
+    and XGB the budget is n_estimators (up to 1000), for HGB it's max_iter,
+    otherwise it's rows (starting at 1000).
+'early_stopping' - XGB and HGB only. Each fit holds out part of its training
+    rows, and stops adding trees once AUROC on those rows stops improving, so
+    n_estimators (max_iter for HGB) is just a maximum instead of something to
+    search over.
+'path' - LR only. The same candidates as 'random', but each fold fits them in
+    order of C, each one warm started from the last one's coefficients, so
+    most fits only take a few iterations. Uses lbfgs instead of saga, since
+    saga doesn't get much out of warm starts (same l2 problem, same answer up
+    to the solver's tolerance). Picks C the same way 'random' does.
+
+@author: Kirby
+"""
+import warnings
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import (RandomizedSearchCV, train_test_split,
+                                     check_cv)
+from nested_cv import make_candidates, best_candidate
+
+strategies = ['random','halving','early_stopping','path']
+
+#Largest n_estimators used as the halving budget and early stopping maximum.
+max_estimators = 1000
+
+#Parameter that sets the number of trees, for the tree model sets.
+tree_params = {'rf':'n_estimators',
+               'xgb':'n_estimators',
+               'xgb_hist':'n_estimators',
+               'hgb':'max_iter'}
+
+#Fewest rows a candidate is trained on when halving over rows. Smaller than
+#this, and some folds don't have enough readmissions for a useful AUROC.
+min_rows = 1000
+
+
+#%% Early stopping for XGBoost.
+class EarlyStoppingXGBClassifier(ClassifierMixin, BaseEstimator):
+    """
+    XGBClassifier that picks its own number of trees. Holds out
+    validation_fraction of the training rows (stratified), and stops when
+    AUROC on them hasn't improved for early_stopping_rounds trees.
+    Any other parameters are passed to XGBClassifier.
+    """
+    def __init__(self, n_estimators=max_estimators, early_stopping_rounds=20,
+                 validation_fraction=0.2, random_state=1, n_jobs=None,
+                 eta=0.3, gamma=0, max_depth=6, tree_method=None):
+        self.n_estimators = n_estimators
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.eta = eta
+        self.gamma = gamma
+        self.max_depth = max_depth
+        self.tree_method = tree_method
+
+    def fit(self, X, y):
+        from xgboost import XGBClassifier
+        X_train, X_val, y_train, y_val = train_test_split(
+            X, y, test_size=self.validation_fraction, stratify=y,
+            random_state=self.random_state)
+        xgb_params = {'n_estimators':self.n_estimators,
+                      'random_state':self.random_state,
+                      'n_jobs':self.n_jobs,
+                      'eta':self.eta,
+                      'gamma':self.gamma,
+                      'max_depth':self.max_depth}
+        if self.tree_method is not None:
+            xgb_params['tree_method'] = self.tree_method
+        fit_params = {'eval_set':[(X_val, y_val)], 'verbose':False}
+        #Newer XGBoost takes the early stopping settings in the constructor,
+        #older versions take them in fit.
+        if 'early_stopping_rounds' in XGBClassifier().get_params():
+            xgb_params.update({'early_stopping_rounds':self.early_stopping_rounds,
+                               'eval_metric':'auc'})
+        else:
+            xgb_params['use_label_encoder'] = False
+            fit_params.update({'early_stopping_rounds':self.early_stopping_rounds,
+                               'eval_metric':'auc'})
+        self.model_ = XGBClassifier(**xgb_params)
+        self.model_.fit(X_train, y_train, **fit_params)
+        self.classes_ = self.model_.classes_
+        self.best_iteration_ = self.model_.best_iteration
+        self.feature_importances_ = self.model_.feature_importances_
+        return self
+
+    def predict_proba(self, X):
+        return self.model_.predict_proba(X)
+
+    def predict(self, X):
+        return self.model_.predict(X)
+
+
+#%% Warm started regularization path for LR.
+def path_scores(estimator, path, X, y, train, val, scoring):
+    """
+    Fits the candidates in path (sorted by C) one after another on the train
+    rows, each starting from the last one's coefficients, and scores them on
+    the validation rows.
+    """
+    est = clone(estimator).set_params(warm_start=True)
+    scores = []
+    for params in path:
+        try:
+            est.set_params(**params).fit(X[train], y[train])
+            scores.append(check_scoring(est, scoring)(est, X[val], y[val]))
+        except Exception as err:
+            warnings.warn('Fit failed for ' + str(params) + ': ' + repr(err))
+            est = clone(estimator).set_params(warm_start=True)
+            scores.append(np.nan)
+    return scores
+
+class LRPathSearchCV(ClassifierMixin, BaseEstimator):
+    """
+    RandomizedSearchCV for LogisticRegression, over the same candidates, that
+    fits each fold's candidates as a warm started path of increasing C.
+    Candidates that differ in anything besides C get their own paths. The
+    best candidate (highest mean score, first one on ties) is refit on all
+    the rows, like refit=True.
+    """
+    def __init__(self, estimator, param_distributions, n_iter=30,
+                 scoring='roc_auc', cv=3, n_jobs=None, random_state=None,
+                 verbose=0):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.n_iter = n_iter
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.verbose = verbose
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        candidates = make_candidates(self.param_distributions, self.n_iter,
+                                     self.random_state)
+        splits = list(check_cv(self.cv, y, classifier=True).split(X, y))
+        default_C = self.estimator.get_params()['C']
+
+        #One path per set of other params, each in order of C.
+        paths = {}
+        for i, params in enumerate(candidates):
+            others = repr(sorted((key, value) for key, value in params.items()
+                                 if key != 'C'))
+            paths.setdefault(others, []).append(i)
+        paths = [sorted(path, key=lambda i: candidates[i].get('C', default_C))
+                 for path in paths.values()]
+
+        tasks = [(path, k) for path in paths for k in range(len(splits))]
+        results = Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(
+            delayed(path_scores)(self.estimator, [candidates[i] for i in path],
+                                 X, y, splits[k][0], splits[k][1],
+                                 self.scoring)
+            for path, k in tasks)
+        scores = np.full((len(candidates), len(splits)), np.nan)
+        for (path, k), path_result in zip(tasks, results):
+            scores[path, k] = path_result
+
+        self.cv_results_ = {'params':candidates,
+                            'mean_test_score':scores.mean(axis=1),
+                            'split_test_scores':scores}
+        self.best_index_ = best_candidate(scores)
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = self.cv_results_['mean_test_score'][self.best_index_]
+        self.best_estimator_ = clone(self.estimator).set_params(
+            **self.best_params_).fit(X, y)
+        self.classes_ = self.best_estimator_.classes_
+        return self
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+    def decision_function(self, X):
+        return self.best_estimator_.decision_function(X)
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+
+#%% Making searches.
+def strategy_model(model_set, model, params, search_strategy):
+    """
+    Returns the model and parameter space to search over for a strategy.
+    """
+    if search_strategy == 'path':
+        if model_set != 'lr':
+            raise ValueError("path search is only for model_set 'lr'.")
+        #lbfgs warm starts well, saga barely does.
+        return clone(model).set_params(solver='lbfgs'), params
+    if search_strategy == 'early_stopping':
+        if model_set not in ['xgb','xgb_hist','hgb']:
+            raise ValueError("early_stopping search is only for model_set " +
+                             "'xgb', 'xgb_hist' or 'hgb'.")
+        #Trees are picked by early stopping, not searched over.
+        params = {key:value for key, value in params.items()
+                  if key != tree_params[model_set]}
+        if model_set == 'hgb':
+            #HistGradientBoostingClassifier does it itself.
+            model = clone(model).set_params(early_stopping=True,
+                                            scoring='roc_auc',
+                                            validation_fraction=0.2,
+                                            n_iter_no_change=20,
+                                            max_iter=max_estimators)
+            return model, params
+        if model_set == 'xgb_hist':
+            return EarlyStoppingXGBClassifier(tree_method='hist'), params
+        return EarlyStoppingXGBClassifier(), params
+    if (search_strategy == 'halving') & (model_set in tree_params):
+        #The number of trees is the budget halving hands out.
+        params = {key:value for key, value in params.items()
+                  if key != tree_params[model_set]}
+    return model, params
+
+def make_search(model_set, model, params, search_strategy, cv_inner, n_jobs,
+                n_iter=30, random_state=1, verbose=1):
+    """
+    Returns a search (with refit=True, scored by AUROC) for the strategy.
+    """
+    if search_strategy not in strategies:
+        raise ValueError('search_strategy must be one of ' + str(strategies))
+    model, params = strategy_model(model_set, model, params, search_strategy)
+
+    if search_strategy == 'halving':
+        from sklearn.experimental import enable_halving_search_cv
+        from sklearn.model_selection import HalvingRandomSearchCV
+        if model_set in tree_params:
+            budget = {'resource':tree_params[model_set],
+                      'min_resources':10,
+                      'max_resources':max_estimators}
+        else:
+            budget = {'resource':'n_samples',
+                      'min_resources':min_rows}
+        return HalvingRandomSearchCV(model, params, factor=3, scoring='roc_auc',
+                                     cv=cv_inner, n_jobs=n_jobs, refit=True,
+                                     random_state=random_state,
+                                     verbose=verbose, **budget)
+
+    if search_strategy == 'path':
+        return LRPathSearchCV(model, params, n_iter=n_iter, scoring='roc_auc',
+                              cv=cv_inner, n_jobs=n_jobs,
+                              random_state=random_state, verbose=verbose)
+
+    return RandomizedSearchCV(model, params, n_iter=n_iter, scoring='roc_auc',
+                              n_jobs=n_jobs, cv=cv_inner, verbose=verbose,
+                              refit=True, random_state=random_state)
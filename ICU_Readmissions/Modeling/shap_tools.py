@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:05:00 2026
+
+Shapley values for run_model's shapley option, without taking all night.
+
+Tree models (RF, XGB, HGB) use TreeExplainer with tree path dependent
+perturbation, so there's no background set to loop over. Other models use
+shap.Explainer with a background sample of the rows, like before.
+
+Rows can be cut down to a stratified sample, and get split into chunks that
+are explained in parallel. The values (for the readmission class) are saved
+to folder as a compressed .npz, named after hashes of the model and the rows,
+so explaining the same model again just reads them back.
+
+@author: Kirby
+"""
+import os
+import pickle
+import hashlib
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.model_selection import train_test_split
+
+#Rows used as the background for models that aren't trees.
+background_rows = 100
+
+
+#%% Hashes and samples.
+def model_hash(model):
+    return hashlib.sha256(pickle.dumps(model)).hexdigest()
+
+def rows_hash(X, rows):
+    h = hashlib.sha256(rows.tobytes())
+    h.update(np.ascontiguousarray(X[rows]).tobytes())
+    return h.hexdigest()
+
+def sample_rows(y, n_rows=None, random_state=1):
+    """
+    Returns the indexes of a stratified sample of n_rows rows (sorted), or
+    all of them if n_rows is None or more than there are.
+    """
+    if (n_rows is None) or (n_rows >= len(y)):
+        return np.arange(len(y))
+    rows, _ = train_test_split(np.arange(len(y)), train_size=n_rows,
+                               stratify=y, random_state=random_state)
+    return np.sort(rows)
+
+
+#%% Explaining.
+def is_tree_model(model):
+    return (hasattr(model, 'estimators_') | hasattr(model, 'get_booster') |
+            (type(model).__name__ == 'HistGradientBoostingClassifier'))
+
+def positive_class(values):
+    #Classifiers can give values for both classes, as a list or a last axis.
+    if isinstance(values, list):
+        return values[-1]
+    values = np.asarray(values)
+    if values.ndim == 3:
+        return values[:,:,-1]
+    return values
+
+def explain_chunk(model, X_chunk, background):
+    import shap
+    if background is None:
+        ex = shap.TreeExplainer(model,
+                                feature_perturbation='tree_path_dependent')
+        values = ex.shap_values(X_chunk, check_additivity=False)
+    else:
+        ex = shap.Explainer(model, background)
+        values = ex.shap_values(X_chunk)
+    return positive_class(values).astype(np.float32)
+
+def shap_values(model, X, y, n_rows=None, n_jobs=-2, chunk_size=None,
+                folder='shap_values', random_state=1):
+    """
+    Returns the Shapley values for model on (a stratified sample of n_rows of)
+    X, and which rows of X they're for. Rows are split into chunk_size chunks
+    (by default one per process) and run on n_jobs processes. Values are
+    kept in folder, set it to None to not save them.
+    """
+    X = np.asarray(X)
+    rows = sample_rows(np.asarray(y), n_rows, random_state)
+    if folder is not None:
+        file = os.path.join(folder, model_hash(model)[:16] + '_' +
+                            rows_hash(X, rows)[:16] + '.npz')
+        if os.path.exists(file):
+            return np.load(file)['values'], rows
+
+    background = None
+    if not is_tree_model(model):
+        background = X[sample_rows(np.asarray(y), background_rows,
+                                   random_state)]
+    if chunk_size is None:
+        chunk_size = int(np.ceil(len(rows)/effective_n_jobs(n_jobs)))
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    values = Parallel(n_jobs=n_jobs)(delayed(explain_chunk)(model, X[chunk],
+                                                            background)
+                                     for chunk in chunks)
+    values = np.concatenate(values)
+
+    if folder is not None:
+        os.makedirs(folder, exist_ok=True)
+        np.savez_compressed(file + '.tmp.npz', values=values, rows=rows)
+        os.replace(file + '.tmp.npz', file)
+    return values, rows
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:30:00 2026
+
+Converts the raw eICU csvs into a typed parquet store, partitioned by ranges
+of patientunitstayid, and loads tables back out of it.
+
+Cohort and feature code should pull eICU tables through load_table() instead
+of pd.read_csv(), so only the columns and stays needed get read off disk.
+If a table hasn't been converted yet, load_table() falls back to reading the
+csv, so everything still runs before the conversion is done.
+
+Run this file once after placing the raw eICU csvs in the "eicu" folder to
+build the store. It has to be rerun if the raw csvs change.
+
+Runtime: ~30 minutes for all of eICU, only needs to be done once.
+
+@author: Kirby
+"""
+import re
+import shutil
+import operator
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+file_path = Path(__file__)
+eicu_path = file_path.parent.parent.joinpath('eicu')
+store_path = eicu_path.joinpath('parquet')
+
+#Number of consecutive patientunitstayids stored together in one partition.
+stays_per_partition = 100000
+
+#Number of rows used to guess each column's type before converting.
+sample_rows = 1000000
+
+#Comparisons allowed in filters, as (column, op, value) tuples.
+filter_ops = {'==':operator.eq,
+              '!=':operator.ne,
+              '<':operator.lt,
+              '<=':operator.le,
+              '>':operator.gt,
+              '>=':operator.ge}
+
+
+#%% Finding tables.
+def table_key(table_name):
+    #Scripts spell the tables differently (Treatment.csv, treatment.csv...),
+    #so tables are matched on their lowercase name without extensions.
+    return Path(str(table_name)).name.split('.')[0].lower()
+
+def find_csv(table_name):
+    key = table_key(table_name)
+    for path in sorted(eicu_path.iterdir()):
+        if path.name.lower() in [key + '.csv', key + '.csv.gz']:
+            return path
+    raise FileNotFoundError(str(table_name) + ' not found in ' + str(eicu_path))
+
+def table_store_path(table_name):
+    return store_path.joinpath(table_key(table_name))
+
+def is_converted(table_name):
+    return table_store_path(table_name).exists()
+
+
+#%% Converting csvs to parquet.
+def arrow_type(dtype):
+    import pyarrow as pa
+    if pd.api.types.is_bool_dtype(dtype):
+        return pa.bool_()
+    if pd.api.types.is_integer_dtype(dtype):
+        return pa.int64()
+    if pd.api.types.is_float_dtype(dtype):
+        return pa.float64()
+    return pa.string()
+
+def write_store(csv_file, out_path, column_types):
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    import pyarrow.dataset as ds
+
+    #Start clean, so partitions from an earlier attempt don't linger.
+    if out_path.exists():
+        shutil.rmtree(out_path)
+
+    reader = pv.open_csv(
+        csv_file,
+        read_options=pv.ReadOptions(block_size=64 << 20),
+        convert_options=pv.ConvertOptions(column_types=column_types,
+                                          strings_can_be_null=True))
+
+    #Tables without stay IDs (hospital.csv...) are small, just one file.
+    if 'patientunitstayid' not in reader.schema.names:
+        ds.write_dataset(reader, out_path, format='parquet')
+        return
+
+    schema = reader.schema.append(pa.field('stay_bucket', pa.int64()))
+    def add_buckets(reader):
+        for batch in reader:
+            ids = batch.column('patientunitstayid').to_numpy(
+                zero_copy_only=False)
+            bucket = pa.array(ids // stays_per_partition, type=pa.int64())
+            yield pa.RecordBatch.from_arrays(batch.columns + [bucket],
+                                             schema=schema)
+
+    ds.write_dataset(add_buckets(reader), out_path, schema=schema,
+                     format='parquet',
+                     partitioning=ds.partitioning(
+                         pa.schema([('stay_bucket', pa.int64())]),
+                         flavor='hive'))
+
+def convert_table(table_name):
+    import pyarrow as pa
+
+    csv_file = find_csv(table_name)
+    out_path = table_store_path(table_name)
+
+    #Guess column types from a sample so every chunk gets the same schema.
+    sample = pd.read_csv(csv_file, nrows=sample_rows)
+    column_types = {col:arrow_type(sample[col].dtype)
+                    for col in sample.columns}
+
+    while True:
+        try:
+            write_store(csv_file, out_path, column_types)
+            return out_path
+        except pa.ArrowInvalid as err:
+            #A column had text after the sample rows, store it as strings and
+            #start over.
+            found = re.search(r'CSV column #(\d+)', str(err))
+            if found is None:
+                raise
+            col = list(column_types)[int(found.group(1))]
+            if column_types[col] == pa.string():
+                raise
+            column_types[col] = pa.string()
+
+def convert_eicu_tables(table_names=None):
+    from time import time
+    if table_names is None:
+        table_names = [path.name for path in sorted(eicu_path.iterdir())
+                       if path.name.lower().endswith(('.csv','.csv.gz'))]
+    for table_name in table_names:
+        start = time()
+        convert_table(table_name)
+        print(table_key(table_name) + ' converted in ' +
+              str(round(time() - start)) + ' seconds.')
+
+
+#%% Loading tables.
+def clean_stay_ids(stay_ids):
+    #Stay ID columns from the cohort file can be floats with nans in them.
+    stay_ids = pd.Series(np.asarray(stay_ids)).dropna()
+    return stay_ids.astype('int64').drop_duplicates().values
+
+def filter_frame(data, filters, stay_ids):
+    keep = np.ones(len(data), dtype=bool)
+    for col, op, value in filters:
+        if op == 'in':
+            keep &= data[col].isin(value).values
+        elif op == 'not in':
+            keep &= ~data[col].isin(value).values
+        else:
+            keep &= filter_ops[op](data[col], value).fillna(False).values
+    if stay_ids is not None:
+        keep &= data['patientunitstayid'].isin(stay_ids).values
+    return data[keep]
+
+def arrow_filter(filters, stay_ids):
+    import pyarrow.dataset as ds
+    expr = None
+    for col, op, value in filters:
+        if op == 'in':
+            part = ds.field(col).isin(list(value))
+        elif op == 'not in':
+            part = ~ds.field(col).isin(list(value))
+        else:
+            part = filter_ops[op](ds.field(col), value)
+        expr = part if expr is None else expr & part
+    if stay_ids is not None:
+        #Filtering on the bucket lets whole partitions get skipped.
+        buckets = np.unique(stay_ids // stays_per_partition)
+        part = (ds.field('stay_bucket').isin(buckets) &
+                ds.field('patientunitstayid').isin(stay_ids))
+        expr = part if expr is None else expr & part
+    return expr
+
+def open_store(table_name, columns):
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(table_store_path(table_name), format='parquet',
+                         partitioning='hive')
+    names = [name for name in dataset.schema.names if name != 'stay_bucket']
+    if columns is not None:
+        missing = [col for col in columns if col not in names]
+        if len(missing) > 0:
+            raise ValueError('Columns not in ' + table_key(table_name) +
+                             ': ' + str(missing))
+        names = [name for name in names if name in columns]
+    return dataset, names
+
+def load_table(table_name, columns=None, stay_ids=None, filters=None,
+               chunksize=1000000):
+    """
+    Loads an eICU table as a DataFrame.
+
+    columns - columns to load, like usecols in pd.read_csv. Columns come back
+        in the same order as the table.
+    stay_ids - only load rows for these patientunitstayids.
+    filters - list of (column, op, value) tuples rows must all satisfy,
+        op is one of ==, !=, <, <=, >, >=, in, not in.
+    """
+    filters = list(filters) if filters is not None else []
+    if stay_ids is not None:
+        stay_ids = clean_stay_ids(stay_ids)
+
+    #Read from the parquet store when it's there.
+    if is_converted(table_name):
+        dataset, names = open_store(table_name, columns)
+        data = dataset.to_table(columns=names,
+                                filter=arrow_filter(filters,stay_ids))
+        return data.to_pandas()
+
+    #Otherwise fall back to the csv.
+    csv_file = find_csv(table_name)
+    if (len(filters) == 0) & (stay_ids is None):
+        return pd.read_csv(csv_file, usecols=columns)
+
+    #Pull filter columns along too, then drop them at the end.
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) + [f[0] for f in filters]
+        if stay_ids is not None:
+            usecols.append('patientunitstayid')
+        usecols = list(dict.fromkeys(usecols))
+
+    #Filter chunk by chunk, and only concat once at the end.
+    chunks = []
+    for chunk in pd.read_csv(csv_file, usecols=usecols, chunksize=chunksize):
+        chunks.append(filter_frame(chunk, filters, stay_ids))
+    data = pd.concat(chunks, ignore_index=True)
+    if columns is not None:
+        data = data[[col for col in data.columns if col in columns]]
+    return data
+
+def iter_table(table_name, columns=None, stay_ids=None, chunksize=1000000):
+    """
+    Yields an eICU table as DataFrames of about chunksize rows each, for 
+    tables too big to load all at once. Uses the parquet store if it's there.
+
+    stay_ids - only yield rows for these patientunitstayids.
+    """
+    if stay_ids is not None:
+        stay_ids = clean_stay_ids(stay_ids)
+    if is_converted(table_name):
+        dataset, names = open_store(table_name, columns)
+        for batch in dataset.to_batches(columns=names,
+                                        filter=arrow_filter([],stay_ids),
+                                        batch_size=chunksize):
+            if batch.num_rows > 0:
+                yield batch.to_pandas()
+        return
+
+    usecols = columns
+    if (columns is not None) & (stay_ids is not None):
+        usecols = list(dict.fromkeys(list(columns) + ['patientunitstayid']))
+    for chunk in pd.read_csv(find_csv(table_name), usecols=usecols,
+                             chunksize=chunksize):
+        if stay_ids is not None:
+            chunk = filter_frame(chunk, [], stay_ids)
+            if columns is not None:
+                chunk = chunk[[col for col in chunk.columns if col in columns]]
+        if len(chunk) > 0:
+            yield chunk
+
+
+if __name__ == '__main__':
+    convert_eicu_tables()